@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+Benchmark the submission and result paths against an in-process TES
+stand-in (see fake_tes.py) and a `file://` FileStore: `Tesseract.run()`
+latency, `FileStore` exists/upload/download as the store grows, and how long
+futures of many concurrent tasks take to resolve, with thread count and peak
+memory.
+
+    python benchmarks/bench_paths.py [--quick] [-o results.json]
+        [--compare baseline.json [--tolerance 0.25]]
+
+Results are written as JSON. With --compare the run exits with status 1 if a
+metric is worse than in the baseline by more than the tolerance; metrics
+ending in `_per_s` are better when higher, all others when lower.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_tes import FakeTESServer  # noqa: E402
+from tesseract import FileStore, Tesseract  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q / 100.0 * len(values)), len(values) - 1)]
+
+
+def summary(prefix, values):
+    return {
+        prefix + ".mean_s": sum(values) / len(values),
+        prefix + ".p50_s": percentile(values, 50),
+        prefix + ".p95_s": percentile(values, 95),
+    }
+
+
+def max_rss():
+    # peak resident memory of this process in bytes
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def bench_submit(tmpdir, calls):
+    with FakeTESServer() as server:
+        r = Tesseract(
+            FileStore("file://" + os.path.join(tmpdir, "submit")), server.url
+        )
+        # the first call reads the runner and builds the task template
+        start = time.time()
+        futures = [r.run(abs, -1)]
+        first = time.time() - start
+        times = []
+        for i in range(calls):
+            start = time.time()
+            futures.append(r.run(abs, i))
+            times.append(time.time() - start)
+        # leave no tasks for the monitor to poll once the server is gone
+        for f in futures:
+            f.result(timeout=300)
+    metrics = summary("submit.run", times)
+    metrics["submit.first_run_s"] = first
+    metrics["submit.runs_per_s"] = calls / sum(times)
+    return metrics
+
+
+def bench_filestore(tmpdir, sizes, reps):
+    fs = FileStore("file://" + os.path.join(tmpdir, "store"))
+    small = os.urandom(64 * 1024)
+    large = os.urandom(8 * 1024 * 1024)
+    metrics = {}
+    count = 0
+    for size in sizes:
+        # grow the store to size objects spread over run directories
+        while count < size:
+            fs.upload(
+                name="run%d/obj%d" % (count // 100, count), contents=b"x"
+            )
+            count += 1
+        prefix = "filestore.%d" % (size)
+
+        times = []
+        for i in range(reps):
+            start = time.time()
+            fs.exists("run0/obj0", type="file")
+            fs.exists("run0/missing%d" % (i), type="file")
+            times.append((time.time() - start) / 2)
+        metrics.update(summary(prefix + ".exists", times))
+
+        times = []
+        for i in range(reps):
+            start = time.time()
+            fs.upload(name="bench%d/small%d" % (size, i), contents=small)
+            times.append(time.time() - start)
+        metrics.update(summary(prefix + ".upload_64k", times))
+
+        name = "bench%d/large" % (size)
+        start = time.time()
+        fs.upload(name=name, contents=large)
+        metrics[prefix + ".upload_mb_per_s"] = \
+            len(large) / 1e6 / (time.time() - start)
+        start = time.time()
+        n = sum(len(chunk) for chunk in fs.download_stream(name))
+        metrics[prefix + ".download_mb_per_s"] = \
+            n / 1e6 / (time.time() - start)
+    return metrics
+
+
+def bench_resolve(tmpdir, tasks, duration):
+    threads = [threading.active_count()]
+    with FakeTESServer(duration=duration) as server:
+        r = Tesseract(
+            FileStore("file://" + os.path.join(tmpdir, "resolve")), server.url
+        )
+        start = time.time()
+        futures = r.submit_many([(abs, (i,)) for i in range(tasks)])
+        submitted = time.time() - start
+
+        done = {}
+
+        def finished(f):
+            done[f._Future__id] = time.time()
+            threads.append(threading.active_count())
+
+        for f in futures:
+            f.add_done_callback(finished)
+        for f in futures:
+            f.result(timeout=duration + 300)
+        total = time.time() - start
+        threads.append(threading.active_count())
+        # from the moment the server would report the task complete
+        latency = [t - server.ready_at(i) for i, t in done.items()]
+        requests = server.requests
+    metrics = summary("resolve.latency", latency)
+    metrics["resolve.submit_s"] = submitted
+    metrics["resolve.total_s"] = total
+    metrics["resolve.requests_per_task"] = float(requests) / tasks
+    metrics["resolve.threads_peak"] = max(threads)
+    return metrics
+
+
+def compare(metrics, baseline, tolerance):
+    regressions = []
+    for name, old in sorted(baseline.items()):
+        new = metrics.get(name)
+        if new is None or not old:
+            continue
+        change = (new - old) / float(old)
+        if name.endswith("_per_s"):
+            change = -change
+        if change > tolerance:
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[0, 1000, 10000])
+    parser.add_argument("--reps", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=1.0)
+    parser.add_argument("--quick", action="store_true",
+                        help="small sizes, for smoke testing")
+    parser.add_argument("-o", "--output")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    if args.quick:
+        args.calls, args.sizes, args.reps, args.tasks = 50, [0, 500], 10, 20
+
+    tmpdir = tempfile.mkdtemp(prefix="tesseract_bench_")
+    try:
+        metrics = {}
+        metrics.update(bench_submit(tmpdir, args.calls))
+        metrics.update(bench_filestore(tmpdir, args.sizes, args.reps))
+        metrics.update(bench_resolve(tmpdir, args.tasks, args.duration))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    metrics["process.max_rss_bytes"] = max_rss()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "params": {
+            "calls": args.calls, "sizes": args.sizes, "reps": args.reps,
+            "tasks": args.tasks, "duration": args.duration
+        },
+        "metrics": metrics
+    }
+    out = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(out + "\n")
+    else:
+        print(out)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)["metrics"]
+        regressions = compare(metrics, baseline, args.tolerance)
+        for name, old, new in regressions:
+            print("regression: %s %.6g -> %.6g" % (name, old, new),
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
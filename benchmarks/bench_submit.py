@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Time `import tesseract` and building task messages on the submission path.
+
+    python benchmarks/bench_submit.py [-n CALLS] [--imports RUNS]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMPORT_STMT = "import time; t = time.time(); import tesseract; " \
+    "print(time.time() - t)"
+
+
+def bench_import(runs):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    times = []
+    for _ in range(runs):
+        out = subprocess.check_output(
+            [sys.executable, "-c", IMPORT_STMT], env=env
+        )
+        times.append(float(out))
+    return min(times)
+
+
+def bench_task_msg(calls):
+    from tesseract import FileStore, Tesseract
+
+    r = Tesseract(
+        FileStore("file://" + tempfile.mkdtemp()), "http://localhost:8000"
+    )
+    blobs = ["%064x" % (i) for i in range(3)]
+
+    def build():
+        r._create_task_msg(
+            "file:///tmp/func.pickle", "file:///tmp/result.pickle",
+            blobs=blobs
+        )
+
+    # the first call reads the runner and builds the template
+    first = timeit.timeit(build, number=1)
+    return first, timeit.timeit(build, number=calls) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="calls", type=int, default=10000)
+    parser.add_argument("--imports", type=int, default=5)
+    args = parser.parse_args()
+
+    print("import tesseract (best of %d): %.1f ms" %
+          (args.imports, bench_import(args.imports) * 1e3))
+    first, per_call = bench_task_msg(args.calls)
+    print("first task message: %.1f us" % (first * 1e6))
+    print("task message (mean of %d): %.1f us" %
+          (args.calls, per_call * 1e6))
+
+
+if __name__ == "__main__":
+    main()
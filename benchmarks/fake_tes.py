@@ -0,0 +1,138 @@
+"""
+An in-process stand-in for a TES server.
+
+Tasks are accepted at once and complete `duration` seconds after they were
+created; their result is written to the `pickled result` output when it is
+first looked at, so only `file://` FileStores are supported. Nothing runs.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import threading
+import time
+
+from requests.utils import urlparse
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+from tesseract.serialization import dumps
+from tesseract.utils import makedirs
+
+
+class FakeTESHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body):
+        data = json.dumps(body).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.server.count()
+        length = int(self.headers.get("Content-Length", 0))
+        task = json.loads(self.rfile.read(length).decode("utf8"))
+        self.reply({"id": self.server.create(task)})
+
+    def do_GET(self):
+        self.server.count()
+        path = urlparse(self.path)
+        params = dict(
+            p.split("=", 1) for p in path.query.split("&") if "=" in p
+        )
+        if path.path == "/v1/tasks":
+            self.reply(self.server.list_page(
+                int(params.get("page_size", 256)),
+                params.get("page_token")
+            ))
+        else:
+            task_id = path.path.split("/")[-1]
+            self.reply({"id": task_id, "state": self.server.state(task_id)})
+
+
+class FakeTESServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, duration=0.0, result=None):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), FakeTESHandler)
+        self.duration = duration
+        self.result = dumps(result)
+        self.lock = threading.Lock()
+        # task id -> [output url, time it completes, result written]
+        self.tasks = {}
+        self.order = []
+        self.requests = 0
+        self.__thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % (self.server_address[1])
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+    def create(self, task):
+        url = None
+        for o in task.get("outputs", []):
+            if o.get("name") == "pickled result":
+                url = o["url"]
+        with self.lock:
+            task_id = "task%d" % (len(self.order))
+            self.tasks[task_id] = [url, time.time() + self.duration, False]
+            self.order.append(task_id)
+        return task_id
+
+    def ready_at(self, task_id):
+        with self.lock:
+            return self.tasks[task_id][1]
+
+    def state(self, task_id):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return "SYSTEM_ERROR"
+            if time.time() < task[1]:
+                return "RUNNING"
+            if not task[2]:
+                # written once, before the task is reported complete
+                if task[0] is not None:
+                    path = urlparse(task[0]).path
+                    makedirs(os.path.dirname(path))
+                    with open(path, "wb") as fh:
+                        fh.write(self.result)
+                task[2] = True
+        return "COMPLETE"
+
+    def list_page(self, page_size, page_token):
+        start = int(page_token or 0)
+        with self.lock:
+            ids = self.order[start:start + page_size]
+        page = {"tasks": [{"id": i, "state": self.state(i)} for i in ids]}
+        if start + page_size < len(self.order):
+            page["next_page_token"] = str(start + page_size)
+        return page
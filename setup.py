@@ -48,6 +48,12 @@ setup(
         "py-tes>=0.2.0",
         "requests>=2.18.1"
     ],
+    extras_require={
+        "async": ["aiohttp>=3.3.0"]
+    },
+    entry_points={
+        "console_scripts": ["tesseract=tesseract.cli:main"]
+    },
     zip_safe=True,
     classifiers=[
         "Development Status :: 3 - Alpha",
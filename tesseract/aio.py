@@ -0,0 +1,373 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import asyncio
+import functools
+import re
+import time
+import weakref
+
+from attr import attrs, attrib, Factory
+from attr.validators import instance_of, optional
+from builtins import str
+from concurrent.futures import ThreadPoolExecutor
+from tes.models import (Task, CreateTaskResponse, ListTasksResponse,
+                        strconv)
+from tes.utils import unmarshal
+
+from tesseract.client import RETRY_STATUS, RETRY_STATUS_IDEMPOTENT
+from tesseract.filestore import FileStore
+from tesseract.future import describe_failure, fetch_result
+from tesseract.monitor import TERMINAL_STATES, is_not_found
+from tesseract.throttle import retry_delay
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+# libcloud has no asyncio API, so blocking FileStore calls run on one
+# bounded pool instead of a thread per task
+_io_pool = ThreadPoolExecutor(16)
+
+
+def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(
+        _io_pool, functools.partial(func, *args, **kwargs)
+    )
+
+
+@attrs
+class AsyncHTTPClient(object):
+    url = attrib(convert=lambda v: re.sub("[/]+$", "", v))
+    timeout = attrib(default=10, validator=instance_of(int))
+    max_connections = attrib(default=100, validator=instance_of(int))
+    # see SessionClient
+    max_retries = attrib(default=5, validator=instance_of(int))
+    backoff = attrib(default=0.5, validator=instance_of((int, float)))
+    max_backoff = attrib(default=30.0, validator=instance_of((int, float)))
+    __session = attrib(init=False, default=None, cmp=False)
+
+    def __get_session(self):
+        if aiohttp is None:
+            raise ImportError(
+                "the asyncio API requires aiohttp: pip install aiohttp"
+            )
+        if self.__session is None or self.__session.closed:
+            self.__session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self.__session
+
+    async def __request(self, method, path, **kwargs):
+        session = self.__get_session()
+        url = "%s%s" % (self.url, path)
+        retry = RETRY_STATUS if method == "POST" else RETRY_STATUS_IDEMPOTENT
+        attempt = 0
+        while True:
+            async with session.request(method, url, **kwargs) as response:
+                if response.status not in retry or \
+                   attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return await response.json()
+                delay = retry_delay(
+                    response.headers.get("Retry-After"), attempt,
+                    self.backoff, self.max_backoff
+                )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def create_task(self, task):
+        if not isinstance(task, Task):
+            raise TypeError("Expected Task instance")
+        r = await self.__request(
+            "POST", "/v1/tasks", data=task.as_json(),
+            headers={"Content-Type": "application/json"}
+        )
+        return unmarshal(r, CreateTaskResponse).id
+
+    async def get_task(self, task_id, view="BASIC"):
+        r = await self.__request(
+            "GET", "/v1/tasks/%s" % (task_id), params={"view": view}
+        )
+        return unmarshal(r, Task)
+
+    async def cancel_task(self, task_id):
+        await self.__request("POST", "/v1/tasks/%s:cancel" % (task_id))
+        return
+
+    async def list_tasks(self, view="MINIMAL", page_size=None,
+                         page_token=None):
+        params = {"view": view}
+        if page_size is not None:
+            params["page_size"] = page_size
+        if page_token is not None:
+            params["page_token"] = page_token
+        r = await self.__request("GET", "/v1/tasks", params=params)
+        return unmarshal(r, ListTasksResponse)
+
+    async def close(self):
+        if self.__session is not None:
+            await self.__session.close()
+
+
+@attrs
+class AsyncTaskMonitor(object):
+    client = attrib(validator=instance_of(AsyncHTTPClient))
+    min_interval = attrib(default=0.1, validator=instance_of((int, float)))
+    max_interval = attrib(default=5.0, validator=instance_of((int, float)))
+    batch_threshold = attrib(default=10, validator=instance_of(int))
+    page_size = attrib(default=1000, validator=instance_of(int))
+    max_pages = attrib(default=10, validator=instance_of(int))
+    max_not_found = attrib(default=3, validator=instance_of(int))
+    __pending = attrib(init=False, default=Factory(dict), cmp=False)
+    __not_found = attrib(init=False, default=Factory(dict), cmp=False)
+    __task = attrib(init=False, default=None, cmp=False)
+
+    def watch(self, task_id):
+        loop = asyncio.get_event_loop()
+        if task_id not in self.__pending:
+            self.__pending[task_id] = loop.create_future()
+        if self.__task is None or self.__task.done():
+            self.__task = loop.create_task(self.__run())
+        return self.__pending[task_id]
+
+    def pending(self):
+        return len(self.__pending)
+
+    async def __run(self):
+        interval = self.min_interval
+        while self.__pending:
+            try:
+                finished = await self.__check(list(self.__pending))
+            except Exception:
+                finished = {}
+
+            for task_id, state in finished.items():
+                f = self.__pending.pop(task_id)
+                if not f.done():
+                    f.set_result(state)
+            if not self.__pending:
+                break
+
+            if finished:
+                interval = self.min_interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+            await asyncio.sleep(interval)
+
+    async def __check(self, task_ids):
+        states = {}
+        remaining = set(task_ids)
+
+        # see TaskMonitor.max_pages
+        if len(remaining) > self.batch_threshold:
+            page_token = None
+            for _ in range(self.max_pages):
+                r = await self.client.list_tasks(
+                    view="MINIMAL",
+                    page_size=self.page_size,
+                    page_token=page_token
+                )
+                for t in r.tasks or []:
+                    if t.id in remaining:
+                        states[t.id] = t.state
+                        remaining.discard(t.id)
+                page_token = r.next_page_token
+                if not remaining or not page_token:
+                    break
+
+        remaining = list(remaining)
+        tasks = await asyncio.gather(
+            *[self.client.get_task(i, "MINIMAL") for i in remaining],
+            return_exceptions=True
+        )
+        for task_id, t in zip(remaining, tasks):
+            if not isinstance(t, Exception):
+                states[task_id] = t.state
+                self.__not_found.pop(task_id, None)
+            elif is_not_found(t):
+                # see TaskMonitor.max_not_found
+                n = self.__not_found.get(task_id, 0) + 1
+                self.__not_found[task_id] = n
+                if n >= self.max_not_found:
+                    states[task_id] = "SYSTEM_ERROR"
+                    self.__not_found.pop(task_id)
+
+        return dict(
+            (task_id, state) for task_id, state in states.items()
+            if state in TERMINAL_STATES
+        )
+
+
+# clients, monitors and semaphores are bound to the event loop they were
+# created on
+_clients = weakref.WeakKeyDictionary()
+_monitors = weakref.WeakKeyDictionary()
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_client(url, timeout=10):
+    loop = asyncio.get_event_loop()
+    clients = _clients.setdefault(loop, {})
+    if url not in clients:
+        clients[url] = AsyncHTTPClient(url, timeout)
+    return clients[url]
+
+
+def get_monitor(client):
+    loop = asyncio.get_event_loop()
+    monitors = _monitors.setdefault(loop, {})
+    if client.url not in monitors:
+        monitors[client.url] = AsyncTaskMonitor(client)
+    return monitors[client.url]
+
+
+def get_semaphore(limiter):
+    # run_async cannot block on the InFlightLimiter of a Tesseract, so the
+    # calls on one loop share a semaphore of the same size; the limiter is
+    # kept so that its id is not reused
+    loop = asyncio.get_event_loop()
+    semaphores = _semaphores.setdefault(loop, {})
+    if id(limiter) not in semaphores:
+        semaphores[id(limiter)] = (
+            limiter, asyncio.Semaphore(limiter.max_in_flight)
+        )
+    return semaphores[id(limiter)][1]
+
+
+@attrs
+class AsyncFuture(object):
+    __id = attrib(convert=strconv, validator=instance_of(str))
+    __output_key = attrib(convert=strconv, validator=instance_of(str))
+    __file_store = attrib(validator=instance_of(FileStore))
+    __client = attrib(validator=instance_of(AsyncHTTPClient))
+    __monitor = attrib(
+        default=None, cmp=False,
+        validator=optional(instance_of(AsyncTaskMonitor))
+    )
+    __state = attrib(init=False, default=None, cmp=False)
+    __result = attrib(init=False, default=None, cmp=False)
+
+    def __attrs_post_init__(self):
+        monitor = self.__monitor or get_monitor(self.__client)
+        self.__state = monitor.watch(self.__id)
+
+    def __await__(self):
+        return self.result().__await__()
+
+    async def __fetch(self):
+        state = await self.__state
+        if state != "COMPLETE":
+            try:
+                r = await self.__client.get_task(self.__id, "FULL")
+            except Exception:
+                # e.g. the server no longer knows the task
+                r = None
+            raise RuntimeError(describe_failure(self.__id, state, r))
+        return await run_blocking(
+            fetch_result, self.__file_store, self.__output_key
+        )
+
+    async def result(self):
+        if self.__result is None:
+            self.__result = asyncio.ensure_future(self.__fetch())
+        # several awaiters may share the fetch; cancelling one must not
+        # cancel it for the others
+        return await asyncio.shield(self.__result)
+
+    def add_done_callback(self, fn):
+        self.__state.add_done_callback(lambda _: fn(self))
+
+    def running(self):
+        return not self.__state.done()
+
+    def done(self):
+        return self.__state.done()
+
+    async def cancel(self):
+        await self.__client.cancel_task(self.__id)
+        return True
+
+    def cancelled(self):
+        return self.__state.done() and self.__state.result() == "CANCELED"
+
+
+@attrs
+class AsyncCachedFuture(object):
+    __output_key = attrib(convert=strconv, validator=instance_of(str))
+    __file_store = attrib(validator=instance_of(FileStore))
+    __result = attrib(init=False, default=None, cmp=False)
+
+    def __await__(self):
+        return self.result().__await__()
+
+    async def result(self):
+        if self.__result is None:
+            self.__result = run_blocking(
+                fetch_result, self.__file_store, self.__output_key
+            )
+        return await asyncio.shield(self.__result)
+
+    def running(self):
+        return False
+
+    def done(self):
+        return True
+
+    async def cancel(self):
+        return False
+
+    def cancelled(self):
+        return False
+
+
+async def run_async(tesseract, func, *args, **kwargs):
+    file_store = tesseract.file_store
+    # finding a fresh run id may ask the store whether one is taken
+    run_id = await run_blocking(tesseract._run_id)
+    cp_str, input_name, output_name, blobs = tesseract._serialize_call(
+        func, args, kwargs, run_id
+    )
+    await asyncio.gather(*[
+        run_blocking(file_store.put_blob, contents, d)
+        for d, contents in blobs.items()
+    ])
+
+    if await file_store.exists_async(input_name, type="file"):
+        input_cp_url = file_store.generate_url(input_name)
+        print("Found cached input: %s" % (input_cp_url))
+    else:
+        input_cp_url = await file_store.upload_async(
+            name=input_name, contents=cp_str
+        )
+
+    output_cp_url = file_store.generate_url(output_name)
+    if await file_store.exists_async(output_name, type="file"):
+        print("Found cached output: %s" % (output_cp_url))
+        # recorded for attach()
+        await run_blocking(tesseract._record, None, output_name)
+        return AsyncCachedFuture(output_name, file_store)
+
+    client = get_client(tesseract.tes_url, tesseract.timeout)
+    task_msg = tesseract._create_task_msg(
+        input_cp_url, output_cp_url, blobs=list(blobs)
+    )
+    # at most max_in_flight tasks created here are unfinished at a time
+    limiter = tesseract._limiter()
+    semaphore = None if limiter is None else get_semaphore(limiter)
+    if semaphore is not None:
+        await semaphore.acquire()
+    try:
+        id = await client.create_task(task_msg)
+    except BaseException:
+        if semaphore is not None:
+            semaphore.release()
+        raise
+    future = AsyncFuture(id, output_name, file_store, client)
+    if semaphore is not None:
+        future.add_done_callback(lambda _: semaphore.release())
+    await run_blocking(tesseract._record, id, output_name, time.time())
+    return future
@@ -0,0 +1,177 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from attr import attrs, attrib, Factory
+from attr.validators import instance_of, optional
+from builtins import str
+from tes.models import strconv
+
+from tesseract import serialization
+from tesseract.future import is_error, load_result
+from tesseract.utils import makedirs
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "tesseract")
+
+
+@attrs
+class CallCache(object):
+    # Remembers the results of cached calls in a SQLite index kept on local
+    # disk, one per FileStore. Results that were downloaded are also kept
+    # in a local LRU of at most max_bytes, so repeating a cached call needs
+    # no request to the store or the TES server at all.
+    store_url = attrib(convert=strconv, validator=instance_of(str))
+    cache_dir = attrib(
+        default=None, convert=strconv, validator=optional(instance_of(str))
+    )
+    max_bytes = attrib(default=1024 ** 3, validator=instance_of(int))
+    path = attrib(init=False, default=None)
+    __db = attrib(init=False, default=None, cmp=False)
+    __lock = attrib(init=False, default=Factory(threading.Lock), cmp=False)
+    __counts = attrib(init=False, default=Factory(dict), cmp=False)
+
+    def __attrs_post_init__(self):
+        if self.cache_dir is None:
+            self.cache_dir = default_cache_dir()
+        store = hashlib.sha256(self.store_url.encode("utf8")).hexdigest()
+        self.path = os.path.join(self.cache_dir, store[:16])
+        makedirs(os.path.join(self.path, "results"), exists_ok=True)
+
+        self.__db = sqlite3.connect(
+            os.path.join(self.path, "index.sqlite"),
+            check_same_thread=False, isolation_level=None
+        )
+        self.__db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, size INTEGER, created REAL, "
+            "accessed REAL, local INTEGER)"
+        )
+        self.__counts = {"hits": 0, "store_hits": 0, "misses": 0}
+
+    def __local_path(self, key):
+        d = hashlib.sha256(key.encode("utf8")).hexdigest()
+        return os.path.join(self.path, "results", d)
+
+    def count(self, name):
+        with self.__lock:
+            self.__counts[name] += 1
+
+    def get(self, key):
+        # the local path of a cached result, or None
+        path = self.__local_path(key)
+        with self.__lock:
+            row = self.__db.execute(
+                "SELECT local FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or not row[0] or not os.path.exists(path):
+                return None
+            self.__db.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?",
+                (time.time(), key)
+            )
+        return path
+
+    def load(self, file_store, key):
+        path = self.get(key)
+        if path is not None:
+            with open(path, "rb") as fh:
+                return serialization.load(fh)
+        if self.max_bytes <= 0:
+            result = load_result(file_store, key)
+            if not is_error(result):
+                self.record(key, None)
+            return result
+
+        path = self.__local_path(key)
+        tmp = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        try:
+            size = 0
+            with open(tmp, "wb") as fh:
+                for chunk in file_store.download_stream(key):
+                    fh.write(chunk)
+                    size += len(chunk)
+            with open(tmp, "rb") as fh:
+                result = serialization.load(fh)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+        if is_error(result):
+            # failed calls are not kept
+            os.remove(tmp)
+        elif size > self.max_bytes:
+            os.remove(tmp)
+            self.record(key, size)
+        else:
+            os.rename(tmp, path)
+            self.record(key, size, local=True)
+        return result
+
+    def record(self, key, size, local=False):
+        now = time.time()
+        with self.__lock:
+            self.__db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, "
+                "COALESCE((SELECT created FROM results WHERE key = ?), ?), "
+                "?, ?)",
+                (key, size, key, now, now, int(local))
+            )
+            if local:
+                self.__evict()
+
+    def __evict(self):
+        total = self.__db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results WHERE local = 1"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.__db.execute(
+            "SELECT key, size FROM results WHERE local = 1 "
+            "ORDER BY accessed"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.__local_path(key))
+            except OSError:
+                pass
+            self.__db.execute(
+                "UPDATE results SET local = 0 WHERE key = ?", (key,)
+            )
+            total -= size
+
+    def forget(self, keys):
+        with self.__lock:
+            for key in keys:
+                try:
+                    os.remove(self.__local_path(key))
+                except OSError:
+                    pass
+                self.__db.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def stats(self):
+        with self.__lock:
+            entries, local, size = self.__db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(local), 0), "
+                "COALESCE(SUM(CASE WHEN local = 1 THEN size END), 0) "
+                "FROM results"
+            ).fetchone()
+            stats = dict(self.__counts)
+        stats.update({
+            "entries": entries,
+            "local_entries": local,
+            "local_bytes": size,
+            "max_bytes": self.max_bytes,
+            "path": self.path
+        })
+        return stats
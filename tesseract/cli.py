@@ -0,0 +1,104 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import re
+import sys
+
+from tesseract.filestore import FileStore
+
+
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400,
+                   "w": 604800}
+_SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3,
+               "t": 1024 ** 4}
+
+
+def parse_duration(value):
+    # "90", "90s", "30m", "12h", "7d" or "2w" in seconds
+    m = re.match(r"^(\d+(?:\.\d+)?)([smhdw]?)$", value.strip().lower())
+    if m is None:
+        raise argparse.ArgumentTypeError("invalid duration: %s" % (value))
+    return float(m.group(1)) * _DURATION_UNITS[m.group(2)]
+
+
+def parse_size(value):
+    # "512", "100K", "10M", "1.5G" or "2T" in bytes; an optional trailing
+    # "B" or "iB" is allowed
+    m = re.match(
+        r"^(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?$", value.strip().lower()
+    )
+    if m is None:
+        raise argparse.ArgumentTypeError("invalid size: %s" % (value))
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2)])
+
+
+def gc(args):
+    if args.max_age is None and args.max_size is None and \
+       args.keep_last is None:
+        raise SystemExit(
+            "tesseract gc: one of --max-age, --max-size or --keep-last is "
+            "required"
+        )
+    summary = FileStore(args.store).gc(
+        max_age=args.max_age,
+        max_bytes=args.max_size,
+        keep_last=args.keep_last,
+        min_age=args.min_age,
+        dry_run=args.dry_run,
+        max_workers=args.workers
+    )
+    if args.verbose or args.dry_run:
+        for name in summary["deleted"]:
+            print(name)
+    print(
+        "%s %d files, %d bytes; %d bytes remain" % (
+            "would delete" if args.dry_run else "deleted",
+            len(summary["deleted"]),
+            summary["freed_bytes"],
+            summary["remaining_bytes"]
+        ),
+        file=sys.stderr
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="tesseract")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    p = commands.add_parser(
+        "gc",
+        help="delete old run directories, cached calls and blobs from a "
+             "file store"
+    )
+    p.add_argument("store", help="file store url, e.g. s3://bucket/prefix")
+    p.add_argument(
+        "--max-age", type=parse_duration,
+        help="delete anything not written for this long, e.g. 30d"
+    )
+    p.add_argument(
+        "--max-size", type=parse_size,
+        help="delete the least recently written files until the store is "
+             "below this size, e.g. 50G"
+    )
+    p.add_argument(
+        "--keep-last", type=int,
+        help="keep only the N most recent results of each cache name"
+    )
+    p.add_argument(
+        "--min-age", type=parse_duration, default=3600,
+        help="never delete anything younger than this (default: 1h)"
+    )
+    p.add_argument("--workers", type=int, default=8,
+                   help="concurrent delete requests")
+    p.add_argument("--dry-run", action="store_true",
+                   help="print what would be deleted")
+    p.add_argument("-v", "--verbose", action="store_true")
+    p.set_defaults(func=gc)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
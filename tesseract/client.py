@@ -0,0 +1,118 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import requests
+import tes
+import time
+
+from attr import attrs, attrib
+from attr.validators import instance_of
+from requests.utils import get_environ_proxies
+from tes.models import (Task, ServiceInfo, CreateTaskResponse,
+                        ListTasksResponse)
+from tes.utils import unmarshal, raise_for_status
+
+from tesseract.throttle import retry_delay
+
+
+# responses of an overloaded server that are worth retrying. A 500, or a
+# gateway error or timeout, in reply to a POST may come after the task was
+# created, so only requests that are safe to repeat retry on those.
+RETRY_STATUS = frozenset([429, 503])
+RETRY_STATUS_IDEMPOTENT = RETRY_STATUS | frozenset([500, 502, 504])
+
+
+@attrs
+class SessionClient(tes.HTTPClient):
+    # tes.HTTPClient opens a new connection for every request; this client
+    # keeps a pool of keep-alive connections that threads share
+    max_connections = attrib(default=32, validator=instance_of(int))
+    # retries of throttled and failed requests, with jittered exponential
+    # backoff between backoff and max_backoff seconds
+    max_retries = attrib(default=5, validator=instance_of(int))
+    backoff = attrib(default=0.5, validator=instance_of((int, float)))
+    max_backoff = attrib(default=30.0, validator=instance_of((int, float)))
+    __session = attrib(init=False, default=None, cmp=False)
+
+    def __getstate__(self):
+        # sessions hold sockets and locks; copies open their own
+        state = self.__dict__.copy()
+        state["_SessionClient__session"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    @property
+    def session(self):
+        if self.__session is None:
+            session = requests.Session()
+            # proxy and CA settings are read from the environment once
+            # instead of on every request
+            session.proxies.update(get_environ_proxies(self.url))
+            session.verify = os.environ.get("REQUESTS_CA_BUNDLE") or \
+                os.environ.get("CURL_CA_BUNDLE") or True
+            session.trust_env = False
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=self.max_connections
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.__session = session
+        return self.__session
+
+    def close(self):
+        if self.__session is not None:
+            self.__session.close()
+            self.__session = None
+
+    def __request(self, method, path, **kwargs):
+        retry = RETRY_STATUS if method == "POST" else RETRY_STATUS_IDEMPOTENT
+        attempt = 0
+        while True:
+            response = self.session.request(
+                method, "%s%s" % (self.url, path), timeout=self.timeout,
+                **kwargs
+            )
+            if response.status_code not in retry or \
+               attempt >= self.max_retries:
+                break
+            time.sleep(retry_delay(
+                response.headers.get("Retry-After"), attempt,
+                self.backoff, self.max_backoff
+            ))
+            attempt += 1
+        raise_for_status(response)
+        return response
+
+    def get_service_info(self):
+        r = self.__request("GET", "/v1/tasks/service-info")
+        return unmarshal(r.json(), ServiceInfo)
+
+    def create_task(self, task):
+        if not isinstance(task, Task):
+            raise TypeError("Expected Task instance")
+        r = self.__request(
+            "POST", "/v1/tasks", data=task.as_json(),
+            headers={"Content-Type": "application/json"}
+        )
+        return unmarshal(r.json(), CreateTaskResponse).id
+
+    def get_task(self, task_id, view="BASIC"):
+        r = self.__request(
+            "GET", "/v1/tasks/%s" % (task_id), params={"view": view}
+        )
+        return unmarshal(r.json(), Task)
+
+    def cancel_task(self, task_id):
+        self.__request("POST", "/v1/tasks/%s:cancel" % (task_id))
+        return
+
+    def list_tasks(self, view="MINIMAL", page_size=None, page_token=None):
+        params = {"view": view}
+        if page_size is not None:
+            params["page_size"] = page_size
+        if page_token is not None:
+            params["page_token"] = page_token
+        r = self.__request("GET", "/v1/tasks", params=params)
+        return unmarshal(r.json(), ListTasksResponse)
@@ -1,22 +1,26 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
-
+import calendar
 import os
 import re
 import shutil
 import six
-import tempfile
+import threading
+import time
 import uuid
 
-from attr import attrs, attrib
+from attr import attrs, attrib, Factory
 from attr.validators import instance_of, optional
 from builtins import str, bytes
+from concurrent.futures import ThreadPoolExecutor
+from libcloud.storage.base import Object
 from libcloud.storage.providers import get_driver
 from libcloud.storage.types import ObjectDoesNotExistError
 from io import open
 from tes.models import strconv
 from requests.utils import urlparse
 
+from tesseract import retention, serialization
 from tesseract.utils import (makedirs, process_url, lookup_provider,
                              lookup_credentials, lookup_region,
                              lookup_project)
@@ -63,6 +67,16 @@ class FileStore(object):
     path = attrib(
         init=False, default="", convert=strconv, validator=instance_of(str))
     supported = attrib(init=False, default=["file", "gs", "s3", "swift"])
+    # upper bound on the size of each chunk read or written when streaming
+    chunk_size = attrib(default=8 * 1024 * 1024, validator=instance_of(int))
+    # cache exists() lookups for this many seconds; disabled when None
+    exists_cache_ttl = attrib(
+        default=None, validator=optional(instance_of((int, float)))
+    )
+    __index = attrib(init=False, default=Factory(dict), cmp=False)
+    __index_lock = attrib(
+        init=False, default=Factory(threading.Lock), cmp=False
+    )
 
     @url.validator
     def __validate_url(self, attribute, value):
@@ -132,6 +146,17 @@ class FileStore(object):
         self.secret = None
         self.__create_store()
 
+    def __getstate__(self):
+        # the exists() index is process local and its lock cannot be copied
+        state = self.__dict__.copy()
+        state["_FileStore__index"] = {}
+        del state["_FileStore__index_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__index_lock = threading.Lock()
+
     def __create_store(self):
         if self.scheme == "file":
             makedirs(self.path, exists_ok=True)
@@ -156,47 +181,233 @@ class FileStore(object):
 
     def exists(self, name, type="file"):
         if type.lower() in ["file", "f"]:
-            return self._file_exists(name)
+            type = "file"
         elif type.lower() in ["directory", "dir", "d"]:
-            return self._directory_exists(name)
+            type = "directory"
         else:
             raise ValueError("type must be one of: ['file', 'directory']")
 
+        found = self.__lookup_index(type, name)
+        if found is None:
+            if type == "file":
+                found = self._file_exists(name)
+            else:
+                found = self._directory_exists(name)
+            self.__update_index(type, name, found)
+        return found
+
     def _file_exists(self, name):
-        found = False
         if self.scheme == "file":
-            for root, dnames, fnames in os.walk(self.path):
-                if root != self.path:
-                    fnames = [
-                        os.path.join(os.path.basename(root), f) for f in fnames
-                    ]
-                if name in fnames:
-                    found = True
-        else:
-            objs = self.driver.list_container_objects(
-                self.driver.get_container(self.bucket)
-            )
-            for o in objs:
-                if os.path.join(self.path, name) == o.name:
-                    found = True
+            return os.path.isfile(os.path.join(self.path, name))
 
-        return found
+        try:
+            self.driver.get_object(
+                self.bucket, u"%s" % (os.path.join(self.path, name))
+            )
+        except ObjectDoesNotExistError:
+            return False
+        return True
 
     def _directory_exists(self, name):
-        found = False
         if self.scheme == "file":
-            for root, dnames, fnames in os.walk(self.path):
-                if name in dnames:
-                    found = True
+            return os.path.isdir(os.path.join(self.path, name))
+
+        # object stores have no directories; stop at the first key under
+        # the prefix
+        prefix = u"%s/" % (os.path.join(self.path, name).rstrip("/"))
+        objs = self.driver.iterate_container_objects(
+            self.driver.get_container(self.bucket), ex_prefix=prefix
+        )
+        for o in objs:
+            if o.name.startswith(prefix):
+                return True
+        return False
+
+    def list(self, prefix=""):
+        # names of all files below the directory prefix, relative to the
+        # root of the store
+        return [name for name, _, _ in self.list_objects(prefix)]
+
+    def list_objects(self, prefix=""):
+        # (name, size, mtime) of all files below the directory prefix; mtime
+        # is None when the store does not report it
+        if self.scheme == "file":
+            root = os.path.join(self.path, prefix)
+            objects = []
+            for dirpath, dnames, fnames in os.walk(root):
+                for f in fnames:
+                    path = os.path.join(dirpath, f)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        # removed while listing
+                        continue
+                    objects.append((
+                        os.path.relpath(path, self.path),
+                        st.st_size,
+                        st.st_mtime
+                    ))
+            return sorted(objects)
+
+        key = os.path.join(self.path, prefix).rstrip("/")
+        objs = self.driver.iterate_container_objects(
+            self.driver.get_container(self.bucket),
+            ex_prefix=u"%s/" % (key) if key else None
+        )
+        return sorted(
+            (
+                re.sub("^%s/" % (re.escape(self.path)), "", o.name)
+                if self.path else o.name,
+                o.size,
+                _parse_time((o.extra or {}).get("last_modified"))
+            )
+            for o in objs
+        )
+
+    def delete(self, name):
+        # returns False if there was nothing to delete
+        if self.scheme == "file":
+            path = os.path.join(self.path, name)
+            try:
+                os.remove(path)
+            except OSError:
+                return False
+            # drop directories left empty, but never the store itself
+            parent = os.path.dirname(path)
+            while parent != self.path and parent.startswith(self.path):
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    break
+                parent = os.path.dirname(parent)
+            deleted = True
         else:
-            objs = self.driver.list_container_objects(
-                self.driver.get_container(self.bucket)
+            # deleting by key needs no lookup of the object first
+            obj = Object(
+                name=u"%s" % (os.path.join(self.path, name)), size=0,
+                hash=None, extra={}, meta_data={},
+                container=self.driver.get_container(self.bucket),
+                driver=self.driver
+            )
+            try:
+                deleted = self.driver.delete_object(obj)
+            except ObjectDoesNotExistError:
+                deleted = False
+        self.__index_delete(name)
+        return deleted
+
+    def delete_many(self, names, max_workers=8):
+        # libcloud has no portable batch delete; requests are made
+        # concurrently instead
+        names = list(names)
+        if len(names) <= 1 or max_workers <= 1:
+            return [self.delete(name) for name in names]
+        with ThreadPoolExecutor(max_workers) as pool:
+            return list(pool.map(self.delete, names))
+
+    def gc(self, max_age=None, max_bytes=None, keep_last=None, min_age=3600,
+           dry_run=False, max_workers=8):
+        # removes the files left behind by runs and cached calls; see
+        # tesseract.retention for what is considered and when. Ages are in
+        # seconds.
+        objects = self.list_objects()
+        names = retention.plan(
+            objects, time.time(), max_age=max_age, max_bytes=max_bytes,
+            keep_last=keep_last, min_age=min_age,
+            references=self.__blob_references(objects, max_workers)
+        )
+        sizes = dict((name, size or 0) for name, size, _ in objects)
+        if not dry_run:
+            self.delete_many(names, max_workers)
+        freed = sum(sizes[name] for name in names)
+        return {
+            "deleted": names,
+            "freed_bytes": freed,
+            "remaining_bytes": sum(sizes.values()) - freed
+        }
+
+    def __blob_references(self, objects, max_workers):
+        # the blobs each call manifest in the store stages; blobs in use
+        # must outlive the calls that use them
+        if not any(name.startswith("blobs/") for name, _, _ in objects):
+            return {}
+        manifests = [
+            name for name, _, _ in objects if retention.MANIFEST.search(name)
+        ]
+
+        def read(name):
+            try:
+                manifest = serialization.loads(
+                    b"".join(self.download_stream(name))
+                )
+                return [
+                    self.blob_name(d) for d in retention.blob_refs(manifest)
+                ]
+            except Exception:
+                # removed since it was listed, or not written by tesseract
+                return []
+
+        with ThreadPoolExecutor(max(max_workers, 1)) as pool:
+            return dict(zip(manifests, pool.map(read, manifests)))
+
+    def __lookup_index(self, type, name):
+        if self.exists_cache_ttl is None:
+            return None
+        with self.__index_lock:
+            entry = self.__index.get((type, name))
+            if entry is None:
+                return None
+            found, expires = entry
+            if time.time() >= expires:
+                del self.__index[(type, name)]
+                return None
+            return found
+
+    def __update_index(self, type, name, found):
+        if self.exists_cache_ttl is None:
+            return
+        with self.__index_lock:
+            self.__index[(type, name)] = (
+                found, time.time() + self.exists_cache_ttl
             )
-            for o in objs:
-                if os.path.join(self.path, name) in o.name:
-                    found = True
 
-        return found
+    def __index_upload(self, name):
+        if self.exists_cache_ttl is None:
+            return
+        self.__update_index("file", name, True)
+        parent = os.path.dirname(name)
+        while parent not in ["", "/"]:
+            self.__update_index("directory", parent, True)
+            parent = os.path.dirname(parent)
+
+    def __index_delete(self, name):
+        if self.exists_cache_ttl is None:
+            return
+        with self.__index_lock:
+            self.__index.pop(("file", name), None)
+            # the parent may now be empty
+            parent = os.path.dirname(name)
+            while parent not in ["", "/"]:
+                self.__index.pop(("directory", parent), None)
+                parent = os.path.dirname(parent)
+
+    def exists_async(self, name, type="file"):
+        from tesseract.aio import run_blocking
+        return run_blocking(self.exists, name, type)
+
+    def upload_async(self, path=None, name=None, contents=None,
+                     overwrite_existing=False):
+        from tesseract.aio import run_blocking
+        return run_blocking(
+            self.upload, path, name, contents, overwrite_existing
+        )
+
+    def download_async(self, name, destination_path,
+                       overwrite_existing=False):
+        from tesseract.aio import run_blocking
+        return run_blocking(
+            self.download, name, destination_path, overwrite_existing
+        )
 
     def upload(self, path=None, name=None, contents=None,
                overwrite_existing=False):
@@ -206,48 +417,73 @@ class FileStore(object):
             raise ValueError("Provide either local path or contents")
 
         if name is None:
-            if path is None:
-                name = os.path.basname(path)
+            if path is not None:
+                name = os.path.basename(path)
             else:
                 name = str("tmp_" + uuid.uuid4().hex)
 
-        if path is not None:
-            contents = open(path, "r").read()
+        if contents is not None:
+            return self.upload_stream(name, [contents], overwrite_existing)
 
-        if isinstance(contents, six.string_types):
-            contents = bytes(contents, "utf8")
+        if self.scheme == "file":
+            with open(path, "rb") as fh:
+                return self.upload_stream(name, fh, overwrite_existing)
 
+        # libcloud streams the local file itself; no copy is needed
+        self.__check_overwrite(name, overwrite_existing)
         url = os.path.join(self.path, name)
+        self.driver.upload_object(
+            file_path=path,
+            container=self.driver.get_container(self.bucket),
+            object_name=url
+        )
+        self.__index_upload(name)
+        return self.scheme + "://" + self.bucket + "/" + url
+
+    def upload_stream(self, name, data, overwrite_existing=False):
+        self.__check_overwrite(name, overwrite_existing)
+        url = os.path.join(self.path, name)
+        chunks = _iter_chunks(data, self.chunk_size)
 
         if self.scheme == "file":
-            if os.path.exists(url) and not overwrite_existing:
-                raise FileExistsError(self.generate_url(name))
             makedirs(os.path.dirname(url), exists_ok=True)
-            with open(url, "wb") as fh:
-                fh.write(contents)
-        else:
+            # write under a temporary name so that readers polling the
+            # store never see a partially written file
+            tmp = "%s.%s.tmp" % (url, uuid.uuid4().hex)
+            with open(tmp, "wb") as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+            os.rename(tmp, url)
+            self.__index_upload(name)
+            return url
+
+        self.driver.upload_object_via_stream(
+            iterator=chunks,
+            container=self.driver.get_container(self.bucket),
+            object_name=url
+        )
+        self.__index_upload(name)
+        return self.scheme + "://" + self.bucket + "/" + url
+
+    def __check_overwrite(self, name, overwrite_existing):
+        if not overwrite_existing and self._file_exists(name):
+            raise FileExistsError(self.generate_url(name))
+
+    def blob_name(self, digest):
+        return os.path.join("blobs", "sha256", digest)
+
+    def put_blob(self, contents, digest=None):
+        # blobs are keyed by the sha256 of their contents, so an existing
+        # blob never needs to be uploaded again
+        if digest is None:
+            digest = serialization.digest(contents)
+        name = self.blob_name(digest)
+        if not self.exists(name, type="file"):
             try:
-                key = u"%s" % (os.path.join(self.path, name))
-                self.driver.get_object(
-                    self.bucket, key
-                )
-                if not overwrite_existing:
-                    raise FileExistsError(self.generate_url(name))
-            except ObjectDoesNotExistError:
+                self.upload_stream(name, contents)
+            except FileExistsError:
                 pass
-
-            tmpf = tempfile.NamedTemporaryFile(mode="wb", delete=False)
-            tmpf.write(contents)
-            tmpf.close()
-            self.driver.upload_object(
-                file_path=tmpf.name,
-                container=self.driver.get_container(self.bucket),
-                object_name=url
-            )
-            os.remove(tmpf.name)
-            return self.scheme + "://" + self.bucket + "/" + url
-
-        return url
+        return digest
 
     def download(self, name, destination_path, overwrite_existing=False):
         if os.path.exists(destination_path) and not overwrite_existing:
@@ -267,6 +503,180 @@ class FileStore(object):
             )
         return destination_path
 
+    def upload_many(self, items, overwrite_existing=False,
+                    skip_existing=False, max_workers=8):
+        with TransferManager(self, max_workers) as tm:
+            return tm.upload_many(items, overwrite_existing, skip_existing)
+
+    def download_many(self, items, overwrite_existing=False, max_workers=8):
+        with TransferManager(self, max_workers) as tm:
+            return tm.download_many(items, overwrite_existing)
+
+    def download_stream(self, name, chunk_size=None):
+        chunk_size = chunk_size or self.chunk_size
+        if self.scheme == "file":
+            return _read_file(os.path.join(self.path, name), chunk_size)
+
+        key = u"%s" % (os.path.join(self.path, name))
+        obj = self.driver.get_object(
+            self.bucket, key
+        )
+        return self.driver.download_object_as_stream(obj, chunk_size)
+
+
+def _parse_time(value):
+    # seconds since the epoch from the timestamp formats used by the
+    # libcloud drivers, or None
+    if not value:
+        return None
+    for fmt in ["%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%SZ",
+                "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S",
+                "%a, %d %b %Y %H:%M:%S GMT"]:
+        try:
+            return calendar.timegm(time.strptime(value, fmt))
+        except ValueError:
+            pass
+    return None
+
+
+def _iter_chunks(data, chunk_size):
+    if hasattr(data, "read"):
+        return _iter_file(data, chunk_size)
+    if isinstance(data, (six.string_types, bytes, memoryview)):
+        data = [data]
+    return (
+        bytes(chunk, "utf8") if isinstance(chunk, six.string_types)
+        else chunk
+        for chunk in data
+    )
+
+
+def _iter_file(fh, chunk_size):
+    while True:
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, six.string_types):
+            chunk = bytes(chunk, "utf8")
+        yield chunk
+
+
+def _read_file(path, chunk_size):
+    with open(path, "rb") as fh:
+        for chunk in _iter_file(fh, chunk_size):
+            yield chunk
+
+
+@attrs
+class TransferManager(object):
+    file_store = attrib(validator=instance_of(FileStore))
+    max_workers = attrib(default=8, validator=instance_of(int))
+    # objects larger than this are downloaded as several ranged parts
+    part_size = attrib(default=64 * 1024 * 1024, validator=instance_of(int))
+    __pool = attrib(init=False, default=None, cmp=False)
+
+    def __attrs_post_init__(self):
+        self.__pool = ThreadPoolExecutor(self.max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def shutdown(self, wait=True):
+        self.__pool.shutdown(wait=wait)
+
+    def upload_many(self, items, overwrite_existing=False,
+                    skip_existing=False):
+        # items is a list of (local path, name) pairs
+        def upload(path, name):
+            if skip_existing and self.file_store.exists(name, type="file"):
+                return self.file_store.generate_url(name)
+            return self.file_store.upload(
+                path=path, name=name, overwrite_existing=overwrite_existing
+            )
+
+        futures = [self.__pool.submit(upload, p, n) for p, n in items]
+        return [f.result() for f in futures]
+
+    def download(self, name, destination_path, overwrite_existing=False):
+        return self.download_many(
+            [(name, destination_path)], overwrite_existing
+        )[0]
+
+    def download_many(self, items, overwrite_existing=False):
+        # items is a list of (name, destination path) pairs; every part of
+        # every object is queued on the pool up front so no worker ever
+        # waits on another
+        futures = []
+        for name, destination_path in items:
+            if os.path.exists(destination_path) and not overwrite_existing:
+                raise FileExistsError(destination_path)
+            parts = self.__plan(name)
+            with open(destination_path, "wb") as fh:
+                fh.truncate(parts[-1][1])
+            for start, end in parts:
+                futures.append(self.__pool.submit(
+                    self.__download_part, name, destination_path, start, end
+                ))
+        for f in futures:
+            f.result()
+        return [destination_path for name, destination_path in items]
+
+    def __size(self, name):
+        fs = self.file_store
+        if fs.scheme == "file":
+            return os.path.getsize(os.path.join(fs.path, name))
+        return fs.driver.get_object(
+            fs.bucket, u"%s" % (os.path.join(fs.path, name))
+        ).size
+
+    def __plan(self, name):
+        fs = self.file_store
+        size = self.__size(name)
+        ranged = fs.scheme == "file" or \
+            hasattr(fs.driver, "download_object_range_as_stream")
+        if not ranged or size <= self.part_size:
+            return [(0, size)]
+        return [
+            (start, min(start + self.part_size, size))
+            for start in range(0, size, self.part_size)
+        ]
+
+    def __read_part(self, name, start, end):
+        fs = self.file_store
+        if fs.scheme == "file":
+            with open(os.path.join(fs.path, name), "rb") as fh:
+                fh.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = fh.read(min(fs.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            return
+
+        obj = fs.driver.get_object(
+            fs.bucket, u"%s" % (os.path.join(fs.path, name))
+        )
+        if start == 0 and end == obj.size:
+            stream = fs.driver.download_object_as_stream(obj, fs.chunk_size)
+        else:
+            stream = fs.driver.download_object_range_as_stream(
+                obj, start_bytes=start, end_bytes=end,
+                chunk_size=fs.chunk_size
+            )
+        for chunk in stream:
+            yield chunk
+
+    def __download_part(self, name, destination_path, start, end):
+        with open(destination_path, "r+b") as fh:
+            fh.seek(start)
+            for chunk in self.__read_part(name, start, end):
+                fh.write(chunk)
+
 
 class FileExistsError(Exception):
     def __init__(self, file):
@@ -1,17 +1,48 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
-import cloudpickle
+import six
 import tempfile
 import tes
+import threading
+import time
+import warnings
 
-from attr import attrs, attrib
-from attr.validators import instance_of, optional
+from attr import attrs, attrib, Factory
+from attr.validators import instance_of
 from builtins import str
-from concurrent.futures import ThreadPoolExecutor
-from io import open
+from concurrent.futures import (Future as _ResultFuture, ThreadPoolExecutor,
+                                TimeoutError)
+from six.moves import queue
 from tes.models import strconv
 
+from tesseract import serialization
 from tesseract.filestore import FileStore
+from tesseract.monitor import get_monitor
+from tesseract.timings import load_timings, phases, timings_name
+
+
+SPOOL_MAX_SIZE = 64 * 1024 * 1024
+
+# creates the tasks of deferred calls once their arguments are ready, so
+# that the task monitor never waits on a request
+_submit_pool = None
+_submit_pool_lock = threading.Lock()
+
+# the runner writes {ERROR_KEY: {...}} in place of the result when the call
+# raises
+ERROR_KEY = "__tesseract_error__"
+
+
+class RemoteError(RuntimeError):
+    # a call that raised remotely. When the original exception can be
+    # unpickled it is raised instead, with a RemoteError as its cause.
+
+    def __init__(self, type, message, traceback):
+        super(RemoteError, self).__init__(
+            "%s: %s\n\nRemote traceback:\n%s" % (type, message, traceback)
+        )
+        self.type = type
+        self.remote_traceback = traceback
 
 
 @attrs
@@ -20,81 +51,364 @@ class Future(object):
     __output_key = attrib(convert=strconv, validator=instance_of(str))
     __file_store = attrib(validator=instance_of(FileStore))
     __client = attrib(validator=instance_of(tes.HTTPClient))
-    __execption = attrib(
-        init=False, default=None, validator=optional(instance_of(Exception))
-    )
-    __result = attrib(init=False, default=None)
+    # a CallCache that keeps the result once it has been downloaded
+    __cache = attrib(default=None, cmp=False)
+    # phases timed by the client before the task was created
+    __timings = attrib(default=Factory(dict), cmp=False)
+    __timings_hook = attrib(default=None, cmp=False)
+    __state = attrib(init=False, default=None, cmp=False)
+    __result = attrib(init=False, default=None, cmp=False)
+    __remote_timings = attrib(init=False, default=None, cmp=False)
+    __lock = attrib(init=False, default=Factory(threading.Lock), cmp=False)
 
     def __attrs_post_init__(self):
-        pool = ThreadPoolExecutor(1)
-        self.__result = pool.submit(self.__poll)
+        # the process-wide monitor resolves __state with the terminal task
+        # state; the result itself is fetched lazily by the caller
+        self.__state = get_monitor(self.__client).watch(self.__id)
+        self.__result = _ResultFuture()
+
+    def __fetch(self, timeout):
+        state = self.__state.result(timeout=timeout)
+        fetched = False
+        with self.__lock:
+            if not self.__result.done():
+                fetched = True
+                try:
+                    self.__result.set_result(self.__load(state))
+                except Exception as e:
+                    self.__result.set_exception(e)
+        if fetched:
+            _export_timings(self, self.__timings_hook)
+        return self.__result
 
-    def __poll(self):
-        r = self.__client.wait(self.__id)
-        if r.state != "COMPLETE":
-            r = self.__client.get_task(self.__id, "FULL")
-            raise RuntimeError("remote job failed:\n%s" % (r))
+    def __load(self, state):
+        if state != "COMPLETE":
+            # errors raised by the call itself come back with the result;
+            # this is a failure of the task
+            try:
+                r = self.__client.get_task(self.__id, "FULL")
+            except Exception:
+                # e.g. the server no longer knows the task
+                r = None
+            raise RuntimeError(describe_failure(self.__id, state, r))
+        start = time.time()
+        try:
+            return fetch_result(
+                self.__file_store, self.__output_key, self.__cache
+            )
+        finally:
+            self.__timings["download"] = time.time() - start
 
-        tmp = tempfile.NamedTemporaryFile(delete=False)
-        tmp.close()
-        self.__file_store.download(self.__output_key, tmp.name, True)
-        return cloudpickle.load(open(tmp.name, "rb"))
+    def timings(self):
+        # seconds spent in each phase of the call; see tesseract.timings.
+        # What the task measured is fetched once it has finished.
+        if self.__remote_timings is None and self.__state.done():
+            try:
+                task = self.__client.get_task(self.__id, "BASIC")
+            except Exception:
+                task = None
+            self.__remote_timings = (
+                task,
+                load_timings(
+                    self.__file_store, timings_name(self.__output_key)
+                )
+            )
+        task, runner = self.__remote_timings or (None, None)
+        return phases(self.__timings, task, runner)
 
     def result(self, timeout=None):
-        return self.__result.result(timeout=timeout)
+        return self.__fetch(timeout).result()
 
     def exeception(self, timeout=None):
-        return self.__result.exception(timeout=timeout)
+        return self.__fetch(timeout).exception()
+
+    def add_done_callback(self, fn):
+        self.__state.add_done_callback(lambda _: fn(self))
 
     def running(self):
-        r = self.__client.get_task(self.__id, "MINIMAL")
-        return r.state in["QUEUED", "INITIALIZING", "RUNNING"]
+        return not self.__state.done()
 
     def done(self):
-        r = self.__client.get_task(self.__id, "MINIMAL")
-        return r.state in ["COMPLETE", "EXECUTOR_ERROR", "SYSTEM_ERROR",
-                           "CANCELED"]
+        return self.__state.done()
 
     def cancel(self):
-        self.__result.cancel()
-        self.__client.cancel(self.__id)
+        self.__client.cancel_task(self.__id)
         return True
 
     def cancelled(self):
-        r = self.__client.get_task(self.__id, "MINIMAL")
-        return r.state == "CANCELED"
+        return self.__state.done() and self.__state.result() == "CANCELED"
+
+    def _upstream(self):
+        # where calls that take this future as an argument find its result
+        return self.__file_store, self.__output_key
+
+    def _final_state(self):
+        return self.__state.result()
 
 
 @attrs
 class CachedFuture(object):
     __output_key = attrib(convert=strconv, validator=instance_of(str))
     __file_store = attrib(validator=instance_of(FileStore))
-    __result = attrib(init=False, default=None)
+    __cache = attrib(default=None, cmp=False)
+    __timings = attrib(default=Factory(dict), cmp=False)
+    __timings_hook = attrib(default=None, cmp=False)
+    __result = attrib(init=False, default=None, cmp=False)
+    __lock = attrib(init=False, default=Factory(threading.Lock), cmp=False)
 
     def __attrs_post_init__(self):
-        pool = ThreadPoolExecutor(1)
-        self.__result = pool.submit(self.__download)
+        self.__result = _ResultFuture()
+
+    def __fetch(self):
+        fetched = False
+        with self.__lock:
+            if not self.__result.done():
+                fetched = True
+                try:
+                    self.__result.set_result(self.__download())
+                except Exception as e:
+                    self.__result.set_exception(e)
+        if fetched:
+            _export_timings(self, self.__timings_hook)
+        return self.__result
 
     def __download(self):
-        tmp = tempfile.NamedTemporaryFile(delete=False)
-        tmp.close()
-        self.__file_store.download(self.__output_key, tmp.name, True)
-        return cloudpickle.load(open(tmp.name, "rb"))
+        start = time.time()
+        try:
+            return fetch_result(
+                self.__file_store, self.__output_key, self.__cache
+            )
+        finally:
+            self.__timings["download"] = time.time() - start
+
+    def timings(self):
+        # nothing ran; only the client's phases are known
+        return phases(self.__timings)
+
+    def _upstream(self):
+        return self.__file_store, self.__output_key
+
+    def _final_state(self):
+        return "COMPLETE"
 
     def result(self, timeout=None):
-        return self.__result.result(timeout=timeout)
+        return self.__fetch().result()
 
     def exeception(self, timeout=None):
-        return self.__result.exception(timeout=timeout)
+        return self.__fetch().exception()
+
+    def add_done_callback(self, fn):
+        fn(self)
 
     def running(self):
-        return self.__result is None
+        return False
 
     def done(self):
-        return self.__result is not None
+        return True
 
     def cancel(self):
         return False
 
     def cancelled(self):
         return False
+
+
+@attrs
+class DeferredFuture(object):
+    # a call that takes other futures as arguments. Its task is created once
+    # they have finished, without blocking the caller; the result name is
+    # known up front so it can be passed on to further calls in turn.
+    __output_key = attrib(convert=strconv, validator=instance_of(str))
+    __file_store = attrib(validator=instance_of(FileStore))
+    __upstream = attrib(validator=instance_of(list))
+    # creates the task and returns its Future
+    __submit = attrib(cmp=False)
+    __submitted = attrib(init=False, default=None, cmp=False)
+    __lock = attrib(init=False, default=Factory(threading.Lock), cmp=False)
+    __waiting = attrib(init=False, default=0, cmp=False)
+
+    def __attrs_post_init__(self):
+        self.__submitted = _ResultFuture()
+        self.__waiting = len(self.__upstream)
+        for f in self.__upstream:
+            f.add_done_callback(self.__upstream_done)
+
+    def __upstream_done(self, _):
+        with self.__lock:
+            self.__waiting -= 1
+            if self.__waiting != 0:
+                return
+        _get_submit_pool().submit(self.__start)
+
+    def __start(self):
+        if not self.__submitted.set_running_or_notify_cancel():
+            return
+        try:
+            for f in self.__upstream:
+                state = f._final_state()
+                if state != "COMPLETE":
+                    raise RuntimeError(
+                        "an argument is the result of a call that did not "
+                        "complete: %s" % (state)
+                    )
+            self.__submitted.set_result(self.__submit())
+        except Exception as e:
+            self.__submitted.set_exception(e)
+
+    def result(self, timeout=None):
+        end_time = None if timeout is None else time.time() + timeout
+        f = self.__submitted.result(timeout=timeout)
+        wait = None if end_time is None else max(end_time - time.time(), 0)
+        return f.result(timeout=wait)
+
+    def exeception(self, timeout=None):
+        try:
+            self.result(timeout)
+        except TimeoutError:
+            raise
+        except Exception as e:
+            return e
+        return None
+
+    def add_done_callback(self, fn):
+        def submitted(s):
+            if s.cancelled() or s.exception() is not None:
+                fn(self)
+            else:
+                s.result().add_done_callback(lambda _: fn(self))
+        self.__submitted.add_done_callback(submitted)
+
+    def running(self):
+        return not self.done()
+
+    def done(self):
+        s = self.__submitted
+        if not s.done():
+            return False
+        if s.cancelled() or s.exception() is not None:
+            return True
+        return s.result().done()
+
+    def cancel(self):
+        if self.__submitted.cancel():
+            return True
+        if self.__submitted.exception() is not None:
+            return False
+        return self.__submitted.result().cancel()
+
+    def cancelled(self):
+        s = self.__submitted
+        if not s.done():
+            return False
+        if s.cancelled():
+            return True
+        return s.exception() is None and s.result().cancelled()
+
+    def timings(self):
+        s = self.__submitted
+        if s.done() and not s.cancelled() and s.exception() is None:
+            return s.result().timings()
+        return {}
+
+    def _upstream(self):
+        return self.__file_store, self.__output_key
+
+    def _final_state(self):
+        s = self.__submitted
+        if s.cancelled():
+            return "CANCELED"
+        if s.exception() is not None:
+            return "SYSTEM_ERROR"
+        return s.result()._final_state()
+
+
+def _get_submit_pool():
+    global _submit_pool
+    with _submit_pool_lock:
+        if _submit_pool is None:
+            _submit_pool = ThreadPoolExecutor(4)
+        return _submit_pool
+
+
+def load_result(file_store, output_key):
+    # small results never touch the disk; large ones spill to a temporary
+    # file that is removed once the result is loaded
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as fh:
+        for chunk in file_store.download_stream(output_key):
+            fh.write(chunk)
+        fh.seek(0)
+        return serialization.load(fh)
+
+
+def _export_timings(future, hook):
+    if hook is None:
+        return
+    try:
+        hook(future.timings())
+    except Exception as e:
+        # a broken exporter must not lose the result
+        warnings.warn("timings hook failed: %s" % (e))
+
+
+def is_error(value):
+    return isinstance(value, dict) and ERROR_KEY in value
+
+
+def raise_error(value):
+    e = value[ERROR_KEY]
+    remote = RemoteError(e["type"], e["message"], e["traceback"])
+    exception = None
+    if e.get("exception") is not None:
+        try:
+            exception = serialization.loads(e["exception"])
+        except Exception:
+            # e.g. the exception type is not importable here
+            pass
+    if not isinstance(exception, BaseException):
+        raise remote
+    six.raise_from(exception, remote)
+
+
+def fetch_result(file_store, output_key, cache=None):
+    if cache is not None:
+        value = cache.load(file_store, output_key)
+    else:
+        value = load_result(file_store, output_key)
+    if is_error(value):
+        if cache is not None:
+            # failures are not cached; the call runs again next time
+            file_store.delete(output_key)
+        raise_error(value)
+    return value
+
+
+def describe_failure(task_id, state, task):
+    # the task's own logs, without the task message and its inline runner
+    lines = ["remote job %s failed: %s" % (task_id, state)]
+    if task is None:
+        lines.append("the task could not be looked up")
+        return "\n".join(lines)
+    for log in task.logs or []:
+        lines.extend(log.system_logs or [])
+        for e in log.logs or []:
+            if e.exit_code:
+                lines.append("exit code: %s" % (e.exit_code))
+            if e.stderr:
+                lines.append(e.stderr.rstrip())
+    return "\n".join(lines)
+
+
+def as_completed(fs, timeout=None):
+    fs = list(fs)
+    finished = queue.Queue()
+    for f in fs:
+        f.add_done_callback(finished.put)
+
+    end_time = None if timeout is None else time.time() + timeout
+    for i in range(len(fs)):
+        wait = None if end_time is None else max(end_time - time.time(), 0)
+        try:
+            f = finished.get(timeout=wait)
+        except queue.Empty:
+            raise TimeoutError("%d futures unfinished" % (len(fs) - i))
+        yield f
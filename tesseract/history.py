@@ -0,0 +1,139 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from attr import attrs, attrib, Factory
+from attr.validators import instance_of, optional
+from builtins import str
+from tes.models import strconv
+
+from tesseract.cache import default_cache_dir
+from tesseract.utils import makedirs
+
+
+def function_key(func):
+    # the qualified name of the function and a hash of its code, so edits
+    # to a function start a new history
+    name = "%s.%s" % (
+        getattr(func, "__module__", None),
+        getattr(func, "__qualname__", getattr(func, "__name__", repr(func)))
+    )
+    code = getattr(func, "__code__", None)
+    if code is None:
+        return name
+    m = hashlib.sha256()
+    _hash_code(m, code)
+    return "%s:%s" % (name, m.hexdigest()[:16])
+
+
+def _hash_code(m, code):
+    # the repr of a nested code object (comprehensions, lambdas, inner
+    # functions) holds its memory address, so those are hashed recursively
+    m.update(code.co_code)
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            _hash_code(m, const)
+        else:
+            m.update(repr(const).encode("utf8"))
+        m.update(b"\0")
+
+
+def percentile(values, q):
+    # nearest-rank percentile
+    values = sorted(values)
+    k = int(math.ceil(q / 100.0 * len(values))) - 1
+    return values[min(max(k, 0), len(values) - 1)]
+
+
+def _round_up(value, step):
+    return math.ceil(value / step) * step
+
+
+@attrs
+class ResourceHistory(object):
+    # Peak memory, CPU time and scratch disk of past calls, kept in a SQLite
+    # database next to the call cache and keyed by function_key().
+    cache_dir = attrib(
+        default=None, convert=strconv, validator=optional(instance_of(str))
+    )
+    # samples kept per function
+    max_samples = attrib(default=100, validator=instance_of(int))
+    path = attrib(init=False, default=None)
+    __db = attrib(init=False, default=None, cmp=False)
+    __lock = attrib(init=False, default=Factory(threading.Lock), cmp=False)
+
+    def __attrs_post_init__(self):
+        if self.cache_dir is None:
+            self.cache_dir = default_cache_dir()
+        makedirs(self.cache_dir, exists_ok=True)
+        self.path = os.path.join(self.cache_dir, "history.sqlite")
+        self.__db = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self.__db.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "key TEXT, recorded REAL, max_rss INTEGER, cpu_time REAL, "
+            "wall REAL, scratch_bytes INTEGER)"
+        )
+        self.__db.execute(
+            "CREATE INDEX IF NOT EXISTS runs_key ON runs (key, recorded)"
+        )
+
+    def record(self, key, timings):
+        # timings as returned by Future.timings(); calls that did not run
+        # the function have nothing to record
+        if "call" not in timings:
+            return
+        # the runner's CPU time covers loading the call as well as running it
+        wall = sum(timings.get(k, 0) for k in ["load", "call"])
+        with self.__lock:
+            self.__db.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+                (key, time.time(), timings.get("max_rss"),
+                 timings.get("cpu_time"), wall,
+                 timings.get("scratch_bytes"))
+            )
+            self.__db.execute(
+                "DELETE FROM runs WHERE key = ? AND rowid NOT IN ("
+                "SELECT rowid FROM runs WHERE key = ? "
+                "ORDER BY recorded DESC LIMIT ?)",
+                (key, key, self.max_samples)
+            )
+
+    def samples(self, key):
+        with self.__lock:
+            return self.__db.execute(
+                "SELECT max_rss, cpu_time, wall, scratch_bytes FROM runs "
+                "WHERE key = ?", (key,)
+            ).fetchall()
+
+    def suggest(self, key, q=95, headroom=1.25, min_samples=3):
+        # (cpu_cores, ram_gb, disk_gb) covering the q-th percentile of past
+        # calls with some headroom, or None without enough history; parts
+        # that were never measured are None
+        rows = self.samples(key)
+        if len(rows) < min_samples:
+            return None
+
+        def high(i):
+            values = [r[i] for r in rows if r[i] is not None]
+            return percentile(values, q) if values else None
+
+        rss, scratch = high(0), high(3)
+        # average number of busy cores while the function ran
+        usage = [r[1] / r[2] for r in rows if r[1] is not None and r[2]]
+        cpu_cores = None
+        if usage:
+            cpu_cores = max(int(math.ceil(percentile(usage, q) - 0.05)), 1)
+        ram_gb = None
+        if rss is not None:
+            ram_gb = max(_round_up(rss * headroom / 1024 ** 3, 0.25), 0.25)
+        disk_gb = None
+        if scratch is not None:
+            disk_gb = max(_round_up(scratch * headroom / 1024 ** 3, 1), 1)
+        return cpu_cores, ram_gb, disk_gb
@@ -0,0 +1,83 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import subprocess
+import threading
+
+
+IMAGE_NAME = "tesseract-worker"
+
+_resolved = {}
+_resolved_lock = threading.Lock()
+
+
+def image_tag(base, libraries, registry=None):
+    # the tag is derived from the base image and the sorted library set so
+    # every Tesseract asking for the same environment shares one image
+    m = hashlib.sha256()
+    m.update(base.encode("utf8"))
+    for lib in sorted(set(libraries)):
+        m.update(b"\0")
+        m.update(lib.encode("utf8"))
+    tag = "%s:%s" % (IMAGE_NAME, m.hexdigest()[:16])
+    if registry is not None:
+        tag = "%s/%s" % (registry.rstrip("/"), tag)
+    return tag
+
+
+def dockerfile(base, libraries):
+    lines = ["FROM %s" % (base)]
+    if libraries:
+        lines.append(
+            "RUN pip install --no-cache-dir %s" % (" ".join(sorted(libraries)))
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _docker(docker, *args, **kwargs):
+    p = subprocess.Popen(
+        [docker] + list(args),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    stdout, stderr = p.communicate(kwargs.get("stdin"))
+    return p.returncode, stdout, stderr
+
+
+def image_exists(tag, registry=None, docker="docker"):
+    if registry is not None:
+        code, _, _ = _docker(docker, "manifest", "inspect", tag)
+    else:
+        code, _, _ = _docker(docker, "image", "inspect", tag)
+    return code == 0
+
+
+def resolve_image(base, libraries, registry=None, push=None, docker="docker"):
+    tag = image_tag(base, libraries, registry)
+    with _resolved_lock:
+        if tag in _resolved:
+            return tag
+
+        if not image_exists(tag, registry, docker):
+            content = dockerfile(base, libraries).encode("utf8")
+            code, _, stderr = _docker(
+                docker, "build", "-t", tag, "-", stdin=content
+            )
+            if code != 0:
+                raise RuntimeError(
+                    "failed to build image %s:\n%s" %
+                    (tag, stderr.decode("utf8", "replace"))
+                )
+            if push is None:
+                push = registry is not None
+            if push:
+                code, _, stderr = _docker(docker, "push", tag)
+                if code != 0:
+                    raise RuntimeError(
+                        "failed to push image %s:\n%s" %
+                        (tag, stderr.decode("utf8", "replace"))
+                    )
+
+        _resolved[tag] = True
+    return tag
@@ -0,0 +1,245 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import multiprocessing
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import tes
+import threading
+import traceback
+import uuid
+
+from concurrent.futures import Future as _StateFuture, ProcessPoolExecutor
+from requests.utils import urlparse
+from tes.models import ListTasksResponse
+
+from tesseract.filestore import FileStore
+from tesseract.utils import makedirs
+
+
+class LocalClient(tes.HTTPClient):
+    # Executes tasks in a process pool on this machine instead of sending
+    # them to a TES server. It subclasses tes.HTTPClient so it can stand in
+    # for one, but skips the attrs initializer that requires an http(s) url.
+
+    def __init__(self, url="local://", max_workers=None):
+        self.url = url
+        self.timeout = 0
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.__executor = None
+        self.__tasks = {}
+        self.__lock = threading.Lock()
+
+    def __get_executor(self):
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(self.max_workers)
+        return self.__executor
+
+    def __get(self, task_id):
+        with self.__lock:
+            if task_id not in self.__tasks:
+                raise ValueError("unknown task id: %s" % (task_id))
+            return self.__tasks[task_id]
+
+    def create_task(self, task):
+        if not isinstance(task, tes.Task):
+            raise TypeError("Expected Task instance")
+        task_id = uuid.uuid4().hex
+        with self.__lock:
+            self.__tasks[task_id] = self.__get_executor().submit(
+                _execute, task
+            )
+        return task_id
+
+    def get_task(self, task_id, view="BASIC"):
+        f = self.__get(task_id)
+        task = tes.Task(id=task_id, state=_state(f))
+        if view == "FULL" and f.done() and not f.cancelled():
+            e = f.exception()
+            if e is not None:
+                task.logs = [tes.TaskLog(system_logs=[str(e)])]
+            else:
+                task.logs = [tes.TaskLog(logs=[
+                    tes.ExecutorLog(
+                        exit_code=code, stdout=stdout, stderr=stderr
+                    )
+                    for code, stdout, stderr in f.result()
+                ])]
+        return task
+
+    def list_tasks(self, view="MINIMAL", page_size=None, page_token=None):
+        with self.__lock:
+            task_ids = list(self.__tasks)
+        return ListTasksResponse(
+            tasks=[self.get_task(i, view) for i in task_ids]
+        )
+
+    def cancel_task(self, task_id):
+        # only tasks that have not started can be cancelled
+        self.__get(task_id).cancel()
+        return
+
+    def watch(self, task_id):
+        # resolved as soon as the process finishes, without polling; this
+        # client acts as its own task monitor
+        f = self.__get(task_id)
+        state = _StateFuture()
+        f.add_done_callback(lambda f: state.set_result(_state(f)))
+        return state
+
+    def shutdown(self, wait=True):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait)
+            self.__executor = None
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url="local://"):
+    # one process pool per url is shared by every Tesseract using it
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = LocalClient(url)
+        return _clients[url]
+
+
+def _state(f):
+    if f.cancelled():
+        return "CANCELED"
+    if not f.done():
+        return "RUNNING" if f.running() else "QUEUED"
+    if f.exception() is not None:
+        return "SYSTEM_ERROR"
+    if any(code != 0 for code, _, _ in f.result()):
+        return "EXECUTOR_ERROR"
+    return "COMPLETE"
+
+
+# the rest runs in the pool's worker processes
+
+_stores = {}
+_runners = {}
+
+
+def _execute(task):
+    root = tempfile.mkdtemp(prefix="tesseract_local_")
+    try:
+        workdir = task.executors[0].workdir or "/"
+
+        def local_path(path):
+            # container paths are mapped into a scratch directory
+            rel = os.path.relpath(path, workdir)
+            if not rel.startswith(".."):
+                return os.path.normpath(os.path.join(root, rel))
+            return os.path.join(root, path.lstrip("/"))
+
+        for i in task.inputs or []:
+            if i.type == "DIRECTORY":
+                raise ValueError("local tasks only support FILE inputs")
+            dest = local_path(i.path)
+            makedirs(os.path.dirname(dest), exists_ok=True)
+            if i.content is not None:
+                with open(dest, "wb") as fh:
+                    fh.write(i.content.encode("utf8"))
+            else:
+                _get(i.url, dest)
+
+        logs = []
+        for e in task.executors:
+            cwd = local_path(e.workdir or "/")
+            makedirs(cwd, exists_ok=True)
+            logs.append(_run(e.command, cwd, e.env or {}))
+            if logs[-1][0] != 0:
+                return logs
+
+        for o in task.outputs or []:
+            if o.type == "DIRECTORY":
+                raise ValueError("local tasks only support FILE outputs")
+            _put(local_path(o.path), o.url)
+        return logs
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _store(u):
+    key = "%s://%s" % (u.scheme, u.netloc)
+    if key not in _stores:
+        _stores[key] = FileStore(key)
+    return _stores[key]
+
+
+def _get(url, dest):
+    u = urlparse(url)
+    # file:// stores hand out bare paths
+    if u.scheme in ["file", ""]:
+        shutil.copyfile(u.path, dest)
+    else:
+        _store(u).download(u.path.lstrip("/"), dest, overwrite_existing=True)
+
+
+def _put(src, url):
+    u = urlparse(url)
+    if u.scheme in ["file", ""]:
+        makedirs(os.path.dirname(u.path), exists_ok=True)
+        tmp = "%s.%s.tmp" % (u.path, uuid.uuid4().hex)
+        shutil.copyfile(src, tmp)
+        os.rename(tmp, u.path)
+    else:
+        _store(u).upload(
+            path=src, name=u.path.lstrip("/"), overwrite_existing=True
+        )
+
+
+def _run(command, cwd, env):
+    argv = command
+    if len(command) == 3 and command[:2] == ["sh", "-c"]:
+        argv = shlex.split(command[2])
+    if argv[:2] == ["python", "tesseract.py"]:
+        return _run_runner(os.path.join(cwd, "tesseract.py"), argv[2:], cwd,
+                           env)
+
+    full_env = dict(os.environ)
+    full_env.update(env)
+    p = subprocess.Popen(
+        command, cwd=cwd, env=full_env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    stdout, stderr = p.communicate()
+    return (
+        p.returncode,
+        stdout.decode("utf8", "replace"),
+        stderr.decode("utf8", "replace")
+    )
+
+
+def _run_runner(path, args, cwd, env):
+    # the staged runner is executed in this process rather than in a new
+    # interpreter; it is compiled once per worker and source version
+    with open(path, "rb") as fh:
+        source = fh.read()
+    key = hashlib.sha256(source).hexdigest()
+    if key not in _runners:
+        ns = {"__name__": "tesseract_runner", "__file__": path}
+        exec(compile(source, path, "exec"), ns)
+        _runners[key] = ns
+
+    saved_cwd = os.getcwd()
+    saved_env = dict(os.environ)
+    os.chdir(cwd)
+    os.environ.update(env)
+    try:
+        _runners[key]["main"](args)
+    except SystemExit as e:
+        return (e.code or 0, "", "")
+    except Exception:
+        return (1, "", traceback.format_exc())
+    finally:
+        os.chdir(saved_cwd)
+        os.environ.clear()
+        os.environ.update(saved_env)
+    return (0, "", "")
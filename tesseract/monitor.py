@@ -0,0 +1,145 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import tes
+import threading
+import time
+
+from attr import attrs, attrib, Factory
+from attr.validators import instance_of
+from concurrent.futures import Future as _StateFuture
+
+
+TERMINAL_STATES = ["COMPLETE", "EXECUTOR_ERROR", "SYSTEM_ERROR", "CANCELED"]
+
+
+def is_not_found(e):
+    # a 404 from either the requests or the aiohttp client
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return 404 in (status, getattr(e, "status", None))
+
+
+@attrs
+class TaskMonitor(object):
+    client = attrib(validator=instance_of(tes.HTTPClient))
+    min_interval = attrib(default=0.1, validator=instance_of((int, float)))
+    max_interval = attrib(default=5.0, validator=instance_of((int, float)))
+    # above this many pending tasks the states are fetched in pages via
+    # list_tasks instead of one get_task call per task
+    batch_threshold = attrib(default=10, validator=instance_of(int))
+    page_size = attrib(default=1000, validator=instance_of(int))
+    # a poll reads at most this many pages and looks up the tasks it did
+    # not find one by one, so a task deep in the server's history, or one
+    # it has purged, does not make every poll walk the whole listing
+    max_pages = attrib(default=10, validator=instance_of(int))
+    # tasks the server has not known for this many polls in a row, e.g. ones
+    # that were purged, finish as SYSTEM_ERROR
+    max_not_found = attrib(default=3, validator=instance_of(int))
+    __pending = attrib(init=False, default=Factory(dict), cmp=False)
+    __not_found = attrib(init=False, default=Factory(dict), cmp=False)
+    __lock = attrib(init=False, default=Factory(threading.Lock), cmp=False)
+    __thread = attrib(init=False, default=None, cmp=False)
+
+    def watch(self, task_id):
+        with self.__lock:
+            if task_id not in self.__pending:
+                self.__pending[task_id] = _StateFuture()
+            state = self.__pending[task_id]
+            if self.__thread is None:
+                self.__thread = threading.Thread(
+                    target=self.__run, name="tesseract-task-monitor"
+                )
+                self.__thread.daemon = True
+                self.__thread.start()
+        return state
+
+    def pending(self):
+        with self.__lock:
+            return len(self.__pending)
+
+    def __run(self):
+        interval = self.min_interval
+        while True:
+            with self.__lock:
+                if len(self.__pending) == 0:
+                    self.__thread = None
+                    return
+                task_ids = list(self.__pending)
+
+            try:
+                finished = self.__check(task_ids)
+            except Exception:
+                # treat a failed poll like an idle one and back off
+                finished = {}
+
+            with self.__lock:
+                for task_id, state in finished.items():
+                    self.__pending.pop(task_id).set_result(state)
+
+            # poll eagerly while tasks are completing, back off when idle
+            if finished:
+                interval = self.min_interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+            time.sleep(interval)
+
+    def __check(self, task_ids):
+        states = {}
+        remaining = set(task_ids)
+
+        if len(remaining) > self.batch_threshold:
+            page_token = None
+            for _ in range(self.max_pages):
+                r = self.client.list_tasks(
+                    view="MINIMAL",
+                    page_size=self.page_size,
+                    page_token=page_token
+                )
+                for t in r.tasks or []:
+                    if t.id in remaining:
+                        states[t.id] = t.state
+                        remaining.discard(t.id)
+                page_token = r.next_page_token
+                if not remaining or not page_token:
+                    break
+
+        # one task that cannot be looked up must not hold up the others
+        for task_id in remaining:
+            try:
+                states[task_id] = self.client.get_task(
+                    task_id, "MINIMAL"
+                ).state
+            except Exception as e:
+                states[task_id] = self.__lookup_failed(task_id, e)
+
+        return self.__finished(states)
+
+    def __lookup_failed(self, task_id, e):
+        if not is_not_found(e):
+            return None
+        n = self.__not_found.get(task_id, 0) + 1
+        self.__not_found[task_id] = n
+        return "SYSTEM_ERROR" if n >= self.max_not_found else None
+
+    def __finished(self, states):
+        for task_id, state in states.items():
+            if state is not None:
+                self.__not_found.pop(task_id, None)
+        return dict(
+            (task_id, state) for task_id, state in states.items()
+            if state in TERMINAL_STATES
+        )
+
+
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+
+def get_monitor(client):
+    # clients that track their own tasks, like the local backend, act as
+    # their own monitor
+    if hasattr(client, "watch"):
+        return client
+    with _monitors_lock:
+        if client.url not in _monitors:
+            _monitors[client.url] = TaskMonitor(client)
+        return _monitors[client.url]
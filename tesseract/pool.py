@@ -0,0 +1,277 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import tes
+import threading
+import time
+import uuid
+
+from attr import attrs, attrib, Factory
+from attr.validators import instance_of, optional
+from concurrent.futures import Future as _StateFuture, TimeoutError
+
+from tesseract.future import is_error, raise_error
+from tesseract.monitor import get_monitor
+from tesseract.serialization import dumps, encode_call, loads
+
+
+@attrs
+class PoolFuture(object):
+    # __state resolves with the pickled output of the call once the pool
+    # has collected it, or with the reason it never ran
+    __state = attrib(validator=instance_of(_StateFuture), cmp=False)
+    __result = attrib(init=False, default=None, cmp=False)
+    __lock = attrib(init=False, default=Factory(threading.Lock), cmp=False)
+
+    def __attrs_post_init__(self):
+        self.__result = _StateFuture()
+
+    def __fetch(self, timeout):
+        try:
+            data = self.__state.result(timeout=timeout)
+        except TimeoutError:
+            raise
+        except Exception as e:
+            data = e
+        with self.__lock:
+            if not self.__result.done():
+                try:
+                    self.__result.set_result(self.__load(data))
+                except Exception as e:
+                    self.__result.set_exception(e)
+        return self.__result
+
+    def __load(self, data):
+        if isinstance(data, Exception):
+            raise data
+        out = loads(data)
+        if is_error(out):
+            raise_error(out)
+        return out["result"]
+
+    def result(self, timeout=None):
+        return self.__fetch(timeout).result()
+
+    def exeception(self, timeout=None):
+        return self.__fetch(timeout).exception()
+
+    def add_done_callback(self, fn):
+        self.__state.add_done_callback(lambda _: fn(self))
+
+    def running(self):
+        return not self.__state.done()
+
+    def done(self):
+        return self.__state.done()
+
+    def cancel(self):
+        return False
+
+    def cancelled(self):
+        return False
+
+
+@attrs
+class WorkerPool(object):
+    tesseract = attrib()
+    client = attrib(validator=instance_of(tes.HTTPClient))
+    workers = attrib(default=4, validator=instance_of(int))
+    idle_timeout = attrib(default=300, validator=instance_of((int, float)))
+    env = attrib(default=None, validator=optional(instance_of(dict)))
+    min_interval = attrib(default=0.1, validator=instance_of((int, float)))
+    max_interval = attrib(default=2.0, validator=instance_of((int, float)))
+    id = attrib(init=False, default=None)
+    # the current task of each worker slot
+    task_ids = attrib(init=False, default=Factory(list))
+    __count = attrib(init=False, default=0, cmp=False)
+    # call id -> (worker slot, state)
+    __pending = attrib(init=False, default=Factory(dict), cmp=False)
+    # worker slot -> (task id, final state) for tasks that have finished
+    __finished = attrib(init=False, default=Factory(dict), cmp=False)
+    __shutdown = attrib(init=False, default=False, cmp=False)
+    # workers are started with the lock held and the monitor may report a
+    # finished task on the same thread
+    __lock = attrib(init=False, default=Factory(threading.RLock), cmp=False)
+    __thread = attrib(init=False, default=None, cmp=False)
+
+    def __attrs_post_init__(self):
+        if self.workers < 1:
+            raise ValueError("workers must be a positive integer")
+        self.id = "tesseract_pool_%s" % (uuid.uuid4().hex)
+        for i in range(self.workers):
+            self.task_ids.append(None)
+            self.__start_worker(i)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def __start_worker(self, slot):
+        # a restarted worker picks up the calls left in its slot's queue
+        task_msg = self.tesseract._create_worker_task_msg(
+            self.id, slot, self.idle_timeout, self.env
+        )
+        task_id = self.client.create_task(task_msg)
+        self.task_ids[slot] = task_id
+        self.__finished.pop(slot, None)
+        get_monitor(self.client).watch(task_id).add_done_callback(
+            lambda s: self.__worker_done(slot, task_id, s.result())
+        )
+
+    def __worker_done(self, slot, task_id, state):
+        with self.__lock:
+            if self.task_ids[slot] != task_id:
+                return
+            self.__finished[slot] = (task_id, state)
+
+    def __queue(self, slot):
+        return os.path.join(self.id, "worker_%d" % (slot), "pending")
+
+    def submit(self, func, *args, **kwargs):
+        t = self.tesseract
+        file_store = t.file_store
+        manifest, blobs = encode_call(
+            func, args, kwargs, t.blob_threshold, t.codec, t.pickle_protocol
+        )
+        for d, contents in blobs.items():
+            file_store.put_blob(contents, d)
+
+        with self.__lock:
+            if self.__shutdown:
+                raise RuntimeError("the pool has been shut down")
+            n = self.__count
+            self.__count += 1
+            # calls are dealt to the workers round-robin so that no claiming
+            # protocol is needed on stores without atomic renames
+            slot = n % self.workers
+            # workers run their calls in name order
+            call_id = "%010d_%s" % (n, uuid.uuid4().hex[:8])
+            state = _StateFuture()
+            self.__pending[call_id] = (slot, state)
+            # workers exit after idle_timeout and are started again when
+            # there is work for them
+            if slot in self.__finished:
+                self.__start_worker(slot)
+            self.__start()
+
+        file_store.upload(
+            name=os.path.join(self.__queue(slot), "%s.pickle" % (call_id)),
+            contents=dumps(manifest, t.codec, t.pickle_protocol)
+        )
+        return PoolFuture(state)
+
+    def map(self, func, iterable, timeout=None):
+        futures = [self.submit(func, item) for item in iterable]
+
+        def result_iterator():
+            for f in futures:
+                yield f.result(timeout=timeout)
+
+        return result_iterator()
+
+    def shutdown(self, wait=False):
+        with self.__lock:
+            self.__shutdown = True
+        self.tesseract.file_store.upload(
+            name=os.path.join(self.id, "shutdown"),
+            contents="",
+            overwrite_existing=True
+        )
+        if wait:
+            monitor = get_monitor(self.client)
+            for task_id in self.task_ids:
+                monitor.watch(task_id).result()
+
+    def __start(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(
+                target=self.__run, name="tesseract-pool-%s" % (self.id)
+            )
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def __run(self):
+        interval = self.min_interval
+        while True:
+            with self.__lock:
+                if len(self.__pending) == 0:
+                    self.__thread = None
+                    return
+                # taken before the results are listed, so that whatever
+                # these workers wrote before they exited is seen below
+                finished = dict(self.__finished)
+
+            try:
+                collected = self.__collect()
+            except Exception:
+                collected = 0
+            try:
+                self.__recover(finished)
+            except Exception:
+                pass
+
+            if collected:
+                interval = self.min_interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+            time.sleep(interval)
+
+    def __collect(self):
+        # results are downloaded and removed as they arrive, so the results
+        # directory only ever holds those not yet collected
+        file_store = self.tesseract.file_store
+        results = os.path.join(self.id, "results")
+        collected = 0
+        for name in file_store.list(results):
+            if not name.endswith(".pickle"):
+                continue
+            call_id = os.path.splitext(os.path.basename(name))[0]
+            with self.__lock:
+                pending = self.__pending.get(call_id)
+            if pending is not None:
+                data = b"".join(file_store.download_stream(name))
+                with self.__lock:
+                    self.__pending.pop(call_id, None)
+                pending[1].set_result(data)
+                collected += 1
+            file_store.delete(name)
+        return collected
+
+    def __recover(self, finished):
+        # calls still queued for workers that have finished: an idle or
+        # shut down worker never ran them, so it is started again unless
+        # the pool was shut down; a worker that failed may have died on one
+        # of them, so they fail too
+        file_store = self.tesseract.file_store
+        with self.__lock:
+            orphans = {}
+            for call_id, (slot, state) in self.__pending.items():
+                if slot in finished:
+                    orphans.setdefault(slot, []).append((call_id, state))
+        for slot, calls in orphans.items():
+            task_id, state = finished[slot]
+            with self.__lock:
+                if self.__finished.get(slot) != (task_id, state):
+                    # restarted meanwhile; the new worker runs them
+                    continue
+                if state == "COMPLETE" and not self.__shutdown:
+                    self.__start_worker(slot)
+                    continue
+                for call_id, _ in calls:
+                    self.__pending.pop(call_id, None)
+            if state == "COMPLETE":
+                error = RuntimeError(
+                    "the pool was shut down before the call ran"
+                )
+            else:
+                error = RuntimeError(
+                    "worker task %s of the pool ended with %s before the "
+                    "call finished" % (task_id, state)
+                )
+            for call_id, f in calls:
+                file_store.delete(
+                    os.path.join(self.__queue(slot), "%s.pickle" % (call_id))
+                )
+                f.set_exception(error)
@@ -2,19 +2,399 @@
 
 import argparse
 import cloudpickle
+import io
+import json
+import mmap
+import os
+import pickle
+import shutil
+import sys
+import time
+import traceback
 
 from io import open
 
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
 
-def run(pickled_runner):
-    f = cloudpickle.load(open(pickled_runner, "rb"))
-    res = f["func"](*f["args"], **f["kwargs"])
-    cloudpickle.dump(res, open("./result.pickle", "wb"))
+
+# must match tesseract.serialization
+MAGIC = b"\x00TSR"
+CODECS = ["none", "gzip", "lzma", "zstd", "lz4"]
+
+# must match tesseract.future
+ERROR_KEY = "__tesseract_error__"
+
+
+def codec_writer(codec, fh):
+    if codec == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=fh, mode="wb")
+    elif codec == "lzma":
+        import lzma
+        return lzma.LZMAFile(fh, "wb")
+    elif codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor().stream_writer(fh)
+    elif codec == "lz4":
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(fh, "wb")
+    raise ValueError("codec must be one of %s" % (CODECS))
+
+
+def codec_reader(codec, fh):
+    if codec == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=fh, mode="rb")
+    elif codec == "lzma":
+        import lzma
+        return lzma.LZMAFile(fh, "rb")
+    elif codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(fh)
+    elif codec == "lz4":
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(fh, "rb")
+    raise ValueError("codec must be one of %s" % (CODECS))
+
+
+def load(path_or_fh):
+    if not hasattr(path_or_fh, "read"):
+        with open(path_or_fh, "rb") as fh:
+            return load(fh)
+
+    fh = path_or_fh
+    start = fh.tell()
+    header = fh.read(len(MAGIC) + 1)
+    if header[:len(MAGIC)] != MAGIC:
+        fh.seek(start)
+        return cloudpickle.load(fh)
+    codec = CODECS[bytearray(header)[-1]]
+    return cloudpickle.load(codec_reader(codec, fh))
+
+
+def dump(obj, path_or_fh, codec="none", protocol=None):
+    if not hasattr(path_or_fh, "write"):
+        with open(path_or_fh, "wb") as fh:
+            return dump(obj, fh, codec, protocol)
+
+    fh = path_or_fh
+    if codec == "none":
+        cloudpickle.dump(obj, fh, protocol=protocol)
+        return
+    fh.write(MAGIC + bytearray([CODECS.index(codec)]))
+    writer = codec_writer(codec, fh)
+    cloudpickle.dump(obj, writer, protocol=protocol)
+    if codec == "zstd":
+        import zstandard
+        writer.flush(zstandard.FLUSH_FRAME)
+    else:
+        writer.close()
+
+
+def loads(data):
+    return load(io.BytesIO(data))
+
+
+def decompress(data):
+    if data[:len(MAGIC)] != MAGIC:
+        return data
+    codec = CODECS[bytearray(data[len(MAGIC):len(MAGIC) + 1])[0]]
+    return codec_reader(codec, io.BytesIO(data[len(MAGIC) + 1:])).read()
+
+
+def dumps(obj, codec="none", protocol=None):
+    fh = io.BytesIO()
+    dump(obj, fh, codec, protocol)
+    return fh.getvalue()
+
+
+def blob_path(digest):
+    return os.path.join("blobs", digest)
+
+
+def map_blob(digest):
+    # copy-on-write so the function may modify what it is given
+    with open(blob_path(digest), "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_COPY)
+
+
+def resolve(ref):
+    if "upstream" in ref:
+        # the result of another call, staged as an input of this task
+        value = load(ref["upstream"])
+        if isinstance(value, dict) and ERROR_KEY in value:
+            raise RuntimeError(
+                "an argument is the result of a call that failed:\n%s" %
+                (value[ERROR_KEY]["traceback"])
+            )
+        return value
+
+    if "blob" not in ref:
+        return cloudpickle.loads(ref["pickled"])
+
+    fmt = ref.get("format", "pickle")
+    if fmt == "npy":
+        import numpy
+        return numpy.load(blob_path(ref["blob"]), mmap_mode="c")
+    elif fmt == "pickle5":
+        buffers = [map_blob(d) for d in ref["buffers"]]
+        with open(blob_path(ref["blob"]), "rb") as fh:
+            return pickle.loads(decompress(fh.read()), buffers=buffers)
+    else:
+        return load(blob_path(ref["blob"]))
+
+
+def resolve_call(f):
+    func = resolve(f["func"])
+    args = [resolve(a) for a in f["args"]]
+    kwargs = dict((k, resolve(v)) for k, v in f["kwargs"].items())
+    return func, args, kwargs
+
+
+def call(f):
+    func, args, kwargs = resolve_call(f)
+    return func(*args, **kwargs)
+
+
+def max_rss():
+    # peak resident set size of this process in bytes
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def cpu_time():
+    # user and system time of this process and its children
+    try:
+        import resource
+    except ImportError:
+        return None
+    total = 0.0
+    for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]:
+        r = resource.getrusage(who)
+        total += r.ru_utime + r.ru_stime
+    return total
+
+
+def disk_usage(path="."):
+    total = 0
+    for dirpath, dnames, fnames in os.walk(path):
+        for f in fnames:
+            try:
+                total += os.lstat(os.path.join(dirpath, f)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def error_record(e):
+    # written in place of the result so the caller can raise the error
+    # again; the exception itself is included when it can be pickled
+    try:
+        exception = cloudpickle.dumps(e)
+    except Exception:
+        exception = None
+    return {ERROR_KEY: {
+        "type": "%s.%s" % (type(e).__module__, type(e).__name__),
+        "message": str(e),
+        "traceback": traceback.format_exc(),
+        "exception": exception
+    }}
+
+
+def run(pickled_runner, pickled_args=None, codec="none", protocol=None):
+    # must match tesseract.timings
+    timings = {"start": time.time()}
+    cpu_start = cpu_time()
+    try:
+        f = load(pickled_runner)
+        if pickled_args is None:
+            func, args, kwargs = resolve_call(f)
+            timings["loaded"] = time.time()
+            res = func(*args, **kwargs)
+        else:
+            func = resolve(f["func"])
+            items = load(pickled_args)["items"]
+            timings["loaded"] = time.time()
+            res = [func(*args, **kwargs) for args, kwargs in items]
+    except Exception as e:
+        res = error_record(e)
+    timings["called"] = time.time()
+    if cpu_start is not None:
+        timings["cpu_time"] = cpu_time() - cpu_start
+    try:
+        dump(res, "./result.pickle", codec, protocol)
+    except Exception as e:
+        # the return value cannot be pickled; the partial result goes
+        os.remove("./result.pickle")
+        dump(error_record(e), "./result.pickle", codec, protocol)
+    timings["dumped"] = time.time()
+    timings["max_rss"] = max_rss()
+    # inputs, anything the function wrote and the result
+    timings["scratch_bytes"] = disk_usage()
+    with open("./timings.json", "wb") as fh:
+        fh.write(json.dumps(timings).encode("utf8"))
     return
 
 
-if __name__ == '__main__':
+class Store(object):
+    # minimal access to the FileStore for pool workers; object store
+    # credentials are read from the environment
+
+    def __init__(self, url):
+        u = urlparse(url)
+        self.scheme = u.scheme
+        if self.scheme == "file":
+            self.path = u.path
+            return
+
+        from libcloud.storage.providers import get_driver
+        from libcloud.storage.types import Provider
+
+        self.path = u.path.strip("/")
+        env = os.environ
+        if self.scheme == "swift":
+            auth_url = urlparse(env["OS_AUTH_URL"])
+            self.driver = get_driver(Provider.OPENSTACK_SWIFT)(
+                env["OS_USERNAME"], env["OS_PASSWORD"],
+                ex_force_auth_url="%s://%s" % (auth_url.scheme,
+                                               auth_url.netloc),
+                ex_tenant_name=env["OS_TENANT_NAME"],
+                ex_force_auth_version="2.0_password"
+            )
+        else:
+            provider = {"s3": Provider.S3, "gs": Provider.GOOGLE_STORAGE}
+            self.driver = get_driver(provider[self.scheme])(
+                env["TESSERACT_STORE_KEY"], env["TESSERACT_STORE_SECRET"],
+                region=env.get("TESSERACT_STORE_REGION"),
+                project=env.get("TESSERACT_STORE_PROJECT")
+            )
+        self.container = self.driver.get_container(u.netloc)
+
+    def key(self, name):
+        return os.path.join(self.path, name)
+
+    def list(self, prefix):
+        if self.scheme == "file":
+            root = self.key(prefix)
+            if not os.path.isdir(root):
+                return []
+            return sorted(os.path.join(prefix, n) for n in os.listdir(root))
+        objs = self.driver.iterate_container_objects(
+            self.container, ex_prefix=self.key(prefix).rstrip("/") + "/"
+        )
+        return sorted(
+            os.path.join(prefix, os.path.basename(o.name)) for o in objs
+        )
+
+    def exists(self, name):
+        if self.scheme == "file":
+            return os.path.exists(self.key(name))
+        return len(self.driver.list_container_objects(
+            self.container, ex_prefix=self.key(name)
+        )) > 0
+
+    def get(self, name, path):
+        if self.scheme == "file":
+            shutil.copyfile(self.key(name), path)
+            return
+        obj = self.driver.get_object(self.container.name, self.key(name))
+        self.driver.download_object(obj, path, overwrite_existing=True)
+
+    def put(self, name, data):
+        if self.scheme == "file":
+            tmp = self.key(name) + ".tmp"
+            if not os.path.isdir(os.path.dirname(tmp)):
+                os.makedirs(os.path.dirname(tmp))
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            # readers never see a partially written object
+            os.rename(tmp, self.key(name))
+            return
+        self.driver.upload_object_via_stream(
+            iter([data]), self.container, self.key(name)
+        )
+
+    def delete(self, name):
+        if self.scheme == "file":
+            os.remove(self.key(name))
+            return
+        obj = self.driver.get_object(self.container.name, self.key(name))
+        self.driver.delete_object(obj)
+
+
+def refs(f):
+    for ref in [f["func"]] + list(f["args"]) + list(f["kwargs"].values()):
+        if "blob" in ref:
+            yield ref["blob"]
+            for d in ref.get("buffers", []):
+                yield d
+
+
+def worker(store_url, pool_dir, worker_id, codec="none", protocol=None,
+           idle_timeout=300, poll_interval=1.0):
+    store = Store(store_url)
+    pending = os.path.join(pool_dir, "worker_%s" % (worker_id), "pending")
+    results = os.path.join(pool_dir, "results")
+    if not os.path.isdir("blobs"):
+        os.makedirs("blobs")
+
+    last_call = time.time()
+    while not store.exists(os.path.join(pool_dir, "shutdown")):
+        names = [n for n in store.list(pending) if n.endswith(".pickle")]
+        if not names:
+            if time.time() - last_call > idle_timeout:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        for name in names:
+            store.get(name, "call.pickle")
+            f = load("call.pickle")
+            for d in refs(f):
+                if not os.path.exists(blob_path(d)):
+                    store.get(os.path.join("blobs", "sha256", d),
+                              blob_path(d))
+            try:
+                out = {"result": call(f)}
+            except Exception as e:
+                out = error_record(e)
+            try:
+                data = dumps(out, codec, protocol)
+            except Exception as e:
+                data = dumps(error_record(e), codec, protocol)
+            store.put(
+                os.path.join(results, os.path.basename(name)), data
+            )
+            store.delete(name)
+            last_call = time.time()
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser()
-    parser.add_argument("pickled_runner")
-    args = parser.parse_args()
-    run(args.pickled_runner)
+    parser.add_argument("pickled_runner", nargs="?")
+    parser.add_argument("--args", dest="pickled_args", default=None)
+    parser.add_argument("--codec", default="none", choices=CODECS)
+    parser.add_argument("--protocol", type=int, default=None)
+    parser.add_argument("--worker", nargs=3,
+                        metavar=("STORE_URL", "POOL_DIR", "WORKER_ID"))
+    parser.add_argument("--idle-timeout", type=float, default=300)
+    args = parser.parse_args(argv)
+    if args.worker is not None:
+        worker(*args.worker, codec=args.codec, protocol=args.protocol,
+               idle_timeout=args.idle_timeout)
+    else:
+        run(args.pickled_runner, args.pickled_args, args.codec,
+            args.protocol)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import re
+
+
+# directories created for non-cached runs and worker pools
+RUN_DIR = re.compile(r"^tesseract_(pool_)?[0-9a-f]{32}$")
+
+# files written for cached calls; files sharing a digest belong to the same
+# call
+CALL_FILE = re.compile(
+    r"^tesseract_(func|args|res)_([0-9a-f]{64})\.(pickle|timings\.json)$"
+)
+
+# manifests of calls, which reference the blobs they stage: the function of
+# a run or map, and the calls queued for the workers of a pool
+MANIFEST = re.compile(
+    r"(^|/)tesseract_func_[0-9a-f]{64}\.pickle$|"
+    r"^tesseract_pool_[0-9a-f]{32}/worker_[0-9]+/pending/[^/]+\.pickle$"
+)
+
+
+def blob_refs(manifest):
+    # digests of the blobs a manifest written by encode_call references
+    refs = [manifest.get("func")] + list(manifest.get("args", [])) + \
+        list(manifest.get("kwargs", {}).values())
+    digests = set()
+    for ref in refs:
+        if not isinstance(ref, dict):
+            continue
+        if "blob" in ref:
+            digests.add(ref["blob"])
+        digests.update(ref.get("buffers", []))
+    return digests
+
+
+def group(objects):
+    # groups (name, size, mtime) entries into the units that are deleted
+    # together: a run directory, the pickles of one cached call, or a blob.
+    # Anything else in the store is left alone.
+    units = {}
+    for name, size, mtime in objects:
+        if name.endswith(".tmp"):
+            # written right now
+            continue
+        parts = name.split("/")
+        if len(parts) == 1:
+            continue
+        if parts[0] == "blobs":
+            key = ("blob", name)
+        elif RUN_DIR.match(parts[0]):
+            key = ("run", parts[0])
+        else:
+            m = CALL_FILE.match(parts[-1])
+            if m is None:
+                continue
+            key = ("call", os.path.dirname(name), m.group(2))
+        units.setdefault(key, []).append((name, size, mtime))
+    return units
+
+
+def plan(objects, now, max_age=None, max_bytes=None, keep_last=None,
+         min_age=3600, references=None):
+    # returns the names to delete; units modified in the last min_age
+    # seconds are never deleted so running tasks keep their inputs.
+    # references maps the names of manifests to the names of the blobs they
+    # stage: put_blob does not rewrite a blob that exists, so a blob counts
+    # as written when the newest call using it was, and is kept as long as
+    # a call using it is.
+    grouped = group(objects)
+    unit_of = dict(
+        (name, key) for key, members in grouped.items()
+        for name, _, _ in members
+    )
+    users = {}
+    for manifest, blobs in (references or {}).items():
+        key = unit_of.get(manifest)
+        if key is None:
+            continue
+        for name in blobs:
+            users.setdefault(("blob", name), set()).add(key)
+
+    newest = {}
+    for key, members in grouped.items():
+        # files without a modification time are never old enough
+        newest[key] = max(
+            float("inf") if mtime is None else mtime
+            for _, _, mtime in members
+        )
+    units = []
+    for key, members in grouped.items():
+        mtime = max(
+            [newest[key]] + [newest[u] for u in users.get(key, ())]
+        )
+        size = sum(s or 0 for _, s, _ in members)
+        units.append((key, members, mtime, size))
+
+    delete = set()
+
+    def expired(unit):
+        return unit[2] <= now - min_age and \
+            all(u in delete for u in users.get(unit[0], ()))
+
+    def too_old(blobs):
+        if max_age is None:
+            return
+        for unit in units:
+            if (unit[0][0] == "blob") == blobs and \
+                    unit[2] <= now - max_age and expired(unit):
+                delete.add(unit[0])
+
+    too_old(blobs=False)
+
+    if keep_last is not None:
+        by_cache = {}
+        for unit in units:
+            if unit[0][0] == "call":
+                by_cache.setdefault(unit[0][1], []).append(unit)
+        for calls in by_cache.values():
+            calls.sort(key=lambda u: u[2], reverse=True)
+            for unit in calls[keep_last:]:
+                if expired(unit):
+                    delete.add(unit[0])
+
+    # blobs go once the calls that use them are gone
+    too_old(blobs=True)
+
+    if max_bytes is not None:
+        # least recently written first, blobs after the calls that use them
+        remaining = sorted(
+            [u for u in units if u[0] not in delete],
+            key=lambda u: (u[2], u[0][0] == "blob")
+        )
+        total = sum(u[3] for u in remaining)
+        for unit in remaining:
+            if total <= max_bytes:
+                break
+            if expired(unit):
+                delete.add(unit[0])
+                total -= unit[3]
+
+    return sorted(
+        name for key, members, _, _ in units if key in delete
+        for name, _, _ in members
+    )
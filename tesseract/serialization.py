@@ -0,0 +1,222 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import cloudpickle
+import hashlib
+import io
+
+
+# pickled arguments larger than this are stored as their own blob
+BLOB_THRESHOLD = 1024 * 1024
+
+# large buffers are handed to the FileStore in slices of this size
+BUFFER_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def _supports_pickle5():
+    try:
+        cloudpickle.dumps(None, protocol=5, buffer_callback=lambda b: None)
+    except Exception:
+        return False
+    return True
+
+
+PICKLE5 = _supports_pickle5()
+
+
+def digest(contents):
+    m = hashlib.sha256()
+    if isinstance(contents, (bytes, memoryview)):
+        contents = [contents]
+    for chunk in contents:
+        m.update(chunk)
+    return m.hexdigest()
+
+
+# payloads written with a codec start with MAGIC followed by one byte
+# holding the index of the codec in CODECS; anything else is a bare pickle
+MAGIC = b"\x00TSR"
+CODECS = ["none", "gzip", "lzma", "zstd", "lz4"]
+
+# libraries the remote side needs to read and write each codec
+CODEC_LIBRARIES = {"zstd": "zstandard", "lz4": "lz4"}
+
+
+def _writer(codec, fh):
+    if codec == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=fh, mode="wb")
+    elif codec == "lzma":
+        import lzma
+        return lzma.LZMAFile(fh, "wb")
+    elif codec == "zstd":
+        import zstandard
+        return _ZstdWriter(zstandard.ZstdCompressor().stream_writer(fh))
+    elif codec == "lz4":
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(fh, "wb")
+    raise ValueError("codec must be one of %s" % (CODECS))
+
+
+def _reader(codec, fh):
+    if codec == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=fh, mode="rb")
+    elif codec == "lzma":
+        import lzma
+        return lzma.LZMAFile(fh, "rb")
+    elif codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(fh)
+    elif codec == "lz4":
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(fh, "rb")
+    raise ValueError("codec must be one of %s" % (CODECS))
+
+
+class _ZstdWriter(object):
+    # ends the frame on close without closing the underlying file
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data):
+        return self.writer.write(data)
+
+    def close(self):
+        import zstandard
+        self.writer.flush(zstandard.FLUSH_FRAME)
+
+
+def dump(obj, fh, codec="none", protocol=None):
+    if codec == "none":
+        cloudpickle.dump(obj, fh, protocol=protocol)
+        return
+    fh.write(MAGIC + bytearray([CODECS.index(codec)]))
+    writer = _writer(codec, fh)
+    cloudpickle.dump(obj, writer, protocol=protocol)
+    writer.close()
+
+
+def dumps(obj, codec="none", protocol=None):
+    return compress(cloudpickle.dumps(obj, protocol=protocol), codec)
+
+
+def compress(cp_str, codec="none"):
+    if codec == "none":
+        return cp_str
+    fh = io.BytesIO()
+    fh.write(MAGIC + bytearray([CODECS.index(codec)]))
+    writer = _writer(codec, fh)
+    writer.write(cp_str)
+    writer.close()
+    return fh.getvalue()
+
+
+def load(fh):
+    start = fh.tell()
+    header = fh.read(len(MAGIC) + 1)
+    if header[:len(MAGIC)] != MAGIC:
+        fh.seek(start)
+        return cloudpickle.load(fh)
+    codec = CODECS[bytearray(header)[-1]]
+    return cloudpickle.load(_reader(codec, fh))
+
+
+def loads(data):
+    return load(io.BytesIO(data))
+
+
+class Reference(object):
+    # stands in for an argument that the task downloads as one of its
+    # inputs, such as the result of another call; path is relative to the
+    # task's working directory
+
+    def __init__(self, path):
+        self.path = path
+
+
+def encode_call(func, args, kwargs, threshold=BLOB_THRESHOLD,
+                codec="none", protocol=None):
+    # the call is described by a small manifest that references the
+    # function and any large argument by the digest of its serialized
+    # form; the blobs themselves are deduplicated in the FileStore and
+    # reassembled by the remote runner
+    blobs = {}
+
+    def add(contents):
+        d = digest(contents)
+        blobs[d] = contents
+        return d
+
+    def ref(obj, force_blob=False):
+        if isinstance(obj, Reference):
+            return {"upstream": obj.path}
+
+        # numpy arrays are written as .npy so the runner can memory-map them
+        if _is_ndarray(obj) and obj.nbytes > threshold and \
+                not obj.dtype.hasobject:
+            return {"blob": add(_npy_chunks(obj)), "format": "npy"}
+
+        # with protocol 5, large buffers (arrays inside DataFrames, closures,
+        # ...) are kept out-of-band and become blobs of their own. The
+        # pickle is compressed; the buffers are not, so that the runner can
+        # memory-map them.
+        if PICKLE5 and (protocol is None or protocol >= 5):
+            buffers = []
+            cp_str = cloudpickle.dumps(
+                obj, protocol=5, buffer_callback=buffers.append
+            )
+            size = len(cp_str) + sum(b.raw().nbytes for b in buffers)
+            if force_blob or size > threshold:
+                return {
+                    "blob": add(compress(cp_str, codec)),
+                    "format": "pickle5",
+                    "buffers": [add(_slices(b.raw())) for b in buffers]
+                }
+            if buffers:
+                cp_str = cloudpickle.dumps(obj, protocol=5)
+            return {"pickled": cp_str}
+
+        cp_str = cloudpickle.dumps(obj, protocol=protocol)
+        if force_blob or len(cp_str) > threshold:
+            return {"blob": add(compress(cp_str, codec))}
+        return {"pickled": cp_str}
+
+    manifest = {
+        "func": ref(func, force_blob=True),
+        "args": [ref(a) for a in args],
+        "kwargs": dict((k, ref(v)) for k, v in kwargs.items())
+    }
+    return manifest, blobs
+
+
+def _is_ndarray(obj):
+    t = type(obj)
+    return t.__module__ == "numpy" and t.__name__ == "ndarray"
+
+
+def _slices(view, size=BUFFER_CHUNK_SIZE):
+    # zero-copy slices of a buffer
+    view = memoryview(view)
+    if not hasattr(view, "cast"):
+        # Python 2 has no memoryview.cast and cannot write memoryviews to
+        # files, so the slices are copied; they are only ever handed bytes
+        # views of numpy arrays there
+        return [
+            view[i:i + size].tobytes() for i in range(0, len(view), size)
+        ]
+    view = view.cast("B")
+    return [view[i:i + size] for i in range(0, len(view), size)]
+
+
+def _npy_chunks(array):
+    import numpy
+
+    array = numpy.ascontiguousarray(array)
+    header = io.BytesIO()
+    numpy.lib.format.write_array_header_1_0(
+        header, numpy.lib.format.header_data_from_array_1_0(array)
+    )
+    return [header.getvalue()] + _slices(
+        array.reshape(-1).view(numpy.uint8)
+    )
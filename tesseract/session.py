@@ -0,0 +1,76 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+import os
+import threading
+import time
+import uuid
+
+from attr import attrs, attrib, Factory
+from attr.validators import instance_of
+from builtins import str
+from concurrent.futures import ThreadPoolExecutor
+from tes.models import strconv
+
+from tesseract.filestore import FileStore
+
+
+SESSIONS_DIR = "tesseract_sessions"
+
+
+def session_dir(name):
+    return os.path.join(SESSIONS_DIR, name)
+
+
+@attrs
+class SessionLog(object):
+    # Records the tasks submitted under a session name in the FileStore.
+    # Entries are buffered and written as one object per flush, so a batch
+    # of calls costs a single upload and concurrent writers never touch
+    # the same object.
+    file_store = attrib(validator=instance_of(FileStore))
+    name = attrib(convert=strconv, validator=instance_of(str))
+    __entries = attrib(init=False, default=Factory(list), cmp=False)
+    __lock = attrib(init=False, default=Factory(threading.Lock), cmp=False)
+
+    def add(self, task_id, output_key, input_digest, submitted):
+        with self.__lock:
+            self.__entries.append({
+                "task_id": task_id,
+                "output_key": output_key,
+                "input_digest": input_digest,
+                "submitted": submitted
+            })
+
+    def flush(self):
+        with self.__lock:
+            entries, self.__entries = self.__entries, []
+        if not entries:
+            return
+        # names sort in the order they were written
+        self.file_store.upload(
+            name=os.path.join(
+                session_dir(self.name),
+                "%017.6f_%s.json" % (time.time(), uuid.uuid4().hex[:8])
+            ),
+            contents=json.dumps(entries)
+        )
+
+
+def load_session(file_store, name):
+    # all entries recorded for the session, in the order they were submitted
+    names = [
+        n for n in file_store.list(session_dir(name)) if n.endswith(".json")
+    ]
+    if not names:
+        raise ValueError("no such session: %s" % (name))
+
+    def download(n):
+        data = b"".join(file_store.download_stream(n))
+        return json.loads(data.decode("utf8"))
+
+    entries = []
+    with ThreadPoolExecutor(8) as executor:
+        for e in executor.map(download, sorted(names)):
+            entries.extend(e)
+    return sorted(entries, key=lambda e: e["submitted"])
@@ -1,27 +1,63 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
-import cloudpickle
 import copy
 import os
-import pkg_resources
+import pkgutil
 import re
 import sys
 import tes
+import threading
+import time
 import uuid
-import hashlib
 
 from attr import attrs, attrib, Factory
-from attr.validators import instance_of, optional
-from builtins import str, bytes
+from attr.validators import instance_of, in_, optional
+from builtins import str
 from collections import Callable
+from concurrent.futures import ThreadPoolExecutor
 from requests.utils import urlparse
 from tes.models import strconv
 
+from tesseract.cache import CallCache
+from tesseract.client import SessionClient
 from tesseract.filestore import FileStore, FileExistsError
-from tesseract.future import Future, CachedFuture
+from tesseract.images import resolve_image
+from tesseract.local import get_client as get_local_client
+from tesseract.pool import WorkerPool
+from tesseract.history import ResourceHistory, function_key
+from tesseract.future import (Future, CachedFuture, DeferredFuture,
+                              as_completed)
+from tesseract.session import SessionLog, load_session
+from tesseract.throttle import InFlightLimiter
+from tesseract.serialization import (BLOB_THRESHOLD, CODECS,
+                                     CODEC_LIBRARIES, Reference, digest,
+                                     dumps, encode_call)
+from tesseract.timings import timings_name
 from tesseract.utils import process_url
 
 
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def _runner_source():
+    # read once per process; pkgutil covers interpreters that predate
+    # importlib.resources.files and, unlike pkg_resources, is cheap to import
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            try:
+                from importlib.resources import files
+            except ImportError:
+                runner = pkgutil.get_data("tesseract", "resources/runner.py")
+            else:
+                runner = files("tesseract").joinpath(
+                    "resources/runner.py"
+                ).read_bytes()
+            _runner = str(runner.decode("utf8"))
+    return _runner
+
+
 @attrs
 class Tesseract(object):
     file_store = attrib(validator=instance_of(FileStore))
@@ -44,6 +80,8 @@ class Tesseract(object):
     disk_gb = attrib(
         default=None, validator=optional(instance_of((int, float)))
     )
+    # size each task from the recorded history of its function
+    auto_resources = attrib(default=False, validator=instance_of(bool))
     docker = attrib(
         convert=strconv, validator=instance_of(str)
     )
@@ -53,8 +91,36 @@ class Tesseract(object):
     cache_name = attrib(
         default=None, convert=strconv, validator=optional(instance_of(str))
     )
+    # local index and result LRU used when call caching is enabled
+    cache_dir = attrib(
+        default=None, convert=strconv, validator=optional(instance_of(str))
+    )
+    cache_max_bytes = attrib(default=1024 ** 3, validator=instance_of(int))
+    blob_threshold = attrib(default=BLOB_THRESHOLD, validator=instance_of(int))
+    # set to False when the docker image already provides the libraries
+    install_libraries = attrib(default=True, validator=instance_of(bool))
+    codec = attrib(default="none", convert=strconv, validator=in_(CODECS))
+    pickle_protocol = attrib(
+        default=None, validator=optional(instance_of(int))
+    )
+    # called with Future.timings() once each result has been fetched
+    timings_hook = attrib(default=None, cmp=False)
+    # submitted tasks are recorded under this name; see attach()
+    session = attrib(
+        default=None, convert=strconv, validator=optional(instance_of(str))
+    )
+    # at most this many tasks are created and unfinished at a time; further
+    # calls block until one finishes. Clones share the limit.
+    max_in_flight = attrib(
+        default=None, validator=optional(instance_of(int))
+    )
     __tes_client = attrib(init=False,  validator=instance_of(tes.HTTPClient))
     __id = attrib(init=False, convert=strconv, validator=instance_of(str))
+    __templates = attrib(init=False, default=Factory(dict), cmp=False)
+    __cache = attrib(init=False, default=None, cmp=False)
+    __session_log = attrib(init=False, default=None, cmp=False)
+    __history = attrib(init=False, default=None, cmp=False)
+    __limiter = attrib(init=False, default=None, cmp=False)
 
     @docker.default
     def __default_docker(self):
@@ -72,8 +138,18 @@ class Tesseract(object):
             raise ValueError("%s must be a valid URL" % (attribute))
 
     def __attrs_post_init__(self):
-        self.__tes_client = tes.HTTPClient(self.tes_url, timeout=self.timeout)
+        if self.__is_local():
+            self.__tes_client = get_local_client(self.tes_url)
+        else:
+            self.__tes_client = SessionClient(
+                self.tes_url, timeout=self.timeout
+            )
         self.__id = None
+        if self.max_in_flight is not None:
+            self.with_max_in_flight(self.max_in_flight)
+
+    def __is_local(self):
+        return urlparse(self.tes_url).scheme == "local"
 
     def __get_id(self):
         # enable call caching by hardcoding the id attribute on the instance.
@@ -102,21 +178,208 @@ class Tesseract(object):
 
         return self.__id
 
+    def _run_id(self):
+        return self.__get_id()
+
     def clone(self):
-        return copy.deepcopy(self)
+        # the TES client and FileStore are shared; only the task spec is
+        # copied. Inputs and outputs are copied one level deep since their
+        # urls are rewritten in place when call caching is enabled.
+        c = copy.copy(self)
+        c.input_files = [copy.copy(i) for i in self.input_files]
+        c.output_files = [copy.copy(o) for o in self.output_files]
+        c.libraries = list(self.libraries)
+        c.__templates = {}
+        return c
 
     def with_resources(self, cpu_cores=None, ram_gb=None, disk_gb=None,
-                       docker=None, libraries=None):
-        # only override if set
+                       docker=None, libraries=None, auto=None):
+        # only override if set. With auto=True the resources of each task
+        # come from the history of its function once there is enough of it;
+        # the values set here are used until then.
+        if auto is not None:
+            self.auto_resources = auto
         self.cpu_cores = cpu_cores or self.cpu_cores
         self.ram_gb = ram_gb or self.ram_gb
         self.disk_gb = disk_gb or self.disk_gb
         self.docker = docker or self.docker
         if libraries is not None:
             self.libraries = libraries
+        if docker is not None or libraries is not None:
+            # a prebuilt image no longer matches the requested environment
+            self.install_libraries = True
+
+    def with_max_in_flight(self, max_in_flight):
+        # a new limit for this instance and the clones made from it from now
+        # on; None removes it
+        self.max_in_flight = max_in_flight
+        self.__limiter = None
+        if max_in_flight is not None:
+            self.__limiter = InFlightLimiter(max_in_flight)
+
+    def in_flight(self):
+        # tasks created under the limit that have not finished
+        if self.__limiter is None:
+            return None
+        return self.__limiter.in_flight()
+
+    def __get_history(self):
+        if self.__history is None:
+            self.__history = ResourceHistory(self.cache_dir)
+        return self.__history
+
+    def __resources(self, func_key):
+        resources = (self.cpu_cores, self.ram_gb, self.disk_gb)
+        if func_key is None:
+            return resources
+        suggested = self.__get_history().suggest(func_key)
+        if suggested is None:
+            return resources
+        return tuple(
+            r if s is None else s for s, r in zip(suggested, resources)
+        )
 
-    def with_call_caching(self, name):
+    def __timings_hook(self, func_key):
+        # with auto sizing every finished call adds to the history
+        if func_key is None:
+            return self.timings_hook
+        history = self.__get_history()
+        user_hook = self.timings_hook
+
+        def hook(timings):
+            history.record(func_key, timings)
+            if user_hook is not None:
+                user_hook(timings)
+
+        return hook
+
+    def with_prebuilt_image(self, registry=None, push=None, docker="docker"):
+        # build (or reuse) an image with the libraries baked in so tasks
+        # skip the pip install
+        libraries = list(self.libraries)
+        if self.codec in CODEC_LIBRARIES:
+            libraries.append(CODEC_LIBRARIES[self.codec])
+        if self.file_store.scheme != "file":
+            # pool workers read object stores through libcloud
+            libraries.append("apache-libcloud")
+        self.docker = resolve_image(
+            self.docker, libraries, registry, push, docker
+        )
+        self.install_libraries = False
+
+    def with_call_caching(self, name, cache_dir=None, max_bytes=None):
         self.cache_name = name
+        if cache_dir is not None:
+            self.cache_dir = cache_dir
+        if max_bytes is not None:
+            self.cache_max_bytes = max_bytes
+        self.__cache = None
+
+    def cache_stats(self):
+        cache = self.__get_cache()
+        if cache is None:
+            raise ValueError("call caching is not enabled")
+        return cache.stats()
+
+    def __get_cache(self):
+        if self.cache_name is None:
+            return None
+        if self.__cache is None:
+            self.__cache = CallCache(
+                self.file_store.url, self.cache_dir, self.cache_max_bytes
+            )
+        return self.__cache
+
+    def __cached_future(self, output_name, timings):
+        # a result kept on local disk needs no request to the store or the
+        # TES server
+        cache = self.__get_cache()
+        if cache is None or cache.get(output_name) is None:
+            return None
+        cache.count("hits")
+        self.__record(None, output_name)
+        return CachedFuture(
+            output_name, self.file_store, cache, timings, self.timings_hook
+        )
+
+    def with_session(self, name=None):
+        # record every task submitted from here on in the FileStore so that
+        # another process can attach() to them
+        self.session = name or uuid.uuid4().hex
+        self.__session_log = None
+        return self.session
+
+    def __get_session_log(self):
+        if self.session is None:
+            return None
+        if self.__session_log is None or \
+                self.__session_log.name != self.session:
+            self.__session_log = SessionLog(self.file_store, self.session)
+        return self.__session_log
+
+    def __record(self, task_id, output_name, submitted=None):
+        # calls answered from a cache are recorded without a task id
+        log = self.__get_session_log()
+        if log is not None:
+            # the name of the result holds the digest of the call
+            log.add(
+                task_id, output_name,
+                re.sub(r"^.*_|\.pickle$", "", os.path.basename(output_name)),
+                submitted or time.time()
+            )
+
+    def _limiter(self):
+        return self.__limiter
+
+    def _record(self, task_id, output_name, submitted=None):
+        # a single call, written out before it is handed back
+        self.__record(task_id, output_name, submitted)
+        self.__flush_session()
+
+    def __flush_session(self):
+        log = self.__get_session_log()
+        if log is not None:
+            log.flush()
+
+    def attach(self, session):
+        # futures for every task recorded under the session, in the order
+        # they were submitted; nothing is submitted again. Finished calls
+        # become CachedFutures, the others are watched like new tasks.
+        entries = load_session(self.file_store, session)
+        finished = set()
+        for d in set(os.path.dirname(e["output_key"]) for e in entries):
+            finished.update(self.file_store.list(d))
+
+        cache = self.__get_cache()
+        futures = []
+        for e in entries:
+            if e["output_key"] in finished or e["task_id"] is None:
+                futures.append(CachedFuture(
+                    e["output_key"], self.file_store, cache
+                ))
+            else:
+                futures.append(Future(
+                    e["task_id"],
+                    e["output_key"],
+                    self.file_store,
+                    self.__tes_client,
+                    cache,
+                    {"submitted": e["submitted"]},
+                    self.timings_hook
+                ))
+        return futures
+
+    def with_timings_hook(self, hook):
+        # hook(timings) is called once per call with Future.timings(); this
+        # costs one task lookup and one small download per call
+        self.timings_hook = hook
+
+    def with_serialization(self, codec=None, protocol=None):
+        if codec is not None:
+            if codec not in CODECS:
+                raise ValueError("codec must be one of %s" % (CODECS))
+            self.codec = codec
+        self.pickle_protocol = protocol or self.pickle_protocol
 
     def with_upload(self, path):
         run_id = self.__get_id()
@@ -131,6 +394,16 @@ class Tesseract(object):
                   "It already exists in the FileStore [%s]" % (input_url))
         return self.with_input(input_url, path)
 
+    def with_uploads(self, paths):
+        run_id = self.__get_id()
+        items = [
+            (path, os.path.join(run_id, os.path.basename(path)))
+            for path in paths
+        ]
+        urls = self.file_store.upload_many(items, skip_existing=True)
+        for path, input_url in zip(paths, urls):
+            self.with_input(input_url, path)
+
     def with_input(self, url, path):
         u = urlparse(process_url(url))
         if u.scheme not in self.file_store.supported:
@@ -191,85 +464,335 @@ class Tesseract(object):
         if not isinstance(func, Callable):
             raise TypeError("func not an instance of collections.Callable")
 
+        future = self.__run(func, args, kwargs)
+        # written before returning, so that a process killed right after
+        # does not lose the task
+        self.__flush_session()
+        return future
+
+    def __run(self, func, args, kwargs, run_id=None):
+        # futures given as arguments are staged as inputs of the task
+        # instead of passing through this process
+        args, kwargs, upstream = _link_upstream(args, kwargs)
+
+        timings = {}
+        cp_str, input_name, output_name, blobs = self._serialize_call(
+            func, args, kwargs, run_id, timings
+        )
+        cached = self.__cached_future(output_name, timings)
+        if cached is not None:
+            return cached
+
+        start = time.time()
+        for d, contents in blobs.items():
+            self.file_store.put_blob(contents, d)
+        input_cp_url = self.__upload_pickle(input_name, cp_str)
+        timings["upload"] = time.time() - start
+
+        func_key = function_key(func) if self.auto_resources else None
+
+        def submit():
+            future = self.__submit(
+                input_cp_url, output_name, blobs=list(blobs),
+                timings=timings, upstream=upstream, func_key=func_key
+            )
+            if upstream:
+                self.__flush_session()
+            return future
+
+        if upstream:
+            # created on another thread once the arguments are ready
+            return DeferredFuture(
+                output_name, self.file_store,
+                [f for f, _ in upstream.values()], submit
+            )
+        return submit()
+
+    def submit_many(self, calls, max_workers=16):
+        # calls are (func, args) or (func, args, kwargs) tuples; they share
+        # one run id and up to max_workers of them are uploaded and created
+        # at once over the client's keep-alive connections
+        if not isinstance(max_workers, int) or max_workers < 1:
+            raise ValueError("max_workers must be a positive integer")
+
+        calls = [_unpack_call(c) for c in calls]
         run_id = self.__get_id()
 
+        def submit(call):
+            func, args, kwargs = call
+            return self.__run(func, args, kwargs, run_id)
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = list(executor.map(submit, calls))
+        self.__flush_session()
+        return futures
+
+    def run_async(self, func, *args, **kwargs):
+        if not isinstance(func, Callable):
+            raise TypeError("func not an instance of collections.Callable")
+
+        if self.__is_local():
+            raise ValueError("run_async requires an http(s) TES server")
+
+        from tesseract.aio import run_async
+        return run_async(self, func, *args, **kwargs)
+
+    def _serialize_call(self, func, args, kwargs, run_id=None,
+                        timings=None):
+        if run_id is None:
+            run_id = self.__get_id()
+
         # serialize function and arguments
-        # upload to object store if necessary
-        runner = {"func": func, "args": args, "kwargs": kwargs}
-        cp_str = cloudpickle.dumps(runner)
+        start = time.time()
+        manifest, blobs = encode_call(
+            func, args, kwargs, self.blob_threshold, self.codec,
+            self.pickle_protocol
+        )
+        cp_str = dumps(manifest, self.codec, self.pickle_protocol)
+        serialized = time.time()
 
-        m = hashlib.sha256()
-        m.update(cp_str)
-        mhex = m.hexdigest()
+        mhex = digest(cp_str)
+        if timings is not None:
+            timings["serialize"] = serialized - start
+            timings["hash"] = time.time() - serialized
         input_name = os.path.join(run_id, "tesseract_func_%s.pickle" % (mhex))
         output_name = os.path.join(run_id, "tesseract_res_%s.pickle" % (mhex))
+        return cp_str, input_name, output_name, blobs
 
-        if self.file_store.exists(input_name, type="file"):
-            input_cp_url = self.file_store.generate_url(input_name)
-            print("Found cached input: %s" % (input_cp_url))
-        else:
-            input_cp_url = self.file_store.upload(
-                name=input_name, contents=cp_str
-            )
+    def pool(self, workers=4, idle_timeout=300, env=None):
+        return WorkerPool(
+            self, self.__tes_client, workers, idle_timeout, env
+        )
+
+    def map(self, func, iterable, chunksize=1, timeout=None):
+        chunks = self.__submit_map(func, iterable, chunksize)
+
+        def result_iterator():
+            for _, f in chunks:
+                for r in f.result(timeout=timeout):
+                    yield r
+
+        return result_iterator()
+
+    def map_as_completed(self, func, iterable, chunksize=1, timeout=None):
+        # yields (index, result) pairs, index being the position of the
+        # item in iterable, as each chunk finishes
+        chunks = self.__submit_map(func, iterable, chunksize)
+        offsets = dict((id(f), start) for start, f in chunks)
 
+        def result_iterator():
+            futures = [f for _, f in chunks]
+            for f in as_completed(futures, timeout=timeout):
+                for i, r in enumerate(f.result(), offsets[id(f)]):
+                    yield i, r
+
+        return result_iterator()
+
+    def __submit_map(self, func, iterable, chunksize):
+        if not isinstance(func, Callable):
+            raise TypeError("func not an instance of collections.Callable")
+        if not isinstance(chunksize, int) or chunksize < 1:
+            raise ValueError("chunksize must be a positive integer")
+
+        run_id = self.__get_id()
+
+        # the function is serialized and uploaded once; each chunk of
+        # arguments is shipped as its own pickle and executed as one task
+        manifest, blobs = encode_call(
+            func, (), {}, self.blob_threshold, self.codec,
+            self.pickle_protocol
+        )
+        func_str = dumps(manifest, self.codec, self.pickle_protocol)
+        func_hex = digest(func_str)
+        func_name = os.path.join(
+            run_id, "tesseract_func_%s.pickle" % (func_hex)
+        )
+        func_cp_url = None
+        func_key = function_key(func) if self.auto_resources else None
+
+        # (index of the first item, future) for each chunk
+        chunks = []
+        offset = 0
+        for chunk in _chunks(iterable, chunksize):
+            first, offset = offset, offset + len(chunk)
+            start = time.time()
+            cp_str = dumps({"items": chunk}, self.codec, self.pickle_protocol)
+            serialized = time.time()
+            mhex = digest(func_hex.encode("utf8") + cp_str)
+            timings = {
+                "serialize": serialized - start,
+                "hash": time.time() - serialized
+            }
+            args_name = os.path.join(
+                run_id, "tesseract_args_%s.pickle" % (mhex)
+            )
+            output_name = os.path.join(
+                run_id, "tesseract_res_%s.pickle" % (mhex)
+            )
+            cached = self.__cached_future(output_name, timings)
+            if cached is not None:
+                chunks.append((first, cached))
+                continue
+
+            # uploaded with the first chunk that needs to run
+            start = time.time()
+            if func_cp_url is None:
+                for d, contents in blobs.items():
+                    self.file_store.put_blob(contents, d)
+                func_cp_url = self.__upload_pickle(func_name, func_str)
+            args_cp_url = self.__upload_pickle(args_name, cp_str)
+            timings["upload"] = time.time() - start
+            chunks.append((first, self.__submit(
+                func_cp_url, output_name, args_cp_url, list(blobs),
+                timings, func_key=func_key
+            )))
+        self.__flush_session()
+        return chunks
+
+    def __upload_pickle(self, name, cp_str):
+        if self.file_store.exists(name, type="file"):
+            url = self.file_store.generate_url(name)
+            print("Found cached input: %s" % (url))
+        else:
+            try:
+                url = self.file_store.upload(name=name, contents=cp_str)
+            except FileExistsError:
+                # an identical call was uploaded concurrently
+                url = self.file_store.generate_url(name)
+        return url
+
+    def __submit(self, input_cp_url, output_name, args_cp_url=None,
+                 blobs=(), timings=None, upstream=None, func_key=None):
+        timings = {} if timings is None else timings
         # define storage url for pickled output
         output_cp_url = self.file_store.generate_url(output_name)
+        cache = self.__get_cache()
         if self.file_store.exists(output_name, type="file"):
             print("Found cached output: %s" % (output_cp_url))
+            if cache is not None:
+                cache.count("store_hits")
+            self.__record(None, output_name)
             return CachedFuture(
                 output_name,
-                FileStore(self.file_store.url),
+                self.file_store,
+                cache,
+                timings,
+                self.timings_hook
             )
+        if cache is not None:
+            cache.count("misses")
 
         # create task msg and submit
-        task_msg = self._create_task_msg(input_cp_url, output_cp_url)
-        id = self.__tes_client.create_task(task_msg)
-        return Future(
+        task_msg = self._create_task_msg(
+            input_cp_url, output_cp_url, args_cp_url, blobs,
+            dict((path, url) for path, (_, url) in (upstream or {}).items()),
+            self.__resources(func_key)
+        )
+        limiter = self.__limiter
+        if limiter is not None:
+            start = time.time()
+            limiter.acquire()
+            timings["throttle"] = time.time() - start
+        start = time.time()
+        try:
+            id = self.__tes_client.create_task(task_msg)
+        except Exception:
+            if limiter is not None:
+                limiter.release()
+            raise
+        timings["submitted"] = time.time()
+        timings["submit"] = timings["submitted"] - start
+        self.__record(id, output_name, timings["submitted"])
+        future = Future(
             id,
             output_name,
-            FileStore(self.file_store.url),
-            self.__tes_client
-        )
-
-    def _create_task_msg(self, input_cp_url, output_cp_url):
-        runner = pkg_resources.resource_string(
-            __name__, "resources/runner.py"
+            self.file_store,
+            self.__tes_client,
+            cache,
+            timings,
+            self.__timings_hook(func_key)
         )
-        if isinstance(runner, bytes):
-            runner = runner.decode("utf8")
+        if limiter is not None:
+            future.add_done_callback(lambda _: limiter.release())
+        return future
 
-        cmd_install_reqs = "pip install %s" % (" ".join(self.libraries))
+    def _create_task_msg(self, input_cp_url, output_cp_url,
+                         args_cp_url=None, blobs=(), upstream=None,
+                         resources=None):
         cmd_tesseract = "python tesseract.py func.pickle"
+        if args_cp_url is not None:
+            cmd_tesseract += " --args args.pickle"
 
-        if len(self.libraries) == 0:
-            cmd = cmd_tesseract
-        else:
-            cmd = cmd_install_reqs + " && " + cmd_tesseract
-
-        task = tes.Task(
-            name="tesseract remote execution",
-            inputs=self.input_files + [
+        inputs = [
+            tes.Input(
+                name="blob %s" % (d),
+                url=self.file_store.generate_url(self.file_store.blob_name(d)),
+                path="/tmp/tesseract/blobs/%s" % (d),
+                type="FILE"
+            )
+            for d in blobs
+        ]
+        for path, url in sorted((upstream or {}).items()):
+            inputs.append(
                 tes.Input(
-                    name="pickled function",
-                    url=input_cp_url,
-                    path="/tmp/tesseract/func.pickle",
+                    name="upstream result",
+                    url=url,
+                    path=os.path.join("/tmp/tesseract", path),
                     type="FILE"
-                ),
-                tes.Input(
-                    name="tesseract runner script",
-                    path="/tmp/tesseract/tesseract.py",
-                    type="FILE",
-                    content=str(runner)
                 )
-            ],
-            outputs=self.output_files + [
-                tes.Output(
-                    name="pickled result",
-                    url=output_cp_url,
-                    path="/tmp/tesseract/result.pickle",
+            )
+        if args_cp_url is not None:
+            inputs.append(
+                tes.Input(
+                    name="pickled arguments",
+                    url=args_cp_url,
+                    path="/tmp/tesseract/args.pickle",
                     type="FILE"
                 )
-            ],
+            )
+
+        # everything but the inputs and outputs is shared between calls
+        task = copy.copy(self.__task_template(cmd_tesseract, resources))
+        task.inputs = self.input_files + inputs + [
+            tes.Input(
+                name="pickled function",
+                url=input_cp_url,
+                path="/tmp/tesseract/func.pickle",
+                type="FILE"
+            ),
+            self.__runner_input()
+        ]
+        task.outputs = self.output_files + [
+            tes.Output(
+                name="pickled result",
+                url=output_cp_url,
+                path="/tmp/tesseract/result.pickle",
+                type="FILE"
+            ),
+            tes.Output(
+                name="timings",
+                url=timings_name(output_cp_url),
+                path="/tmp/tesseract/timings.json",
+                type="FILE"
+            )
+        ]
+        return task
+
+    def _create_worker_task_msg(self, pool_dir, worker_id, idle_timeout,
+                                env=None):
+        cmd_tesseract = "python tesseract.py --worker %s %s %s" % (
+            self.file_store.url, pool_dir, worker_id
+        )
+        cmd_tesseract += " --idle-timeout %s" % (idle_timeout)
+        extra = []
+        if self.file_store.scheme != "file":
+            extra.append("apache-libcloud")
+        cmd = self.__command(cmd_tesseract, extra)
+
+        return tes.Task(
+            name="tesseract pool worker %s" % (worker_id),
+            inputs=self.input_files + [self.__runner_input()],
+            outputs=self.output_files,
             resources=tes.Resources(
                 cpu_cores=self.cpu_cores,
                 ram_gb=self.ram_gb,
@@ -281,8 +804,107 @@ class Tesseract(object):
                     command=["sh", "-c", cmd],
                     stdout="/tmp/tesseract/stdout",
                     stderr="/tmp/tesseract/stderr",
-                    workdir="/tmp/tesseract"
+                    workdir="/tmp/tesseract",
+                    env=env
                 )
             ]
         )
-        return task
+
+    def __task_template(self, cmd_tesseract, resources=None):
+        # resources is a (cpu_cores, ram_gb, disk_gb) tuple
+        cpu_cores, ram_gb, disk_gb = resources or (
+            self.cpu_cores, self.ram_gb, self.disk_gb
+        )
+        key = (
+            cmd_tesseract, self.docker, tuple(self.libraries),
+            self.install_libraries, self.codec, self.pickle_protocol,
+            cpu_cores, ram_gb, disk_gb
+        )
+        if key not in self.__templates:
+            self.__templates[key] = tes.Task(
+                name="tesseract remote execution",
+                resources=tes.Resources(
+                    cpu_cores=cpu_cores,
+                    ram_gb=ram_gb,
+                    disk_gb=disk_gb
+                ),
+                executors=[
+                    tes.Executor(
+                        image=self.docker,
+                        command=["sh", "-c", self.__command(cmd_tesseract)],
+                        stdout="/tmp/tesseract/stdout",
+                        stderr="/tmp/tesseract/stderr",
+                        workdir="/tmp/tesseract"
+                    )
+                ]
+            )
+        return self.__templates[key]
+
+    def __runner_input(self):
+        return tes.Input(
+            name="tesseract runner script",
+            path="/tmp/tesseract/tesseract.py",
+            type="FILE",
+            content=_runner_source()
+        )
+
+    def __command(self, cmd_tesseract, extra_libraries=()):
+        libraries = list(self.libraries) + list(extra_libraries)
+        if self.codec in CODEC_LIBRARIES and \
+                CODEC_LIBRARIES[self.codec] not in libraries:
+            libraries.append(CODEC_LIBRARIES[self.codec])
+
+        if self.codec != "none":
+            cmd_tesseract += " --codec %s" % (self.codec)
+        if self.pickle_protocol is not None:
+            cmd_tesseract += " --protocol %d" % (self.pickle_protocol)
+
+        # local tasks run with this interpreter and its libraries. Images
+        # with the libraries baked in may still lack what this task needs
+        # on top of them.
+        if not self.install_libraries:
+            libraries = list(extra_libraries)
+        if len(libraries) == 0 or self.__is_local():
+            return cmd_tesseract
+        cmd_install_reqs = "pip install %s" % (" ".join(libraries))
+        return cmd_install_reqs + " && " + cmd_tesseract
+
+
+def _link_upstream(args, kwargs):
+    # replaces futures among the arguments with references to their results
+    # and returns {path: (future, url)} for the inputs to stage
+    upstream = {}
+
+    def link(obj):
+        if not isinstance(obj, (Future, CachedFuture, DeferredFuture)):
+            return obj
+        file_store, output_key = obj._upstream()
+        url = file_store.generate_url(output_key)
+        path = "upstream/%s.pickle" % (digest(url.encode("utf8")))
+        upstream[path] = (obj, url)
+        return Reference(path)
+
+    args = tuple(link(a) for a in args)
+    kwargs = dict((k, link(v)) for k, v in kwargs.items())
+    return args, kwargs, upstream
+
+
+def _unpack_call(call):
+    if not isinstance(call, (tuple, list)) or len(call) not in (2, 3):
+        raise ValueError("calls must be (func, args) or (func, args, kwargs)")
+    func, args = call[0], tuple(call[1])
+    kwargs = dict(call[2]) if len(call) == 3 else {}
+    if not isinstance(func, Callable):
+        raise TypeError("func not an instance of collections.Callable")
+    return func, args, kwargs
+
+
+def _chunks(iterable, chunksize):
+    chunk = []
+    for item in iterable:
+        chunk.append(((item,), {}))
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
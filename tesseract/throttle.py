@@ -0,0 +1,57 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import random
+import threading
+
+from attr import attrs, attrib, Factory
+from attr.validators import instance_of
+
+
+@attrs
+class InFlightLimiter(object):
+    # Caps the number of tasks that have been created and not yet finished.
+    # Clones of a Tesseract share their limiter, so the cap holds across
+    # all of them.
+    max_in_flight = attrib(validator=instance_of(int))
+    __in_flight = attrib(init=False, default=0, cmp=False)
+    __cond = attrib(
+        init=False, default=Factory(threading.Condition), cmp=False
+    )
+
+    @max_in_flight.validator
+    def __validate_max_in_flight(self, attribute, value):
+        if value < 1:
+            raise ValueError(
+                "%s must be a positive integer" % (attribute.name)
+            )
+
+    def acquire(self):
+        # blocks until a running task finishes
+        with self.__cond:
+            while self.__in_flight >= self.max_in_flight:
+                self.__cond.wait()
+            self.__in_flight += 1
+
+    def release(self):
+        with self.__cond:
+            self.__in_flight -= 1
+            self.__cond.notify()
+
+    def in_flight(self):
+        with self.__cond:
+            return self.__in_flight
+
+
+def backoff_delay(attempt, base, cap):
+    # "full jitter": a random delay up to an exponentially growing bound, so
+    # clients that were rejected together do not retry together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_delay(retry_after, attempt, base, cap):
+    # the server's Retry-After, in seconds, takes precedence
+    try:
+        delay = float(retry_after)
+    except (TypeError, ValueError):
+        return backoff_delay(attempt, base, cap)
+    return min(max(delay, 0), cap)
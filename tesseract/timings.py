@@ -0,0 +1,92 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import calendar
+import json
+import re
+
+
+# phases measured by the client, in seconds
+CLIENT_PHASES = [
+    "serialize", "hash", "upload", "throttle", "submit", "download"
+]
+
+
+def timings_name(output_name):
+    # the runner's timestamps are uploaded next to the result
+    return re.sub(r"\.pickle$", ".timings.json", output_name)
+
+
+def load_timings(file_store, name):
+    try:
+        data = b"".join(file_store.download_stream(name))
+    except Exception:
+        # tasks that never ran the function have none
+        return None
+    return json.loads(data.decode("utf8"))
+
+
+def parse_time(value):
+    # seconds since the epoch from an RFC 3339 timestamp as reported by TES
+    # servers, e.g. 2018-05-07T16:33:32.442369585-07:00; py-tes already
+    # converts them to datetimes
+    if not value:
+        return None
+    if hasattr(value, "utctimetuple"):
+        # naive datetimes are taken to be UTC
+        return calendar.timegm(value.utctimetuple()) + \
+            value.microsecond / 1e6
+    m = re.match(
+        r"^(\d{4})-(\d\d)-(\d\d)[Tt ](\d\d):(\d\d):(\d\d)(\.\d+)?"
+        r"(Z|z|[+-]\d\d:?\d\d)?$",
+        value.strip()
+    )
+    if m is None:
+        return None
+    t = calendar.timegm(tuple(int(g) for g in m.groups()[:6]))
+    if m.group(7):
+        t += float(m.group(7))
+    tz = m.group(8)
+    if tz and tz not in ["Z", "z"]:
+        offset = int(tz[1:3]) * 3600 + int(tz[-2:]) * 60
+        t -= offset if tz[0] == "+" else -offset
+    return t
+
+
+def phases(client, task=None, runner=None):
+    # durations in seconds of every phase that is known. Spans between
+    # timestamps taken by the client, the TES server and the task are
+    # subject to clock skew between those machines.
+    out = dict((k, client[k]) for k in CLIENT_PHASES if k in client)
+
+    task_start = task_end = exec_start = exec_end = None
+    if task is not None and task.logs:
+        # the last attempt
+        log = task.logs[-1]
+        task_start = parse_time(log.start_time)
+        task_end = parse_time(log.end_time)
+        if log.logs:
+            exec_start = parse_time(log.logs[0].start_time)
+            exec_end = parse_time(log.logs[-1].end_time)
+
+    runner = runner or {}
+
+    def span(name, start, end):
+        if start is not None and end is not None:
+            out[name] = end - start
+
+    # submitted -> task started
+    span("queue", client.get("submitted"), task_start)
+    # inputs are downloaded and the image pulled
+    span("stage_in", task_start, exec_start)
+    # container start, library install and interpreter start up
+    span("setup", exec_start, runner.get("start"))
+    span("load", runner.get("start"), runner.get("loaded"))
+    span("call", runner.get("loaded"), runner.get("called"))
+    span("dump", runner.get("called"), runner.get("dumped"))
+    # outputs are uploaded
+    span("stage_out", exec_end, task_end)
+    # peak memory and scratch disk in bytes, CPU time in seconds
+    for k in ["max_rss", "cpu_time", "scratch_bytes"]:
+        if runner.get(k) is not None:
+            out[k] = runner[k]
+    return out
@@ -0,0 +1,197 @@
+import cloudpickle
+import os
+import sys
+import tempfile
+import tes
+import threading
+import unittest
+
+from tesseract.filestore import FileStore
+from tesseract.tesseract import Tesseract
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from tesseract.aio import (AsyncHTTPClient, AsyncTaskMonitor,
+                               AsyncFuture, AsyncCachedFuture, run_async)
+
+    class FakeAsyncClient(AsyncHTTPClient):
+        states = {}
+        # tasks that get_task knows but the listing does not reach
+        hidden = set()
+        page_tokens = []
+
+        def get_task(self, task_id, view="BASIC"):
+            f = asyncio.get_event_loop().create_future()
+            if task_id == "gone":
+                f.set_exception(NotFound("404"))
+            else:
+                f.set_result(tes.Task(id=task_id, state=self.states[task_id]))
+            return f
+
+        async def list_tasks(self, view="MINIMAL", page_size=None,
+                             page_token=None):
+            self.page_tokens.append(page_token)
+            ids = sorted(set(self.states) - self.hidden)
+            start = int(page_token or 0)
+            end = start + page_size
+            return tes.models.ListTasksResponse(
+                tasks=[tes.Task(id=i, state=self.states[i])
+                       for i in ids[start:end]],
+                next_page_token=str(end) if end < len(ids) else None
+            )
+
+    class NotFound(Exception):
+        # like aiohttp.ClientResponseError
+        status = 404
+
+
+@unittest.skipIf(sys.version_info < (3, 5), "requires asyncio")
+class TestAsync(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    tmpdir = tempfile.mkdtemp(
+        dir=os.path.join(testdir, "test_tmp"),
+        prefix="tmp"
+    )
+
+    fs_path = os.path.join(tmpdir, "filestore")
+    fs = FileStore(fs_path)
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+
+    def test_filestore_async(self):
+        run = self.loop.run_until_complete
+        u = run(self.fs.upload_async(
+            name="async/testfile.txt", contents="hello",
+            overwrite_existing=True
+        ))
+        self.assertTrue(run(self.fs.exists_async("async/testfile.txt")))
+        dest = os.path.join(self.tmpdir, "async_dest.txt")
+        p = run(self.fs.download_async(
+            "async/testfile.txt", dest, overwrite_existing=True
+        ))
+        self.assertEqual(open(p, "r").read(), open(u, "r").read())
+
+    def test_async_futures(self):
+        self.fs.upload(
+            name="async/result.pickle",
+            contents=cloudpickle.dumps("hello world"),
+            overwrite_existing=True
+        )
+        client = FakeAsyncClient("http://localhost:8000")
+        client.states = {"a": "RUNNING"}
+        monitor = AsyncTaskMonitor(
+            client, min_interval=0.01, max_interval=0.05
+        )
+        f = AsyncFuture("a", "async/result.pickle", self.fs, client, monitor)
+        self.assertFalse(f.done())
+        self.loop.call_later(0.05, client.states.update, {"a": "COMPLETE"})
+        self.assertEqual(self.loop.run_until_complete(f.result()),
+                         "hello world")
+        self.assertTrue(f.done())
+
+        cf = AsyncCachedFuture("async/result.pickle", self.fs)
+        self.assertEqual(self.loop.run_until_complete(cf.result()),
+                         "hello world")
+
+    def test_monitor_lookup_errors(self):
+        client = FakeAsyncClient("http://localhost:8000")
+        client.states = {"a": "RUNNING"}
+        monitor = AsyncTaskMonitor(
+            client, min_interval=0.01, max_interval=0.05
+        )
+        gone = monitor.watch("gone")
+        a = monitor.watch("a")
+        self.loop.call_later(0.05, client.states.update, {"a": "COMPLETE"})
+        run = self.loop.run_until_complete
+        self.assertEqual(run(asyncio.wait_for(a, 5)), "COMPLETE")
+        self.assertEqual(run(asyncio.wait_for(gone, 5)), "SYSTEM_ERROR")
+
+    def test_monitor_max_pages(self):
+        client = FakeAsyncClient("http://localhost:8000")
+        client.states = dict(("t%03d" % i, "COMPLETE") for i in range(20))
+        client.states["deep"] = "RUNNING"
+        client.hidden = set(["deep"])
+        client.page_tokens = []
+        monitor = AsyncTaskMonitor(
+            client, min_interval=0.01, max_interval=0.05,
+            batch_threshold=3, page_size=5, max_pages=2
+        )
+        deep = monitor.watch("deep")
+        states = [monitor.watch(i) for i in sorted(client.states)[1:]]
+        run = self.loop.run_until_complete
+        for s in states:
+            self.assertEqual(run(asyncio.wait_for(s, 5)), "COMPLETE")
+        # two pages, the rest is looked up by id
+        self.assertEqual(client.page_tokens, [None, "5"])
+        self.loop.call_later(0.05, client.states.update, {"deep": "COMPLETE"})
+        self.assertEqual(run(asyncio.wait_for(deep, 5)), "COMPLETE")
+        self.assertEqual(client.page_tokens, [None, "5"])
+
+    def test_run_async_max_in_flight(self):
+        from tesseract import aio
+
+        fs = FileStore(os.path.join(self.tmpdir, "in_flight"))
+        r = Tesseract(fs, "http://127.0.0.1:1", max_in_flight=2)
+        client = FakeAsyncClient(r.tes_url)
+        client.states = {}
+
+        async def create_task(task):
+            task_id = "task%d" % (len(client.states))
+            client.states[task_id] = "RUNNING"
+            return task_id
+
+        client.create_task = create_task
+        aio._clients[self.loop] = {r.tes_url: client}
+        monitor = AsyncTaskMonitor(
+            client, min_interval=0.01, max_interval=0.05
+        )
+        aio._monitors[self.loop] = {r.tes_url: monitor}
+
+        run = self.loop.run_until_complete
+        calls = [
+            self.loop.create_task(run_async(r, abs, -i)) for i in range(3)
+        ]
+        run(asyncio.sleep(0.2))
+        self.assertEqual(sorted(client.states), ["task0", "task1"])
+        # a finished task makes room for the next one
+        client.states["task0"] = "COMPLETE"
+        run(asyncio.wait_for(asyncio.gather(*calls), 5))
+        self.assertEqual(
+            sorted(client.states), ["task0", "task1", "task2"]
+        )
+        client.states.update(task1="COMPLETE", task2="COMPLETE")
+        run(asyncio.wait_for(asyncio.gather(*[
+            c.result()._AsyncFuture__state for c in calls
+        ]), 5))
+        self.assertEqual(monitor.pending(), 0)
+
+    def test_run_async_off_loop(self):
+        fs = FileStore(os.path.join(self.tmpdir, "run_async"))
+        r = Tesseract(fs, "http://127.0.0.1:1")
+        # the run directory exists, so a new run id has to be found
+        fs.upload(name=os.path.join(r._run_id(), "x"), contents="x")
+
+        loop_thread = threading.current_thread()
+        blocking = []
+        exists = fs.exists
+
+        def spy(*args, **kwargs):
+            blocking.append(threading.current_thread() is loop_thread)
+            return exists(*args, **kwargs)
+
+        fs.exists = spy
+        # there is no TES server (or no aiohttp) to create the task
+        with self.assertRaises(Exception):
+            self.loop.run_until_complete(run_async(r, abs, -1))
+        # the store is only asked from the io pool, never on the event loop
+        self.assertTrue(blocking)
+        self.assertNotIn(True, blocking)
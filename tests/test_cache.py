@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tesseract.cache import CallCache
+from tesseract.filestore import FileStore
+from tesseract.future import CachedFuture
+from tesseract.serialization import dumps
+from tesseract.tesseract import Tesseract
+
+
+class TestCallCache(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(
+            dir=os.path.join(self.testdir, "test_tmp"),
+            prefix="tmp"
+        )
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.fs = FileStore("file://" + os.path.join(self.tmpdir, "store"))
+        self.cache_dir = os.path.join(self.tmpdir, "cache")
+
+    def test_lru(self):
+        cache = CallCache(self.fs.url, self.cache_dir, max_bytes=300)
+        for name in ["a", "b", "c"]:
+            self.fs.upload(name=name, contents=dumps(name * 100))
+        self.assertIsNone(cache.get("a"))
+
+        self.assertEqual(cache.load(self.fs, "a"), "a" * 100)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(cache.load(self.fs, "b"), "b" * 100)
+        # a was used more recently than b
+        cache.get("a")
+        self.assertEqual(cache.load(self.fs, "c"), "c" * 100)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 3)
+        self.assertEqual(stats["local_entries"], 2)
+        self.assertLessEqual(stats["local_bytes"], 300)
+
+        # the index outlives the process
+        cache = CallCache(self.fs.url, self.cache_dir, max_bytes=300)
+        self.assertIsNotNone(cache.get("a"))
+        cache.forget(["a"])
+        self.assertIsNone(cache.get("a"))
+
+    def test_cached_calls(self):
+        def square(x):
+            return x * x
+
+        r = Tesseract(self.fs, "local://")
+        r.with_call_caching("squares", cache_dir=self.cache_dir)
+        self.assertEqual(r.run(square, 3).result(timeout=30), 9)
+        self.assertEqual(
+            list(r.map(square, range(4), chunksize=2, timeout=30)),
+            [0, 1, 4, 9]
+        )
+        stats = r.cache_stats()
+        self.assertEqual(stats["misses"], 3)
+        self.assertEqual(stats["local_entries"], 3)
+
+        # a new session finds the results without touching the store
+        def fail(*args, **kwargs):
+            raise AssertionError("unexpected store access")
+
+        fs = FileStore(self.fs.url)
+        for method in ["exists", "upload", "upload_stream", "download_stream"]:
+            setattr(fs, method, fail)
+        r = Tesseract(fs, "local://")
+        r.with_call_caching("squares", cache_dir=self.cache_dir)
+        f = r.run(square, 3)
+        self.assertIsInstance(f, CachedFuture)
+        self.assertEqual(f.result(), 9)
+        self.assertEqual(
+            list(r.map(square, range(4), chunksize=2)), [0, 1, 4, 9]
+        )
+        self.assertEqual(r.cache_stats()["hits"], 3)
+        self.assertEqual(r.cache_stats()["misses"], 0)
+
+        with self.assertRaises(ValueError):
+            Tesseract(self.fs, "local://").cache_stats()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import argparse
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from tesseract.cli import main, parse_duration, parse_size
+
+
+class TestCLI(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    tmpdir = tempfile.mkdtemp(
+        dir=os.path.join(testdir, "test_tmp"),
+        prefix="tmp"
+    )
+
+    def test_parse(self):
+        self.assertEqual(parse_duration("90"), 90)
+        self.assertEqual(parse_duration("30m"), 1800)
+        self.assertEqual(parse_duration("1.5h"), 5400)
+        self.assertEqual(parse_duration("7d"), 7 * 86400)
+        self.assertEqual(parse_size("512"), 512)
+        self.assertEqual(parse_size("10K"), 10 * 1024)
+        self.assertEqual(parse_size("1.5GiB"), int(1.5 * 1024 ** 3))
+        self.assertEqual(parse_size("2tb"), 2 * 1024 ** 4)
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_duration("soon")
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_size("big")
+
+    def test_gc(self):
+        store = os.path.join(self.tmpdir, "store")
+        run = os.path.join(store, "tesseract_%s" % ("a" * 32))
+        os.makedirs(run)
+        old = time.time() - 3 * 86400
+        for name in ["tesseract_func.pickle", "tesseract_result.pickle"]:
+            with io.open(os.path.join(run, name), "wb") as fh:
+                fh.write(b"x")
+            os.utime(os.path.join(run, name), (old, old))
+
+        with self.assertRaises(SystemExit):
+            main(["gc", store])
+
+        main(["gc", store, "--max-age", "1d", "--dry-run"])
+        self.assertTrue(os.path.isdir(run))
+        main(["gc", store, "--max-age", "1d"])
+        self.assertFalse(os.path.exists(run))
+        self.assertTrue(os.path.isdir(store))
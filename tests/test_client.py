@@ -0,0 +1,230 @@
+import json
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from requests.exceptions import HTTPError
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+from tesseract.client import SessionClient
+from tesseract.filestore import FileStore
+from tesseract.tesseract import Tesseract
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+if sys.version_info >= (3, 5):
+    import asyncio
+
+
+class TESHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body):
+        data = json.dumps(body).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def reject(self, status):
+        self.send_response(status)
+        self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        task = json.loads(self.rfile.read(length).decode("utf8"))
+        server = self.server
+        with server.lock:
+            if server.rejects:
+                server.rejected += 1
+                self.reject(server.rejects.pop(0))
+                return
+            server.connections.add(self.client_address)
+            task_id = "task%d" % (len(server.tasks))
+            server.tasks[task_id] = task
+        self.reply({"id": task_id})
+
+    def do_GET(self):
+        task_id = self.path.split("?")[0].split("/")[-1]
+        with self.server.lock:
+            state = self.server.states.get(task_id, "RUNNING")
+        self.reply({"id": task_id, "state": state})
+
+
+class TESServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), TESHandler)
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.connections = set()
+        self.states = {}
+        # status codes to answer the next POSTs with
+        self.rejects = []
+        self.rejected = 0
+
+
+class TestSessionClient(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    def setUp(self):
+        self.server = TESServer()
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = "http://127.0.0.1:%d" % (self.server.server_address[1])
+
+        self.tmpdir = tempfile.mkdtemp(
+            dir=os.path.join(self.testdir, "test_tmp"),
+            prefix="tmp"
+        )
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_keep_alive(self):
+        client = SessionClient(self.url)
+        self.addCleanup(client.close)
+        r = Tesseract(FileStore("file://" + self.tmpdir), self.url)
+        task = r._create_task_msg(
+            "file:///tmp/func.pickle", "file:///tmp/result.pickle"
+        )
+        ids = [client.create_task(task) for _ in range(5)]
+        self.assertEqual(ids, ["task%d" % (i) for i in range(5)])
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(client.get_task("task0").state, "RUNNING")
+
+    def test_submit_many(self):
+        def add(a, b=0):
+            return a + b
+
+        r = Tesseract(FileStore("file://" + self.tmpdir), self.url)
+        calls = [(add, (i,), {"b": 1}) for i in range(20)] + [(abs, [-1])]
+        futures = r.submit_many(calls, max_workers=4)
+        self.assertEqual(len(futures), 21)
+        self.assertEqual(len(self.server.tasks), 21)
+        # one connection per worker and one for the task monitor
+        self.assertLessEqual(len(self.server.connections), 5)
+
+        # futures are returned in the order of the calls
+        outputs = dict(
+            (i, o["url"]) for i, t in self.server.tasks.items()
+            for o in t["outputs"] if o["name"] == "pickled result"
+        )
+        keys = [f._Future__output_key for f in futures]
+        for f, key in zip(futures, keys):
+            self.assertTrue(outputs[f._Future__id].endswith(key))
+        self.assertEqual(len(set(keys)), 21)
+        # futures share the store instead of connecting again
+        for f in futures:
+            self.assertIs(f._Future__file_store, r.file_store)
+
+        with self.assertRaises(ValueError):
+            r.submit_many([(add,)])
+        with self.assertRaises(TypeError):
+            r.submit_many([("add", (1,))])
+
+    def test_retry(self):
+        client = SessionClient(self.url, backoff=0.01)
+        self.addCleanup(client.close)
+        r = Tesseract(FileStore("file://" + self.tmpdir), self.url)
+        task = r._create_task_msg(
+            "file:///tmp/func.pickle", "file:///tmp/result.pickle"
+        )
+        self.server.rejects = [429, 503, 429]
+        self.assertEqual(client.create_task(task), "task0")
+        self.assertEqual(self.server.rejected, 3)
+
+        # the task may have been created, so a POST is not repeated
+        for i, status in enumerate([500, 502, 504]):
+            self.server.rejects = [status]
+            with self.assertRaises(HTTPError):
+                client.create_task(task)
+            self.assertEqual(self.server.rejected, 4 + i)
+
+        client.max_retries = 1
+        self.server.rejects = [429, 429, 429]
+        with self.assertRaises(HTTPError):
+            client.create_task(task)
+        self.assertEqual(self.server.rejected, 8)
+
+    @unittest.skipIf(aiohttp is None, "requires aiohttp")
+    def test_retry_async(self):
+        from tesseract.aio import AsyncHTTPClient
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        client = AsyncHTTPClient(self.url, backoff=0.01)
+        r = Tesseract(FileStore("file://" + self.tmpdir), self.url)
+        task = r._create_task_msg(
+            "file:///tmp/func.pickle", "file:///tmp/result.pickle"
+        )
+        self.server.rejects = [429, 503]
+        self.assertEqual(
+            loop.run_until_complete(client.create_task(task)), "task0"
+        )
+        self.assertEqual(self.server.rejected, 2)
+        # the task may have been created, so a POST is not repeated
+        self.server.rejects = [500]
+        with self.assertRaises(aiohttp.ClientResponseError):
+            loop.run_until_complete(client.create_task(task))
+        self.assertEqual(self.server.rejected, 3)
+        loop.run_until_complete(client.close())
+
+    def test_max_in_flight(self):
+        r = Tesseract(
+            FileStore("file://" + self.tmpdir), self.url, max_in_flight=3
+        )
+        r2 = r.clone()
+        submitted = []
+
+        def submit():
+            for i in range(5):
+                submitted.append(r2.run(abs, -i))
+
+        t = threading.Thread(target=submit)
+        t.daemon = True
+        t.start()
+        time.sleep(0.5)
+        # clones share the limit
+        self.assertEqual(len(self.server.tasks), 3)
+        self.assertEqual(r.in_flight(), 3)
+
+        with self.server.lock:
+            self.server.states["task0"] = "COMPLETE"
+            self.server.states["task1"] = "COMPLETE"
+        t.join(30)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(len(self.server.tasks), 5)
+        self.assertEqual(r.in_flight(), 3)
+        self.assertGreater(submitted[-1].timings()["throttle"], 0)
+
+        r.with_max_in_flight(None)
+        self.assertIsNone(r.in_flight())
+        r.run(abs, -5)
+        self.assertEqual(len(self.server.tasks), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
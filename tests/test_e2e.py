@@ -105,3 +105,17 @@ class TestTesseractE2E(SimpleServerTest):
         cf = r.run(hello, "world")
         self.assertEqual(cf.result(), "hello world")
         self.assertTrue(isinstance(cf, CachedFuture))
+
+    def test_map(self):
+        def square(n):
+            return n * n
+
+        r = self.runner.clone()
+        self.assertEqual(
+            list(r.map(square, range(5), chunksize=2)),
+            [0, 1, 4, 9, 16]
+        )
+        self.assertEqual(
+            sorted(r.map_as_completed(square, range(5), chunksize=2)),
+            [(0, 0), (1, 1), (2, 4), (3, 9), (4, 16)]
+        )
@@ -1,9 +1,78 @@
 import io
 import os
 import tempfile
+import time
 import unittest
 
-from tesseract.filestore import FileStore, FileExistsError
+from libcloud.storage.types import ObjectDoesNotExistError
+
+from tesseract.filestore import FileStore, FileExistsError, TransferManager
+from tesseract.serialization import digest, dumps, encode_call
+
+
+class MockObject(object):
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.extra = {"last_modified": "Mon, 01 Jan 2018 00:00:00 GMT"}
+
+
+class MockDriver(object):
+    # a filesystem-backed stand-in for a libcloud storage driver
+
+    def __init__(self, root):
+        self.root = root
+        self.ranges = 0
+
+    def __path(self, name):
+        return os.path.join(self.root, name)
+
+    def get_container(self, bucket):
+        return bucket
+
+    def get_object(self, bucket, name):
+        p = self.__path(os.path.join(bucket, name))
+        if not os.path.isfile(p):
+            raise ObjectDoesNotExistError(None, self, name)
+        return MockObject(os.path.join(bucket, name), os.path.getsize(p))
+
+    def iterate_container_objects(self, container, ex_prefix=None):
+        root = self.__path(container)
+        for dirpath, dnames, fnames in os.walk(root):
+            for f in fnames:
+                name = os.path.relpath(os.path.join(dirpath, f), root)
+                if ex_prefix is None or name.startswith(ex_prefix):
+                    yield MockObject(name, 0)
+
+    def upload_object_via_stream(self, iterator, container, object_name):
+        p = self.__path(os.path.join(container, object_name))
+        if not os.path.exists(os.path.dirname(p)):
+            os.makedirs(os.path.dirname(p))
+        with io.open(p, "wb") as fh:
+            for chunk in iterator:
+                fh.write(chunk)
+
+    def upload_object(self, file_path, container, object_name):
+        with io.open(file_path, "rb") as fh:
+            self.upload_object_via_stream(fh, container, object_name)
+
+    def delete_object(self, obj):
+        p = self.__path(os.path.join(obj.container, obj.name))
+        if not os.path.isfile(p):
+            raise ObjectDoesNotExistError(None, self, obj.name)
+        os.remove(p)
+        return True
+
+    def download_object_as_stream(self, obj, chunk_size=None):
+        with io.open(self.__path(obj.name), "rb") as fh:
+            yield fh.read()
+
+    def download_object_range_as_stream(self, obj, start_bytes,
+                                        end_bytes=None, chunk_size=None):
+        self.ranges += 1
+        with io.open(self.__path(obj.name), "rb") as fh:
+            fh.seek(start_bytes)
+            yield fh.read(end_bytes - start_bytes)
 
 
 class TestFileStore(unittest.TestCase):
@@ -128,3 +197,214 @@ class TestFileStore(unittest.TestCase):
             self.fs.download(
                 os.path.basename(src.name), dest, overwrite_existing=False
             )
+
+    def test_exists_nested(self):
+        self.fs.upload(
+            name="nested/a/b/file.txt", contents="x", overwrite_existing=True
+        )
+        self.assertTrue(self.fs.exists("nested/a/b/file.txt"))
+        self.assertTrue(self.fs.exists("nested/a", type="d"))
+        self.assertFalse(self.fs.exists("nested/a", type="f"))
+        self.assertFalse(self.fs.exists("b", type="d"))
+
+    def test_exists_index(self):
+        fs = FileStore(os.path.join(self.tmpdir, "indexed"),
+                       exists_cache_ttl=60)
+        self.assertFalse(fs.exists("idx/file.txt"))
+
+        # an out-of-band write is hidden until the entry expires
+        os.makedirs(os.path.join(fs.path, "idx"))
+        with io.open(os.path.join(fs.path, "idx/file.txt"), "w") as fh:
+            fh.write(u"x")
+        self.assertFalse(fs.exists("idx/file.txt"))
+
+        # uploads through the store update the index
+        fs.upload(name="idx/file.txt", contents="y", overwrite_existing=True)
+        self.assertTrue(fs.exists("idx/file.txt"))
+        self.assertTrue(fs.exists("idx", type="d"))
+
+        fs.exists_cache_ttl = 0
+        self.assertTrue(fs.exists("idx/file.txt"))
+
+    def test_upload_binary(self):
+        src = os.path.join(self.tmpdir, "binary.bin")
+        with io.open(src, "wb") as fh:
+            fh.write(b"\x00\xff\xfe")
+        u = self.fs.upload(path=src, overwrite_existing=True)
+        self.assertEqual(os.path.basename(u), "binary.bin")
+        self.assertEqual(io.open(u, "rb").read(), b"\x00\xff\xfe")
+
+    def test_stream(self):
+        fs = FileStore(os.path.join(self.tmpdir, "stream"), chunk_size=4)
+        fs.upload_stream("streamed.txt", io.BytesIO(b"0123456789"))
+        self.assertEqual(
+            list(fs.download_stream("streamed.txt")),
+            [b"0123", b"4567", b"89"]
+        )
+
+        fs.upload_stream(
+            "streamed.txt", ["abc", b"def"], overwrite_existing=True
+        )
+        self.assertEqual(b"".join(fs.download_stream("streamed.txt")),
+                         b"abcdef")
+
+        with self.assertRaises(FileExistsError):
+            fs.upload_stream("streamed.txt", [b"x"])
+
+    def test_put_blob(self):
+        d = self.fs.put_blob(b"blob contents")
+        name = self.fs.blob_name(d)
+        self.assertTrue(self.fs.exists(name))
+        self.assertEqual(self.fs.put_blob(b"blob contents"), d)
+        self.assertEqual(b"".join(self.fs.download_stream(name)),
+                         b"blob contents")
+
+    def test_transfer_many(self):
+        srcs = []
+        for i in range(5):
+            p = os.path.join(self.tmpdir, "many_%d.bin" % (i))
+            with io.open(p, "wb") as fh:
+                fh.write(os.urandom(1000 + i))
+            srcs.append(p)
+
+        urls = self.fs.upload_many(
+            [(p, "many/" + os.path.basename(p)) for p in srcs]
+        )
+        self.assertEqual(len(urls), 5)
+        with self.assertRaises(FileExistsError):
+            self.fs.upload_many([(srcs[0], "many/many_0.bin")])
+        self.fs.upload_many(
+            [(srcs[0], "many/many_0.bin")], skip_existing=True
+        )
+
+        dests = [p + ".out" for p in srcs]
+        with TransferManager(self.fs, max_workers=4, part_size=64) as tm:
+            tm.download_many(
+                [("many/" + os.path.basename(p), d)
+                 for p, d in zip(srcs, dests)]
+            )
+        for p, d in zip(srcs, dests):
+            self.assertEqual(io.open(p, "rb").read(), io.open(d, "rb").read())
+
+    def test_object_store(self):
+        fs = FileStore(os.path.join(self.tmpdir, "mock_local"))
+        fs.scheme = "s3"
+        fs.bucket = "bucket"
+        fs.path = "prefix"
+        fs.driver = MockDriver(os.path.join(self.tmpdir, "mock_s3"))
+
+        u = fs.upload(name="a/file.txt", contents="hello")
+        self.assertEqual(u, "s3://bucket/prefix/a/file.txt")
+        self.assertTrue(fs.exists("a/file.txt"))
+        self.assertTrue(fs.exists("a", type="d"))
+        self.assertFalse(fs.exists("b", type="d"))
+        with self.assertRaises(FileExistsError):
+            fs.upload(name="a/file.txt", contents="hello")
+
+        data = os.urandom(1000)
+        src = os.path.join(self.tmpdir, "mock_src.bin")
+        with io.open(src, "wb") as fh:
+            fh.write(data)
+        fs.upload_many([(src, "b/1.bin"), (src, "b/2.bin")])
+        self.assertEqual(b"".join(fs.download_stream("b/1.bin")), data)
+
+        dest = os.path.join(self.tmpdir, "mock_dest.bin")
+        with TransferManager(fs, max_workers=4, part_size=100) as tm:
+            tm.download("b/2.bin", dest)
+        self.assertEqual(io.open(dest, "rb").read(), data)
+        self.assertEqual(fs.driver.ranges, 10)
+
+        self.assertEqual(
+            fs.list_objects("b"),
+            [("b/1.bin", 0, 1514764800), ("b/2.bin", 0, 1514764800)]
+        )
+        self.assertEqual(fs.delete_many(["b/1.bin", "b/3.bin"]),
+                         [True, False])
+        self.assertEqual(fs.list("b"), ["b/2.bin"])
+
+    def test_delete(self):
+        fs = FileStore(os.path.join(self.tmpdir, "delete"),
+                       exists_cache_ttl=60)
+        for i in range(3):
+            fs.upload(name="run/sub/%d.txt" % (i), contents="x")
+        fs.upload(name="keep.txt", contents="x")
+        self.assertTrue(fs.exists("run/sub/0.txt"))
+
+        self.assertEqual(
+            fs.delete_many(["run/sub/%d.txt" % (i) for i in range(3)]),
+            [True, True, True]
+        )
+        self.assertFalse(fs.delete("run/sub/0.txt"))
+        self.assertFalse(fs.exists("run/sub/0.txt"))
+        # empty directories go with their last file
+        self.assertFalse(fs.exists("run", type="d"))
+        self.assertEqual(fs.list(), ["keep.txt"])
+
+    def test_gc(self):
+        fs = FileStore(os.path.join(self.tmpdir, "gc"))
+        old = time.time() - 7 * 86400
+
+        def put(name, mtime, contents="x"):
+            fs.upload(name=name, contents=contents, overwrite_existing=True)
+            os.utime(os.path.join(fs.path, name), (mtime, mtime))
+
+        run = "tesseract_%s" % ("a" * 32)
+        put(run + "/tesseract_func.pickle", old)
+        put(run + "/tesseract_result.pickle", old)
+        put("tesseract_%s/func.pickle" % ("b" * 32), time.time())
+        put("blobs/sha256/" + "c" * 64, old)
+        put("mine/tesseract_res_%s.pickle" % ("d" * 64), old)
+        put("mine/output.txt", old)
+        put("notes.txt", old)
+
+        summary = fs.gc(max_age=86400, dry_run=True)
+        self.assertEqual(summary["deleted"], [
+            "blobs/sha256/" + "c" * 64,
+            "mine/tesseract_res_%s.pickle" % ("d" * 64),
+            run + "/tesseract_func.pickle",
+            run + "/tesseract_result.pickle",
+        ])
+        self.assertEqual(summary["freed_bytes"], 4)
+        self.assertEqual(summary["remaining_bytes"], 3)
+        self.assertEqual(len(fs.list()), 7)
+
+        fs.gc(max_age=86400)
+        self.assertEqual(fs.list(), [
+            "mine/output.txt",
+            "notes.txt",
+            "tesseract_%s/func.pickle" % ("b" * 32)
+        ])
+        self.assertFalse(fs.exists(run, type="d"))
+
+    def test_gc_blobs_in_use(self):
+        fs = FileStore(os.path.join(self.tmpdir, "gc_blobs"))
+        old = time.time() - 7 * 86400
+
+        def call(run, mtime):
+            # the function is always a blob, shared by both calls
+            manifest, blobs = encode_call(abs, (-1,), {})
+            for d, contents in blobs.items():
+                fs.put_blob(contents, d)
+            cp_str = dumps(manifest)
+            name = "%s/tesseract_func_%s.pickle" % (run, digest(cp_str))
+            fs.upload(name=name, contents=cp_str)
+            os.utime(os.path.join(fs.path, name), (mtime, mtime))
+            return list(blobs)
+
+        first = "tesseract_%s" % ("a" * 32)
+        d = call(first, old)[0]
+        blob = os.path.join(fs.path, fs.blob_name(d))
+        os.utime(blob, (old, old))
+        # a recent call that found the blob in the store
+        second = "tesseract_%s" % ("b" * 32)
+        self.assertEqual(call(second, time.time()), [d])
+
+        fs.gc(max_age=86400)
+        self.assertFalse(fs.exists(first, type="d"))
+        self.assertTrue(fs.exists(fs.blob_name(d), type="file"))
+        fs.gc(max_bytes=0)
+        self.assertTrue(fs.exists(fs.blob_name(d), type="file"))
+
+        # and goes with the last call that used it
+        fs.gc(max_age=0, min_age=0)
+        self.assertEqual(fs.list(), [])
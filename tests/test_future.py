@@ -0,0 +1,102 @@
+import cloudpickle
+import os
+import tempfile
+import unittest
+
+from tesseract.filestore import FileStore
+from tesseract.cache import CallCache
+from tesseract.future import (CachedFuture, RemoteError, ERROR_KEY,
+                              as_completed, load_result)
+
+
+class TestFuture(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    tmpdir = tempfile.mkdtemp(
+        dir=os.path.join(testdir, "test_tmp"),
+        prefix="tmp"
+    )
+
+    fs_path = os.path.join(tmpdir, "filestore")
+    fs = FileStore(fs_path)
+
+    def test_cached_future(self):
+        self.fs.upload(
+            name="cached/result.pickle",
+            contents=cloudpickle.dumps({"a": 1}),
+            overwrite_existing=True
+        )
+        f = CachedFuture("cached/result.pickle", self.fs)
+        self.assertEqual(f.result(), {"a": 1})
+        self.assertTrue(f.done())
+        self.assertFalse(f.cancel())
+
+    def test_as_completed(self):
+        futures = []
+        for i in range(3):
+            name = "as_completed/result_%d.pickle" % (i)
+            self.fs.upload(
+                name=name,
+                contents=cloudpickle.dumps(i),
+                overwrite_existing=True
+            )
+            futures.append(CachedFuture(name, self.fs))
+
+        results = [f.result() for f in as_completed(futures, timeout=10)]
+        self.assertEqual(sorted(results), [0, 1, 2])
+
+    def test_load_result_spooled(self):
+        value = list(range(1000))
+        self.fs.upload(
+            name="spooled/result.pickle",
+            contents=cloudpickle.dumps(value),
+            overwrite_existing=True
+        )
+        spool_dir = tempfile.mkdtemp(dir=self.tmpdir)
+        self.addCleanup(setattr, tempfile, "tempdir", tempfile.tempdir)
+        tempfile.tempdir = spool_dir
+        self.assertEqual(load_result(self.fs, "spooled/result.pickle"), value)
+        self.assertEqual(os.listdir(spool_dir), [])
+
+    def test_remote_error(self):
+        def record(exception):
+            return {ERROR_KEY: {
+                "type": "builtins.ValueError",
+                "message": "boom",
+                "traceback": "Traceback (most recent call last):\n...",
+                "exception": exception
+            }}
+
+        self.fs.upload(
+            name="error/result.pickle",
+            contents=cloudpickle.dumps(
+                record(cloudpickle.dumps(ValueError("boom")))
+            ),
+            overwrite_existing=True
+        )
+        with self.assertRaises(ValueError) as cm:
+            CachedFuture("error/result.pickle", self.fs).result()
+        self.assertIsInstance(cm.exception.__cause__, RemoteError)
+        self.assertIn("Traceback", cm.exception.__cause__.remote_traceback)
+
+        # exceptions that cannot be loaded here are reported as RemoteError
+        self.fs.upload(
+            name="error/result.pickle",
+            contents=cloudpickle.dumps(record(b"not a pickle")),
+            overwrite_existing=True
+        )
+        with self.assertRaises(RemoteError) as cm:
+            CachedFuture("error/result.pickle", self.fs).result()
+        self.assertIn("builtins.ValueError: boom", str(cm.exception))
+
+        # a failed cached call is removed so that it runs again
+        cache = CallCache(self.fs.url, os.path.join(self.tmpdir, "cache"))
+        with self.assertRaises(RemoteError):
+            CachedFuture("error/result.pickle", self.fs, cache).result()
+        self.assertFalse(self.fs.exists("error/result.pickle"))
+        self.assertEqual(cache.stats()["entries"], 0)
@@ -0,0 +1,96 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from tesseract.history import ResourceHistory, function_key, percentile
+
+
+def square(n):
+    return n * n
+
+
+class TestResourceHistory(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(
+            dir=os.path.join(self.testdir, "test_tmp"),
+            prefix="tmp"
+        )
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_function_key(self):
+        key = function_key(square)
+        self.assertIn(".square:", key)
+        self.assertEqual(function_key(square), key)
+
+        def edited():
+            def square(n):
+                return n ** 2
+            return square
+
+        self.assertNotEqual(function_key(edited()), function_key(square))
+        self.assertEqual(function_key(abs), "builtins.abs"
+                         if abs.__module__ == "builtins"
+                         else "__builtin__.abs")
+
+    def test_function_key_stable(self):
+        # the same key in fresh interpreters, for functions with nested
+        # code objects too
+        with open(os.path.join(self.tmpdir, "nested.py"), "w") as fh:
+            fh.write(
+                "def f(xs):\n"
+                "    g = lambda x: x + 1\n"
+                "    return [g(x) for x in xs]\n"
+            )
+        script = (
+            "import sys; sys.path[:0] = [%r, %r]\n"
+            "from tesseract.history import function_key\n"
+            "import nested; print(function_key(nested.f))\n"
+        ) % (self.tmpdir, os.path.dirname(self.testdir))
+        keys = set(
+            subprocess.check_output([sys.executable, "-c", script]).strip()
+            for _ in range(2)
+        )
+        self.assertEqual(len(keys), 1)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([3], 95), 3)
+
+    def test_suggest(self):
+        h = ResourceHistory(self.tmpdir, max_samples=20)
+        self.assertIsNone(h.suggest("f"))
+        for i in range(30):
+            h.record("f", {
+                "call": 10.0,
+                # two busy cores
+                "cpu_time": 19.0 + i % 2,
+                "max_rss": (i + 1) * 100 * 1024 ** 2,
+                "scratch_bytes": 3 * 1024 ** 3
+            })
+        # calls that never ran are not recorded
+        h.record("f", {"serialize": 0.1})
+        self.assertEqual(len(h.samples("f")), 20)
+        self.assertIsNone(h.suggest("g"))
+
+        cpu_cores, ram_gb, disk_gb = h.suggest("f")
+        self.assertEqual(cpu_cores, 2)
+        # the most recent samples are 1.1 to 2.9 GiB; p95 is 2.9 GiB
+        self.assertEqual(ram_gb, 3.75)
+        self.assertEqual(disk_gb, 4)
+
+        h.record("h", {"call": 1.0})
+        h.record("h", {"call": 1.0})
+        h.record("h", {"call": 1.0})
+        self.assertEqual(h.suggest("h"), (None, None, None))
@@ -0,0 +1,62 @@
+import os
+import stat
+import tempfile
+import unittest
+
+from tesseract.images import dockerfile, image_tag, resolve_image
+
+
+class TestImages(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    tmpdir = tempfile.mkdtemp(
+        dir=os.path.join(testdir, "test_tmp"),
+        prefix="tmp"
+    )
+
+    def test_image_tag(self):
+        t = image_tag("python:3.6", ["cloudpickle", "numpy"])
+        self.assertTrue(t.startswith("tesseract-worker:"))
+        self.assertEqual(t, image_tag("python:3.6", ["numpy", "cloudpickle"]))
+        self.assertNotEqual(t, image_tag("python:3.7", ["cloudpickle"]))
+        self.assertTrue(
+            image_tag("python:3.6", [], "gcr.io/proj/").startswith(
+                "gcr.io/proj/tesseract-worker:"
+            )
+        )
+
+    def test_dockerfile(self):
+        self.assertEqual(
+            dockerfile("python:3.6", ["numpy", "cloudpickle"]),
+            "FROM python:3.6\n"
+            "RUN pip install --no-cache-dir cloudpickle numpy\n"
+        )
+
+    def test_resolve_image(self):
+        # a stand-in docker CLI that has no images and logs its calls
+        log = os.path.join(self.tmpdir, "docker.log")
+        docker = os.path.join(self.tmpdir, "docker")
+        with open(docker, "w") as fh:
+            fh.write(
+                "#!/bin/sh\n"
+                "echo \"$@\" >> %s\n"
+                "[ \"$2\" = inspect ] && exit 1\n"
+                "cat > /dev/null\n"
+                "exit 0\n" % (log)
+            )
+        os.chmod(docker, os.stat(docker).st_mode | stat.S_IEXEC)
+
+        tag = resolve_image("python:3.6", ["foo"], docker=docker)
+        self.assertEqual(
+            resolve_image("python:3.6", ["foo"], docker=docker), tag
+        )
+        with open(log) as fh:
+            calls = fh.read().splitlines()
+        self.assertEqual(
+            calls, ["image inspect %s" % (tag), "build -t %s -" % (tag)]
+        )
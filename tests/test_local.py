@@ -0,0 +1,218 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from requests.utils import urlparse
+
+from tesseract.filestore import FileStore
+from tesseract.future import CachedFuture, DeferredFuture
+from tesseract.history import ResourceHistory, function_key
+from tesseract.local import LocalClient
+from tesseract.session import load_session
+from tesseract.tesseract import Tesseract
+
+
+class TestLocal(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(
+            dir=os.path.join(self.testdir, "test_tmp"),
+            prefix="tmp"
+        )
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.fs = FileStore("file://" + os.path.join(self.tmpdir, "store"))
+        self.runner = Tesseract(self.fs, "local://")
+
+    def test_client(self):
+        self.assertIsInstance(self.runner._Tesseract__tes_client, LocalClient)
+        self.assertIs(
+            self.runner._Tesseract__tes_client,
+            Tesseract(self.fs, "local://")._Tesseract__tes_client
+        )
+        task = self.runner._create_task_msg(
+            "file:///tmp/func.pickle", "file:///tmp/result.pickle"
+        )
+        self.assertEqual(
+            task.executors[0].command[-1], "python tesseract.py func.pickle"
+        )
+
+    def test_run(self):
+        def hello(s, punctuation="!"):
+            return "hello %s%s" % (s, punctuation)
+
+        f = self.runner.run(hello, "world", punctuation="?")
+        self.assertEqual(f.result(timeout=30), "hello world?")
+        self.assertTrue(f.done())
+        self.assertEqual(
+            list(self.runner.map(abs, range(-3, 0), chunksize=2)), [3, 2, 1]
+        )
+        # indexes of the items, whichever chunk finishes first
+        self.assertEqual(
+            sorted(self.runner.map_as_completed(
+                abs, range(-5, 0), chunksize=2
+            )),
+            [(0, 5), (1, 4), (2, 3), (3, 2), (4, 1)]
+        )
+
+    def test_timings(self):
+        exported = []
+        r = self.runner.clone()
+        r.with_timings_hook(exported.append)
+        f = r.run(sum, [1, 2, 3])
+        self.assertEqual(f.result(timeout=30), 6)
+        self.assertEqual(len(exported), 1)
+        timings = f.timings()
+        for phase in ["serialize", "hash", "upload", "submit", "load",
+                      "call", "dump", "download", "max_rss", "cpu_time",
+                      "scratch_bytes"]:
+            self.assertIn(phase, timings)
+        self.assertEqual(exported[0], timings)
+
+    def test_auto_resources(self):
+        def busy(n):
+            return sum(range(n))
+
+        r = self.runner.clone()
+        r.cache_dir = os.path.join(self.tmpdir, "cache")
+        r.with_resources(cpu_cores=8, ram_gb=64, disk_gb=100, auto=True)
+        key = function_key(busy)
+        resources = r._Tesseract__resources
+        # the explicit values until there is enough history
+        self.assertEqual(resources(key), (8, 64, 100))
+        for f in [r.run(busy, 1000) for i in range(3)]:
+            f.result(timeout=30)
+
+        history = ResourceHistory(r.cache_dir)
+        self.assertEqual(len(history.samples(key)), 3)
+        cpu_cores, ram_gb, disk_gb = resources(key)
+        self.assertEqual(cpu_cores, 1)
+        self.assertLess(ram_gb, 64)
+        self.assertLess(disk_gb, 100)
+        task = r._create_task_msg(
+            "file:///tmp/func.pickle", "file:///tmp/result.pickle",
+            resources=resources(key)
+        )
+        self.assertEqual(task.resources.ram_gb, ram_gb)
+        # other functions keep the explicit values
+        self.assertEqual(resources(function_key(abs)), (8, 64, 100))
+
+    def test_upstream(self):
+        def slow_add(a, b):
+            time.sleep(1)
+            return a + b
+
+        def fail():
+            raise ValueError("boom")
+
+        start = time.time()
+        f1 = self.runner.run(slow_add, 1, 2)
+        f2 = self.runner.run(slow_add, f1, b=f1)
+        f3 = self.runner.run(abs, f2)
+        # nothing waits for the upstream calls
+        self.assertLess(time.time() - start, 1)
+        self.assertIsInstance(f2, DeferredFuture)
+        self.assertFalse(f3.done())
+        self.assertEqual(f3.result(timeout=30), 6)
+        self.assertTrue(f2.done())
+        self.assertEqual(f2.result(), 6)
+
+        with self.assertRaises(RuntimeError) as cm:
+            self.runner.run(abs, self.runner.run(fail)).result(timeout=30)
+        self.assertIn("ValueError: boom", str(cm.exception))
+
+    def test_attach(self):
+        def slow_abs(n):
+            time.sleep(1)
+            return abs(n)
+
+        r = self.runner.clone()
+        name = r.with_session("restart")
+        self.assertEqual(name, "restart")
+        done = r.run(abs, -1)
+        self.assertEqual(done.result(timeout=30), 1)
+        chunks = list(r.map(abs, [-3, -4], chunksize=1))
+        self.assertEqual(chunks, [3, 4])
+        running = r.run(slow_abs, -2)
+
+        # a new client picks up every task without running any of them
+        # again
+        attached = Tesseract(self.fs, "local://").attach("restart")
+        self.assertEqual(len(attached), 4)
+        self.assertIsInstance(attached[0], CachedFuture)
+        self.assertNotIsInstance(attached[3], CachedFuture)
+        self.assertEqual(
+            [f.result(timeout=30) for f in attached], [1, [3], [4], 2]
+        )
+        self.assertEqual(running.result(), 2)
+        with self.assertRaises(ValueError):
+            r.attach("missing")
+
+    def test_session_killed(self):
+        # a process that dies right after run() returns, without running
+        # any exit handlers, has recorded the call
+        code = "\n".join([
+            "import os, tes",
+            "from tesseract import FileStore, Tesseract",
+            "class Client(tes.HTTPClient):",
+            "    def create_task(self, task):",
+            "        return 'task-1'",
+            "    def get_task(self, task_id, view='BASIC'):",
+            "        return tes.Task(id=task_id, state='RUNNING')",
+            "r = Tesseract(FileStore(%r), 'http://localhost:1')" % (
+                self.fs.path
+            ),
+            "r._Tesseract__tes_client = Client('http://localhost:1')",
+            "r.with_session('killed')",
+            "r.run(abs, -1)",
+            "os._exit(0)",
+        ])
+        subprocess.check_call(
+            [sys.executable, "-c", code], cwd=os.path.dirname(self.testdir)
+        )
+        entries = load_session(self.fs, "killed")
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["task_id"], "task-1")
+
+    def test_failure(self):
+        def fail():
+            raise ValueError("boom")
+
+        f = self.runner.run(fail)
+        with self.assertRaises(ValueError) as cm:
+            f.result(timeout=30)
+        self.assertEqual(str(cm.exception), "boom")
+        self.assertIn("in fail", cm.exception.__cause__.remote_traceback)
+
+        # a result that cannot be pickled fails the same way
+        f = self.runner.run(threading.Lock)
+        with self.assertRaises(TypeError):
+            f.result(timeout=30)
+
+    def test_with_output(self):
+        def write(path):
+            with io.open(path, "w") as fh:
+                fh.write(u"fizzbuzz")
+            return os.path.exists("func.pickle")
+
+        r = self.runner.clone()
+        r.with_output("./output.txt")
+        f = r.run(write, "./output.txt")
+        self.assertTrue(f.result(timeout=30))
+        with io.open(urlparse(r.output_files[0].url).path) as fh:
+            self.assertEqual(fh.read(), "fizzbuzz")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import threading
+import tes
+import time
+import unittest
+
+from requests import Response
+from requests.exceptions import HTTPError, ConnectionError
+
+from tesseract.monitor import TaskMonitor
+
+
+class FakeClient(tes.HTTPClient):
+
+    def __init__(self, *args, **kwargs):
+        super(FakeClient, self).__init__(*args, **kwargs)
+        self.states = {}
+        # tasks that get_task knows but the listing does not reach
+        self.hidden = set()
+        self.calls = {"get_task": 0, "list_tasks": 0}
+        self.page_tokens = []
+
+    def get_task(self, task_id, view="BASIC"):
+        self.calls["get_task"] += 1
+        if task_id == "gone":
+            response = Response()
+            response.status_code = 404
+            raise HTTPError("404 Not Found", response=response)
+        if task_id == "flaky":
+            raise ConnectionError("connection reset")
+        return tes.Task(id=task_id, state=self.states[task_id])
+
+    def list_tasks(self, view="MINIMAL", page_size=None, page_token=None):
+        self.calls["list_tasks"] += 1
+        self.page_tokens.append(page_token)
+        ids = sorted(set(self.states) - self.hidden)
+        start = int(page_token or 0)
+        end = start + page_size
+        return tes.models.ListTasksResponse(
+            tasks=[tes.Task(id=i, state=self.states[i])
+                   for i in ids[start:end]],
+            next_page_token=str(end) if end < len(ids) else None
+        )
+
+
+class TestTaskMonitor(unittest.TestCase):
+
+    def test_watch(self):
+        client = FakeClient("http://localhost:8000")
+        client.states = {"a": "RUNNING", "b": "QUEUED"}
+        m = TaskMonitor(client, min_interval=0.01, max_interval=0.05)
+        a = m.watch("a")
+        b = m.watch("b")
+        self.assertFalse(a.done())
+        client.states["a"] = "COMPLETE"
+        self.assertEqual(a.result(timeout=5), "COMPLETE")
+        self.assertFalse(b.done())
+        client.states["b"] = "EXECUTOR_ERROR"
+        self.assertEqual(b.result(timeout=5), "EXECUTOR_ERROR")
+        self.assertEqual(m.pending(), 0)
+        self.assertEqual(client.calls["list_tasks"], 0)
+
+    def test_batched_polling(self):
+        client = FakeClient("http://localhost:8000")
+        client.states = dict(("t%03d" % i, "RUNNING") for i in range(50))
+        m = TaskMonitor(
+            client, min_interval=0.01, max_interval=0.05,
+            batch_threshold=10, page_size=20
+        )
+        threads = threading.active_count()
+        states = [m.watch(i) for i in sorted(client.states)]
+        self.assertLessEqual(threading.active_count(), threads + 1)
+        # the poller starts with the first watch and may have looked up a
+        # few tasks one by one before the rest were added
+        time.sleep(0.2)
+        client.calls["get_task"] = 0
+        for i in client.states:
+            client.states[i] = "COMPLETE"
+        for s in states:
+            self.assertEqual(s.result(timeout=5), "COMPLETE")
+        self.assertEqual(client.calls["get_task"], 0)
+        self.assertGreater(client.calls["list_tasks"], 0)
+
+    def test_deep_task(self):
+        client = FakeClient("http://localhost:8000")
+        client.states = dict(("t%03d" % i, "RUNNING") for i in range(20))
+        client.states["deep"] = "RUNNING"
+        client.hidden.add("deep")
+        m = TaskMonitor(
+            client, min_interval=0.01, max_interval=0.05,
+            batch_threshold=3, page_size=5, max_pages=2
+        )
+        states = [m.watch(i) for i in sorted(client.states)]
+        time.sleep(0.2)
+        for i in client.states:
+            if i != "deep":
+                client.states[i] = "COMPLETE"
+        for s in states[1:]:
+            self.assertEqual(s.result(timeout=5), "COMPLETE")
+
+        # no poll walks more than max_pages of the listing
+        walks = "".join(
+            "|" if t is None else "." for t in client.page_tokens
+        ).split("|")
+        self.assertLessEqual(max(len(w) for w in walks), 1)
+        # a task the listing never reaches is looked up by itself
+        time.sleep(0.1)
+        client.calls = {"get_task": 0, "list_tasks": 0}
+        time.sleep(0.2)
+        self.assertEqual(client.calls["list_tasks"], 0)
+        self.assertGreater(client.calls["get_task"], 0)
+        self.assertFalse(states[0].done())
+        client.states["deep"] = "COMPLETE"
+        self.assertEqual(states[0].result(timeout=5), "COMPLETE")
+
+    def test_lookup_errors(self):
+        client = FakeClient("http://localhost:8000")
+        client.states = {"a": "RUNNING"}
+        m = TaskMonitor(client, min_interval=0.01, max_interval=0.05)
+        gone = m.watch("gone")
+        flaky = m.watch("flaky")
+        a = m.watch("a")
+        client.states["a"] = "COMPLETE"
+        # other tasks resolve while some cannot be looked up
+        self.assertEqual(a.result(timeout=5), "COMPLETE")
+        # tasks the server does not know finish after a few polls
+        self.assertEqual(gone.result(timeout=5), "SYSTEM_ERROR")
+        # other errors may be transient; the task stays pending
+        self.assertFalse(flaky.done())
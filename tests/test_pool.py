@@ -0,0 +1,197 @@
+import imp
+import os
+import shutil
+import tempfile
+import tes
+import threading
+import time
+import unittest
+import uuid
+
+from tesseract.filestore import FileStore
+from tesseract.pool import WorkerPool
+from tesseract.tesseract import Tesseract
+
+
+class FakeClient(tes.HTTPClient):
+
+    def __init__(self, *args, **kwargs):
+        super(FakeClient, self).__init__(*args, **kwargs)
+        self.tasks = []
+        self.states = {}
+
+    def create_task(self, task):
+        self.tasks.append(task)
+        task_id = "task%d" % (len(self.tasks))
+        self.states[task_id] = "RUNNING"
+        return task_id
+
+    def get_task(self, task_id, view="BASIC"):
+        return tes.Task(id=task_id, state=self.states[task_id])
+
+
+class TestWorkerPool(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    runner = imp.load_source(
+        "tesseract_runner",
+        os.path.join(os.path.dirname(testdir),
+                     "tesseract", "resources", "runner.py")
+    )
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(
+            dir=os.path.join(self.testdir, "test_tmp"),
+            prefix="tmp"
+        )
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        store = os.path.join(self.tmpdir, "store")
+        os.mkdir(store)
+        self.fs = FileStore("file://" + store)
+        # task monitors are shared per url
+        self.client = FakeClient("http://%s" % (uuid.uuid4().hex))
+
+        # the worker stages calls relative to its working directory
+        workdir = os.path.join(self.tmpdir, "work")
+        os.mkdir(workdir)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        self.addCleanup(os.chdir, cwd)
+
+    def make_pool(self, workers=1):
+        r = Tesseract(self.fs, "http://localhost:8000")
+        return WorkerPool(r, self.client, workers, min_interval=0.01,
+                          max_interval=0.05)
+
+    def start_worker(self, pool, worker_id):
+        t = threading.Thread(
+            target=self.runner.worker,
+            args=(self.fs.url, pool.id, worker_id),
+            kwargs={"idle_timeout": 5, "poll_interval": 0.01}
+        )
+        t.daemon = True
+        t.start()
+        return t
+
+    def test_create_worker_task_msg(self):
+        r = Tesseract(self.fs, "http://localhost:8000")
+        msg = r._create_worker_task_msg("pool", 3, 60)
+        cmd = msg.executors[0].command[-1]
+        self.assertIn(
+            "--worker %s pool 3 --idle-timeout 60" % (self.fs.url), cmd
+        )
+        self.assertNotIn("apache-libcloud", cmd)
+        self.assertEqual(msg.inputs[0].path, "/tmp/tesseract/tesseract.py")
+
+    def test_pool(self):
+        def add(a, b=0):
+            return a + b
+
+        def fail():
+            raise ValueError("boom")
+
+        pool = self.make_pool()
+        self.assertEqual(len(self.client.tasks), 1)
+        worker = self.start_worker(pool, 0)
+
+        f = pool.submit(add, 1, b=2)
+        self.assertEqual(f.result(timeout=10), 3)
+        self.assertTrue(f.done())
+        self.assertEqual(list(pool.map(add, range(5), timeout=10)),
+                         list(range(5)))
+        with self.assertRaises(ValueError) as cm:
+            pool.submit(fail).result(timeout=10)
+        self.assertIn("in fail", cm.exception.__cause__.remote_traceback)
+        # the worker survives a result it cannot pickle
+        with self.assertRaises(TypeError):
+            pool.submit(threading.Lock).result(timeout=10)
+        self.assertEqual(pool.submit(add, 2, b=2).result(timeout=10), 4)
+
+        # finished calls are removed from the queue and their results once
+        # they have been collected
+        self.assertEqual(
+            self.fs.list(os.path.join(pool.id, "worker_0", "pending")), []
+        )
+        self.assertEqual(self.fs.list(os.path.join(pool.id, "results")), [])
+        pool.shutdown()
+        worker.join(timeout=10)
+        self.assertFalse(worker.is_alive())
+
+    def test_round_robin(self):
+        pool = self.make_pool(workers=2)
+        self.assertEqual(len(self.client.tasks), 2)
+        futures = [pool.submit(abs, -i) for i in range(4)]
+        for i in range(2):
+            self.assertEqual(
+                len(self.fs.list(
+                    os.path.join(pool.id, "worker_%d" % (i), "pending")
+                )),
+                2
+            )
+        # workers share this process' working directory, so run them in turn
+        for i in range(2):
+            worker = self.start_worker(pool, i)
+            self.assertEqual(
+                [f.result(timeout=10) for f in futures[i::2]],
+                [i, i + 2]
+            )
+        pool.shutdown()
+        worker.join(timeout=10)
+
+    def wait_for_tasks(self, n):
+        deadline = time.time() + 10
+        while len(self.client.tasks) < n and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.client.tasks), n)
+
+    def test_worker_restart(self):
+        pool = self.make_pool()
+        # the worker exited after its idle timeout; a call for it starts it
+        # again
+        self.client.states["task1"] = "COMPLETE"
+        f = pool.submit(abs, -1)
+        self.wait_for_tasks(2)
+        self.assertEqual(pool.task_ids, ["task2"])
+        # so does one queued just before the worker exited
+        f2 = pool.submit(abs, -2)
+        self.client.states["task2"] = "COMPLETE"
+        self.wait_for_tasks(3)
+        self.assertEqual(pool.task_ids, ["task3"])
+        self.start_worker(pool, 0)
+        self.assertEqual(f.result(timeout=10), 1)
+        self.assertEqual(f2.result(timeout=10), 2)
+        pool.shutdown()
+
+    def test_worker_failure(self):
+        pool = self.make_pool()
+        futures = [pool.submit(abs, -i) for i in range(2)]
+        self.client.states["task1"] = "SYSTEM_ERROR"
+        for f in futures:
+            with self.assertRaises(RuntimeError) as cm:
+                f.result(timeout=10)
+            self.assertIn("SYSTEM_ERROR", str(cm.exception))
+        self.assertEqual(
+            self.fs.list(os.path.join(pool.id, "worker_0", "pending")), []
+        )
+
+    def test_shutdown(self):
+        pool = self.make_pool()
+        f = pool.submit(abs, -1)
+        pool.shutdown()
+        with self.assertRaises(RuntimeError):
+            pool.submit(abs, -1)
+        # the worker exits without running the call
+        self.client.states["task1"] = "COMPLETE"
+        with self.assertRaises(RuntimeError) as cm:
+            f.result(timeout=10)
+        self.assertIn("shut down", str(cm.exception))
+        self.assertEqual(len(self.client.tasks), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
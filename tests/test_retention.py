@@ -0,0 +1,109 @@
+import unittest
+
+from tesseract.retention import group, plan
+
+
+def call(cache, digest, mtime, size=10):
+    return [
+        ("%s/tesseract_%s_%s.pickle" % (cache, kind, digest * 64), size, mtime)
+        for kind in ["func", "args", "res"]
+    ]
+
+
+class TestRetention(unittest.TestCase):
+    now = 1000000
+
+    def test_group(self):
+        run = "tesseract_%s" % ("a" * 32)
+        pool = "tesseract_pool_%s" % ("b" * 32)
+        objects = [
+            (run + "/tesseract_func.pickle", 1, 0),
+            (run + "/out/file.txt", 1, 0),
+            (pool + "/results/0000000000_x.pickle", 1, 0),
+            ("blobs/sha256/" + "c" * 64, 1, 0),
+            ("blobs/sha256/" + "c" * 64 + ".1234.tmp", 1, 0),
+            ("top.txt", 1, 0),
+            ("tesseract_notarun/file.txt", 1, 0),
+            ("cache/output.txt", 1, 0),
+        ] + call("cache", "d", 0)
+        units = group(objects)
+        self.assertEqual(sorted(units), sorted([
+            ("run", run),
+            ("run", pool),
+            ("blob", "blobs/sha256/" + "c" * 64),
+            ("call", "cache", "d" * 64),
+        ]))
+        self.assertEqual(len(units[("run", run)]), 2)
+        self.assertEqual(len(units[("call", "cache", "d" * 64)]), 3)
+
+    def test_max_age(self):
+        objects = call("cache", "a", self.now - 100) + \
+            call("cache", "b", self.now - 10)
+        self.assertEqual(
+            plan(objects, self.now, max_age=50, min_age=0),
+            sorted(n for n, _, _ in call("cache", "a", 0))
+        )
+        # a call is as old as its newest file
+        objects[0] = (objects[0][0], 10, self.now)
+        self.assertEqual(plan(objects, self.now, max_age=50, min_age=0), [])
+
+    def test_keep_last(self):
+        objects = []
+        for i, d in enumerate("abc"):
+            objects += call("one", d, self.now - 100 + i)
+        objects += call("two", "d", self.now - 1000)
+        names = plan(objects, self.now, keep_last=1, min_age=0)
+        self.assertEqual(
+            names,
+            sorted(n for d in "ab" for n, _, _ in call("one", d, 0))
+        )
+
+    def test_max_bytes(self):
+        objects = call("cache", "a", self.now - 300) + \
+            call("cache", "b", self.now - 200) + \
+            call("cache", "c", self.now - 100)
+        # 90 bytes in total; the least recently written go first
+        names = plan(objects, self.now, max_bytes=40, min_age=0)
+        self.assertEqual(
+            names,
+            sorted(n for d in "ab" for n, _, _ in call("cache", d, 0))
+        )
+        self.assertEqual(plan(objects, self.now, max_bytes=90, min_age=0), [])
+
+    def test_min_age(self):
+        objects = call("cache", "a", self.now - 300) + \
+            call("cache", "b", self.now - 10)
+        names = plan(objects, self.now, max_age=0, max_bytes=0, keep_last=0,
+                     min_age=60)
+        self.assertEqual(
+            names, sorted(n for n, _, _ in call("cache", "a", 0))
+        )
+        # objects without a modification time are never old enough
+        objects = [(n, s, None) for n, s, _ in objects]
+        self.assertEqual(plan(objects, self.now, max_age=0, min_age=0), [])
+
+    def test_blob_references(self):
+        blob = "blobs/sha256/" + "e" * 64
+        old = call("cache", "a", self.now - 1000)
+        new = call("cache", "b", self.now - 10)
+        objects = old + new + [(blob, 100, self.now - 1000)]
+        references = {
+            old[0][0]: [blob],
+            new[0][0]: [blob],
+        }
+        # a call written recently keeps the old blob it stages
+        names = plan(objects, self.now, max_age=500, max_bytes=0, min_age=60,
+                     references=references)
+        self.assertEqual(names, sorted(n for n, _, _ in old))
+        # and the blob is as recent as that call for the size policy
+        names = plan(objects, self.now, max_bytes=130, min_age=0,
+                     references=references)
+        self.assertEqual(names, sorted(n for n, _, _ in old))
+        # once no call uses it the blob goes with the last of them
+        names = plan(objects, self.now, max_age=0, min_age=0,
+                     references=references)
+        self.assertEqual(names, sorted(n for n, _, _ in objects))
+        del references[new[0][0]]
+        names = plan(objects, self.now, max_age=500, min_age=0,
+                     references=references)
+        self.assertEqual(names, sorted(n for n, _, _ in old + [objects[-1]]))
@@ -0,0 +1,222 @@
+import cloudpickle
+import imp
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from tesseract.serialization import (encode_call, dumps, loads, MAGIC,
+                                     PICKLE5, Reference)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestRunner(unittest.TestCase):
+    testdir = os.path.dirname(
+        os.path.realpath(__file__)
+    )
+
+    if not os.path.exists(os.path.join(testdir, "test_tmp")):
+        os.mkdir(os.path.join(testdir, "test_tmp"))
+
+    runner = imp.load_source(
+        "tesseract_runner",
+        os.path.join(os.path.dirname(testdir),
+                     "tesseract", "resources", "runner.py")
+    )
+
+    def setUp(self):
+        # the runner works relative to its working directory, the way it
+        # is staged in a TES task
+        self.workdir = tempfile.mkdtemp(
+            dir=os.path.join(self.testdir, "test_tmp"),
+            prefix="tmp"
+        )
+        os.mkdir(os.path.join(self.workdir, "blobs"))
+        cwd = os.getcwd()
+        os.chdir(self.workdir)
+        self.addCleanup(os.chdir, cwd)
+
+    def stage(self, manifest, blobs):
+        for d, contents in blobs.items():
+            if not isinstance(contents, list):
+                contents = [contents]
+            with open(os.path.join("blobs", d), "wb") as fh:
+                for chunk in contents:
+                    fh.write(chunk)
+        with open("func.pickle", "wb") as fh:
+            fh.write(cloudpickle.dumps(manifest))
+
+    def result(self):
+        with open("result.pickle", "rb") as fh:
+            return cloudpickle.load(fh)
+
+    def test_run(self):
+        def join(a, b, sep=" "):
+            return sep.join([a, b])
+
+        manifest, blobs = encode_call(
+            join, ("hello", "x" * 100), {"sep": "-"}, threshold=50
+        )
+        self.assertEqual(len(blobs), 2)
+        self.assertIn("blob", manifest["args"][1])
+        self.assertIn("pickled", manifest["args"][0])
+        self.stage(manifest, blobs)
+        self.runner.run("func.pickle")
+        self.assertEqual(self.result(), "hello-" + "x" * 100)
+
+        with open("timings.json") as fh:
+            timings = json.load(fh)
+        self.assertLessEqual(timings["start"], timings["loaded"])
+        self.assertLessEqual(timings["loaded"], timings["called"])
+        self.assertLessEqual(timings["called"], timings["dumped"])
+        self.assertGreater(timings["max_rss"], 0)
+
+    def test_run_chunk(self):
+        manifest, blobs = encode_call(lambda n: n * 2, (), {})
+        self.stage(manifest, blobs)
+        with open("args.pickle", "wb") as fh:
+            fh.write(cloudpickle.dumps({"items": [((1,), {}), ((2,), {})]}))
+        self.runner.run("func.pickle", "args.pickle")
+        self.assertEqual(self.result(), [2, 4])
+
+    def test_run_upstream(self):
+        manifest, blobs = encode_call(
+            lambda a, b: a + b, (Reference("upstream/x.pickle"),),
+            {"b": Reference("upstream/x.pickle")}
+        )
+        self.assertEqual(manifest["args"][0],
+                         {"upstream": "upstream/x.pickle"})
+        self.stage(manifest, blobs)
+        os.mkdir("upstream")
+        with open("upstream/x.pickle", "wb") as fh:
+            fh.write(cloudpickle.dumps(21))
+        self.runner.run("func.pickle")
+        self.assertEqual(self.result(), 42)
+
+    def test_run_error(self):
+        def fail(n):
+            raise KeyError(n)
+
+        manifest, blobs = encode_call(fail, ("missing",), {})
+        self.stage(manifest, blobs)
+        self.runner.run("func.pickle")
+        error = self.result()[self.runner.ERROR_KEY]
+        self.assertEqual(error["type"], "builtins.KeyError"
+                         if sys.version_info[0] >= 3
+                         else "exceptions.KeyError")
+        self.assertIn("in fail", error["traceback"])
+        self.assertEqual(cloudpickle.loads(error["exception"]).args,
+                         ("missing",))
+
+    def test_run_unpicklable(self):
+        manifest, blobs = encode_call(lambda: threading.Lock(), (), {})
+        self.stage(manifest, blobs)
+        self.runner.run("func.pickle")
+        # the failed dump is reported like an error of the function
+        error = self.result()[self.runner.ERROR_KEY]
+        self.assertEqual(error["type"], "builtins.TypeError"
+                         if sys.version_info[0] >= 3
+                         else "exceptions.TypeError")
+        self.assertIn("lock", error["message"])
+        self.assertIsInstance(cloudpickle.loads(error["exception"]),
+                              TypeError)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    @unittest.skipIf(numpy is None, "requires numpy")
+    def test_run_npy(self):
+        a = numpy.arange(1000, dtype="float64").reshape(10, 100)
+        manifest, blobs = encode_call(
+            lambda x, y: (type(x).__name__, float(x.sum() + y.sum())),
+            (a,), {"y": a[:, ::2]}, threshold=100
+        )
+        self.assertEqual(manifest["args"][0]["format"], "npy")
+        self.assertEqual(manifest["kwargs"]["y"]["format"], "npy")
+        self.stage(manifest, blobs)
+        self.runner.run("func.pickle")
+        self.assertEqual(
+            self.result(),
+            ("memmap", float(a.sum() + a[:, ::2].sum()))
+        )
+
+    @unittest.skipIf(not PICKLE5, "requires pickle protocol 5")
+    def test_run_pickle5(self):
+        import pickle
+        # a plain bytearray is pickled in-band
+        a = numpy.arange(1000) if numpy is not None else \
+            pickle.PickleBuffer(bytearray(range(256)) * 4)
+        manifest, blobs = encode_call(
+            lambda d: list(d["data"][:3]), ({"data": a},), {}, threshold=100
+        )
+        self.assertEqual(manifest["args"][0]["format"], "pickle5")
+        self.assertEqual(len(manifest["args"][0]["buffers"]), 1)
+        self.stage(manifest, blobs)
+        self.runner.run("func.pickle")
+        self.assertEqual(self.result(), list(memoryview(a)[:3]))
+
+    @unittest.skipIf(not PICKLE5, "requires pickle protocol 5")
+    def test_run_pickle5_codec(self):
+        import pickle
+        data = pickle.PickleBuffer(bytearray(b"x" * 1000))
+        manifest, blobs = encode_call(
+            lambda d: bytes(d["data"][:3]), ({"data": data},), {},
+            threshold=100, codec="gzip"
+        )
+        ref = manifest["args"][0]
+        self.assertEqual(ref["format"], "pickle5")
+        # the pickle is compressed, the buffer is left to be memory-mapped
+        self.assertTrue(blobs[ref["blob"]].startswith(MAGIC))
+        self.assertEqual(
+            b"".join(bytes(c) for c in blobs[ref["buffers"][0]]),
+            b"x" * 1000
+        )
+        self.stage(manifest, blobs)
+        self.runner.run("func.pickle")
+        self.assertEqual(self.result(), b"xxx")
+
+    def test_protocol(self):
+        # a lower protocol is honoured for remote interpreters that do not
+        # know protocol 5
+        a = bytearray(b"x" * 1000)
+        manifest, blobs = encode_call(
+            lambda d: d, (a,), {"n": 1}, threshold=100, codec="gzip",
+            protocol=2
+        )
+        func, arg = manifest["func"], manifest["args"][0]
+        self.assertNotIn("format", func)
+        self.assertNotIn("format", arg)
+        for ref in [func, arg]:
+            self.assertTrue(blobs[ref["blob"]].startswith(MAGIC))
+            self.assertEqual(
+                self.runner.decompress(blobs[ref["blob"]])[:2], b"\x80\x02"
+            )
+        self.assertEqual(manifest["kwargs"]["n"]["pickled"][:2], b"\x80\x02")
+
+    def test_codecs(self):
+        codecs = ["none", "gzip"]
+        if sys.version_info >= (3, 3):
+            codecs.append("lzma")
+        for codec in codecs:
+            manifest, blobs = encode_call(
+                lambda s: s * 1000, ("abc",), {}, codec=codec, protocol=2
+            )
+            for d, contents in blobs.items():
+                with open(os.path.join("blobs", d), "wb") as fh:
+                    fh.write(contents)
+            with open("func.pickle", "wb") as fh:
+                fh.write(dumps(manifest, codec, protocol=2))
+            self.runner.run("func.pickle", codec=codec, protocol=2)
+            with open("result.pickle", "rb") as fh:
+                cp_str = fh.read()
+            self.assertEqual(loads(cp_str), "abc" * 1000)
+            if codec != "none":
+                self.assertTrue(cp_str.startswith(MAGIC))
+                self.assertLess(len(cp_str), 1000)
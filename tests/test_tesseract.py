@@ -5,7 +5,9 @@ import tes
 import unittest
 
 from tesseract.filestore import FileStore
-from tesseract.tesseract import Tesseract
+from tesseract.future import CachedFuture
+from tesseract.serialization import Reference
+from tesseract.tesseract import Tesseract, _chunks, _link_upstream
 
 
 class TestTesseract(unittest.TestCase):
@@ -47,6 +49,17 @@ class TestTesseract(unittest.TestCase):
         r.cpu_cores = 1
         self.assertNotEqual(r, self.runner)
 
+        # the client and store are shared, the task spec is not
+        r = self.runner.clone()
+        self.assertIs(r.file_store, self.runner.file_store)
+        self.assertIs(
+            r._Tesseract__tes_client, self.runner._Tesseract__tes_client
+        )
+        r.with_input("file:///tmp/input", "/mnt/input")
+        r.libraries.append("numpy")
+        self.assertEqual(self.runner.input_files, [])
+        self.assertEqual(self.runner.libraries, ["cloudpickle"])
+
     def test_with_resources(self):
         r = self.runner.clone()
         r.with_resources(cpu_cores=2, ram_gb=4)
@@ -115,3 +128,116 @@ class TestTesseract(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             self.runner.with_output("../output")
+
+    def test_create_task_msg_with_args(self):
+        r = self.runner.clone()
+        task = r._create_task_msg(
+            "file:///tmp/func.pickle",
+            "file:///tmp/result.pickle",
+            "file:///tmp/args.pickle"
+        )
+        self.assertIn(
+            tes.Input(
+                name="pickled arguments",
+                url="file:///tmp/args.pickle",
+                path="/tmp/tesseract/args.pickle",
+                type="FILE"
+            ),
+            task.inputs
+        )
+        self.assertTrue(
+            task.executors[0].command[-1].endswith(
+                "python tesseract.py func.pickle --args args.pickle"
+            )
+        )
+
+    def test_link_upstream(self):
+        f = CachedFuture("run/tesseract_res_abc.pickle", self.fs)
+        args, kwargs, upstream = _link_upstream((1, f), {"b": f})
+        self.assertEqual(args[0], 1)
+        self.assertIsInstance(args[1], Reference)
+        self.assertEqual(args[1].path, kwargs["b"].path)
+        self.assertEqual(
+            upstream,
+            {args[1].path: (f, self.fs.generate_url(f._upstream()[1]))}
+        )
+
+        r = self.runner.clone()
+        task = r._create_task_msg(
+            "file:///tmp/func.pickle", "file:///tmp/result.pickle",
+            upstream={"upstream/a.pickle": "file:///tmp/a/result.pickle"}
+        )
+        self.assertIn(
+            tes.Input(
+                name="upstream result",
+                url="file:///tmp/a/result.pickle",
+                path="/tmp/tesseract/upstream/a.pickle",
+                type="FILE"
+            ),
+            task.inputs
+        )
+
+    def test_task_template(self):
+        r = self.runner.clone()
+        a = r._create_task_msg(
+            "file:///tmp/a/func.pickle", "file:///tmp/a/result.pickle"
+        )
+        b = r._create_task_msg(
+            "file:///tmp/b/func.pickle", "file:///tmp/b/result.pickle"
+        )
+        self.assertIs(a.executors, b.executors)
+        self.assertIs(a.inputs[-1].content, b.inputs[-1].content)
+        self.assertEqual(a.inputs[0].url, "file:///tmp/a/func.pickle")
+        self.assertEqual(b.inputs[0].url, "file:///tmp/b/func.pickle")
+        self.assertEqual(b.outputs[0].url, "file:///tmp/b/result.pickle")
+
+        r.with_resources(cpu_cores=2, docker="python:3.6")
+        c = r._create_task_msg(
+            "file:///tmp/c/func.pickle", "file:///tmp/c/result.pickle"
+        )
+        self.assertEqual(c.resources.cpu_cores, 2)
+        self.assertEqual(c.executors[0].image, "python:3.6")
+        self.assertIsNone(a.resources.cpu_cores)
+
+    def test_chunks(self):
+        chunks = list(_chunks(range(5), 2))
+        self.assertEqual(
+            chunks,
+            [
+                [((0,), {}), ((1,), {})],
+                [((2,), {}), ((3,), {})],
+                [((4,), {})]
+            ]
+        )
+
+    def test_with_serialization(self):
+        r = self.runner.clone()
+        r.with_serialization(codec="zstd", protocol=4)
+        task = r._create_task_msg(
+            "file:///tmp/func.pickle", "file:///tmp/result.pickle"
+        )
+        cmd = task.executors[0].command[-1]
+        self.assertIn("zstandard", cmd)
+        self.assertTrue(
+            cmd.endswith("func.pickle --codec zstd --protocol 4")
+        )
+        with self.assertRaises(ValueError):
+            r.with_serialization(codec="fake")
+
+    def test_install_libraries(self):
+        r = self.runner.clone()
+        r.install_libraries = False
+        task = r._create_task_msg(
+            "file:///tmp/func.pickle", "file:///tmp/result.pickle"
+        )
+        self.assertEqual(
+            task.executors[0].command[-1], "python tesseract.py func.pickle"
+        )
+        # what a task needs on top of the image is still installed, e.g.
+        # libcloud for pool workers on object stores
+        cmd = r._Tesseract__command("python tesseract.py", ["apache-libcloud"])
+        self.assertEqual(
+            cmd, "pip install apache-libcloud && python tesseract.py"
+        )
+        r.with_resources(libraries=["cloudpickle", "numpy"])
+        self.assertTrue(r.install_libraries)
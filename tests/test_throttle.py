@@ -0,0 +1,43 @@
+import threading
+import unittest
+
+from tesseract.throttle import InFlightLimiter, backoff_delay
+
+
+class TestThrottle(unittest.TestCase):
+
+    def test_limiter(self):
+        with self.assertRaises(ValueError):
+            InFlightLimiter(0)
+
+        limiter = InFlightLimiter(2)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(limiter.in_flight(), 2)
+
+        acquired = threading.Event()
+
+        def acquire():
+            limiter.acquire()
+            acquired.set()
+
+        t = threading.Thread(target=acquire)
+        t.daemon = True
+        t.start()
+        self.assertFalse(acquired.wait(0.2))
+        limiter.release()
+        self.assertTrue(acquired.wait(5))
+        self.assertEqual(limiter.in_flight(), 2)
+
+    def test_backoff_delay(self):
+        for attempt in range(10):
+            delay = backoff_delay(attempt, 0.5, 4)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(4, 0.5 * 2 ** attempt))
+        # jittered
+        self.assertGreater(len(set(backoff_delay(3, 1, 10)
+                                   for _ in range(10))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
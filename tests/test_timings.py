@@ -0,0 +1,55 @@
+import unittest
+
+import tes
+
+from tesseract.timings import parse_time, phases, timings_name
+
+
+class TestTimings(unittest.TestCase):
+
+    def test_timings_name(self):
+        self.assertEqual(
+            timings_name("s3://b/run/tesseract_res_abc.pickle"),
+            "s3://b/run/tesseract_res_abc.timings.json"
+        )
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time("2018-01-01T00:00:00Z"), 1514764800)
+        self.assertAlmostEqual(
+            parse_time("2018-01-01T00:00:01.250000000Z"), 1514764801.25
+        )
+        self.assertEqual(parse_time("2018-01-01T01:00:00+01:00"), 1514764800)
+        self.assertEqual(parse_time("2017-12-31T16:00:00-08:00"), 1514764800)
+        self.assertAlmostEqual(
+            parse_time(tes.TaskLog(
+                start_time="2017-12-31T16:00:00.5-08:00"
+            ).start_time),
+            1514764800.5
+        )
+        self.assertIsNone(parse_time(None))
+        self.assertIsNone(parse_time("yesterday"))
+
+    def test_phases(self):
+        client = {"serialize": 0.1, "hash": 0.01, "upload": 0.2,
+                  "submit": 0.05, "submitted": 1514764795.0,
+                  "download": 0.3}
+        task = tes.Task(logs=[tes.TaskLog(
+            start_time="2018-01-01T00:00:00Z",
+            end_time="2018-01-01T00:01:00Z",
+            logs=[tes.ExecutorLog(
+                start_time="2018-01-01T00:00:10Z",
+                end_time="2018-01-01T00:00:50Z"
+            )]
+        )])
+        runner = {"start": 1514764830.0, "loaded": 1514764831.0,
+                  "called": 1514764841.0, "dumped": 1514764842.0,
+                  "max_rss": 1024}
+        self.assertEqual(phases(client, task, runner), {
+            "serialize": 0.1, "hash": 0.01, "upload": 0.2, "submit": 0.05,
+            "download": 0.3, "queue": 5.0, "stage_in": 10.0, "setup": 20.0,
+            "load": 1.0, "call": 10.0, "dump": 1.0, "stage_out": 10.0,
+            "max_rss": 1024
+        })
+        # missing timestamps leave their phases out
+        self.assertEqual(phases({"serialize": 0.1}, tes.Task()),
+                         {"serialize": 0.1})